@@ -0,0 +1,120 @@
+"""
+Part views and WhatsApp inquiries, for the popularity ranking
+
+The part page reports both with a beacon (views.part_activity), also
+when the page itself came from the page cache. Counts are buffered in
+memory and added to the day's PartActivity rows at most every
+ACTIVITY_FLUSH_INTERVAL seconds, so a busy page costs a dict update per
+hit rather than a write. The flush runs on the related-parts worker
+thread (related.run_in_background) with one CASE update per chunk of
+parts. The beacon is anonymous, so the buffer holds at most
+ACTIVITY_MAX_PENDING parts; counts for further parts are dropped until
+the next flush, and ids that are not parts are dropped by the flush.
+
+refresh_popularity() turns the last POPULARITY_DAYS of activity into
+Part.popularity (manage.py refresh_related_parts).
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from . import related
+from .models import Part, PartActivity
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('views', 'inquiries')
+# An inquiry says much more about interest than a page view
+INQUIRY_WEIGHT = 5
+POPULARITY_DAYS = 30
+# Distinct (part, kind) counts one process buffers between flushes
+ACTIVITY_MAX_PENDING = 10000
+
+_lock = threading.Lock()
+_pending = Counter()
+_flushed_at = time.monotonic()
+
+
+def _flush_interval():
+    return getattr(settings, 'ACTIVITY_FLUSH_INTERVAL', 30)
+
+
+def record_activity(part_id, kind):
+    """Count one view / inquiry of a part; written out in batches"""
+    global _flushed_at
+    with _lock:
+        key = (part_id, kind)
+        if key in _pending or len(_pending) < ACTIVITY_MAX_PENDING:
+            _pending[key] += 1
+        due = time.monotonic() - _flushed_at >= _flush_interval()
+        if due:
+            _flushed_at = time.monotonic()
+    if due:
+        related.run_in_background(flush_activity)
+
+
+def flush_activity():
+    """Add the buffered counts to today's PartActivity rows"""
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    if not pending:
+        return
+
+    by_part = {}
+    for (part_id, kind), count in pending.items():
+        by_part.setdefault(part_id, dict.fromkeys(KINDS, 0))[kind] += count
+
+    today = timezone.localdate()
+    try:
+        with transaction.atomic():
+            for chunk in related._chunks(by_part):
+                # Beacon ids are unchecked; only real parts get a row
+                existing = list(Part.objects.filter(pk__in=chunk).order_by().values_list('pk', flat=True))
+                if not existing:
+                    continue
+                PartActivity.objects.bulk_create(
+                    [PartActivity(part_id=part_id, day=today) for part_id in existing],
+                    ignore_conflicts=True,
+                )
+                PartActivity.objects.filter(part_id__in=existing, day=today).update(**{
+                    kind: F(kind) + Case(
+                        *[When(part_id=part_id, then=Value(by_part[part_id][kind]))
+                          for part_id in existing if by_part[part_id][kind]],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    )
+                    for kind in KINDS
+                })
+    except Exception:
+        # Popularity is best effort; the counts are lost, nothing else
+        logger.exception("Could not write part activity")
+
+
+def refresh_popularity(days=POPULARITY_DAYS):
+    """
+    Recompute Part.popularity from the last ``days`` of activity.
+    Returns the ids of the parts whose popularity changed.
+    """
+    since = timezone.localdate() - timedelta(days=days)
+    totals = {
+        part_id: (views or 0) + INQUIRY_WEIGHT * (inquiries or 0)
+        for part_id, views, inquiries in PartActivity.objects.filter(day__gt=since)
+        .values('part_id')
+        .annotate(total_views=Sum('views'), total_inquiries=Sum('inquiries'))
+        .values_list('part_id', 'total_views', 'total_inquiries')
+    }
+    changed = []
+    for part_id, popularity in Part.objects.values_list('pk', 'popularity').iterator(chunk_size=2000):
+        new = float(totals.get(part_id, 0))
+        if new != popularity:
+            changed.append(Part(pk=part_id, popularity=new))
+    Part.objects.bulk_update(changed, ['popularity'], batch_size=500)
+    return [part.pk for part in changed]
@@ -1,480 +1,323 @@
-from django.contrib import admin
+import csv
+import json
+
+from django import forms
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
 from django.utils.html import format_html
-from django.urls import path
+from django.urls import path, reverse
 from django.shortcuts import get_object_or_404
 from django.http import JsonResponse
-from django.utils.safestring import mark_safe
+from django.views.decorators.http import require_GET, require_POST
+from .db_router import pin_to_primary
+from .inventory import (
+    StockAdjustmentError, increment_vehicle_stock, set_stock_levels, stock_snapshot, stock_status,
+    vehicle_stock_snapshot,
+)
+from .inventory_import import InventoryImportError, import_inventory
 from .models import VehicleModel, Part, PartStock
+from .pagination import paginate_queryset
 
 
-# ----------------------------- 
-# Simple Part Inline with Stock
-# ----------------------------- 
-class PartWithStockInline(admin.TabularInline):
-    model = Part
-    extra = 0
-    fields = ('name', 'category', 'condition', 'stock_display', 'stock_buttons')
-    readonly_fields = ('stock_display', 'stock_buttons')
-    can_delete = True
-    
-    def stock_display(self, obj):
-        """Show current stock quantity with color coding"""
-        if not obj.pk:
-            return "-"
-        
-        try:
-            stock = obj.stock
-            quantity = stock.quantity
-            
-            if quantity == 0:
-                color = '#dc3545'  # Red
-                status = 'OUT OF STOCK'
-            elif stock.is_low_stock:
-                color = '#ffc107'  # Yellow
-                status = f'LOW STOCK'
-            else:
-                color = '#28a745'  # Green
-                status = 'IN STOCK'
-            
-            return format_html(
-                '<div class="stock-display" id="stock-display-{}">'
-                '<strong style="color: {}; font-size: 18px;" class="stock-quantity">{}</strong><br>'
-                '<span style="color: #666; font-size: 12px;" class="stock-status">{}</span>'
-                '</div>',
-                stock.pk, color, quantity, status
-            )
-        except PartStock.DoesNotExist:
-            return format_html('<span style="color: #dc3545;">No Stock Record</span>')
-    
-    stock_display.short_description = "Current Stock"
-    
-    def stock_buttons(self, obj):
-        """Add/Remove stock buttons with inline JavaScript"""
-        if not obj.pk:
-            return "-"
-        
-        try:
-            stock = obj.stock
-            disabled = 'disabled' if stock.quantity == 0 else ''
-            
-            # Include JavaScript only once
-            script = ''
-            if not hasattr(self, '_script_added'):
-                self._script_added = True
-                script = '''
-                <script>
-                function adjustStock(stockId, action) {
-                    const button = event.target;
-                    const loader = document.getElementById('loader-' + stockId);
-                    const decreaseBtn = document.getElementById('decrease-' + stockId);
-                    
-                    loader.style.display = 'inline';
-                    button.disabled = true;
-                    if (decreaseBtn) decreaseBtn.disabled = true;
-                    
-                    fetch('/admin/myapp/vehiclemodel/stock/' + action + '/' + stockId + '/', {
-                        method: 'GET',
-                        headers: {'X-Requested-With': 'XMLHttpRequest'}
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.success) {
-                            const display = document.getElementById('stock-display-' + stockId);
-                            const quantityEl = display.querySelector('.stock-quantity');
-                            const statusEl = display.querySelector('.stock-status');
-                            
-                            quantityEl.textContent = data.quantity;
-                            quantityEl.style.color = data.color;
-                            statusEl.textContent = data.status;
-                            
-                            quantityEl.style.transition = 'background-color 0.3s';
-                            quantityEl.style.backgroundColor = '#90EE90';
-                            setTimeout(() => {
-                                quantityEl.style.backgroundColor = 'transparent';
-                            }, 500);
-                            
-                            if (decreaseBtn) {
-                                decreaseBtn.disabled = data.quantity === 0;
-                            }
-                            
-                            showMessage('✓ Stock: ' + data.quantity, 'success');
-                        } else {
-                            showMessage('✗ ' + data.message, 'error');
-                        }
-                    })
-                    .catch(error => {
-                        showMessage('✗ Error', 'error');
-                        console.error('Error:', error);
-                    })
-                    .finally(() => {
-                        loader.style.display = 'none';
-                        button.disabled = false;
-                        if (decreaseBtn && data && data.quantity > 0) {
-                            decreaseBtn.disabled = false;
-                        }
-                    });
-                }
-                
-                function increaseAllStock() {
-                    const vehicleId = document.querySelector('[name="_continue"]').value.match(/\\d+/)?.[0];
-                    if (!vehicleId) {
-                        const pathParts = window.location.pathname.split('/');
-                        const id = pathParts[pathParts.length - 3];
-                        if (id && !isNaN(id)) {
-                            processIncreaseAll(id);
-                        }
-                    } else {
-                        processIncreaseAll(vehicleId);
-                    }
-                }
-                
-                function processIncreaseAll(vehicleId) {
-                    const button = document.getElementById('bulk-add-btn');
-                    const loader = document.getElementById('bulk-loader');
-                    
-                    button.disabled = true;
-                    loader.style.display = 'inline';
-                    
-                    fetch('/admin/myapp/vehiclemodel/stock/increase-all/' + vehicleId + '/', {
-                        method: 'GET',
-                        headers: {'X-Requested-With': 'XMLHttpRequest'}
-                    })
-                    .then(response => response.json())
-                    .then(data => {
-                        if (data.success) {
-                            // Update all stock displays
-                            data.updates.forEach(update => {
-                                const display = document.getElementById('stock-display-' + update.stock_id);
-                                if (display) {
-                                    const quantityEl = display.querySelector('.stock-quantity');
-                                    const statusEl = display.querySelector('.stock-status');
-                                    
-                                    quantityEl.textContent = update.quantity;
-                                    quantityEl.style.color = update.color;
-                                    statusEl.textContent = update.status;
-                                    
-                                    quantityEl.style.transition = 'background-color 0.3s';
-                                    quantityEl.style.backgroundColor = '#90EE90';
-                                    setTimeout(() => {
-                                        quantityEl.style.backgroundColor = 'transparent';
-                                    }, 500);
-                                    
-                                    // Enable decrease buttons
-                                    const decreaseBtn = document.getElementById('decrease-' + update.stock_id);
-                                    if (decreaseBtn) {
-                                        decreaseBtn.disabled = false;
-                                    }
-                                }
-                            });
-                            
-                            showMessage('✓ All ' + data.updates.length + ' parts increased', 'success');
-                        } else {
-                            showMessage('✗ ' + data.message, 'error');
-                        }
-                    })
-                    .catch(error => {
-                        showMessage('✗ Error updating stock', 'error');
-                        console.error('Error:', error);
-                    })
-                    .finally(() => {
-                        loader.style.display = 'none';
-                        button.disabled = false;
-                    });
-                }
-                
-                function showMessage(text, type) {
-                    const existing = document.getElementById('stock-message');
-                    if (existing) existing.remove();
-                    
-                    const color = type === 'success' ? '#28a745' : '#dc3545';
-                    const msg = document.createElement('div');
-                    msg.id = 'stock-message';
-                    msg.textContent = text;
-                    msg.style.cssText = `
-                        position: fixed; top: 80px; right: 20px;
-                        background: ${color}; color: white;
-                        padding: 12px 20px; border-radius: 4px;
-                        font-weight: bold; z-index: 9999;
-                        box-shadow: 0 2px 8px rgba(0,0,0,0.2);
-                        animation: slideIn 0.3s ease-out;
-                    `;
-                    
-                    const style = document.createElement('style');
-                    style.textContent = `
-                        @keyframes slideIn {
-                            from { transform: translateX(400px); opacity: 0; }
-                            to { transform: translateX(0); opacity: 1; }
-                        }
-                    `;
-                    if (!document.getElementById('stock-style')) {
-                        style.id = 'stock-style';
-                        document.head.appendChild(style);
-                    }
-                    
-                    document.body.appendChild(msg);
-                    setTimeout(() => msg.remove(), 2000);
-                }
-                
-                // Add bulk button when page loads
-                document.addEventListener('DOMContentLoaded', function() {
-                    const partsInline = document.querySelector('.inline-group');
-                    if (partsInline && !document.getElementById('bulk-stock-container')) {
-                        const bulkContainer = document.createElement('div');
-                        bulkContainer.id = 'bulk-stock-container';
-                        bulkContainer.innerHTML = `
-                            <style>
-                                #bulk-stock-container {
-                                    background: linear-gradient(135deg, #ff9800 0%, #ff6f00 100%);
-                                    padding: 20px;
-                                    border-radius: 8px;
-                                    margin: 20px 0;
-                                    box-shadow: 0 4px 15px rgba(255, 152, 0, 0.3);
-                                    text-align: center;
-                                }
-                                #bulk-add-btn {
-                                    background: white;
-                                    color: #ff6f00;
-                                    padding: 12px 30px;
-                                    border: none;
-                                    border-radius: 6px;
-                                    font-weight: bold;
-                                    font-size: 16px;
-                                    cursor: pointer;
-                                    transition: all 0.3s ease;
-                                    box-shadow: 0 2px 8px rgba(0, 0, 0, 0.2);
-                                }
-                                #bulk-add-btn:hover {
-                                    transform: translateY(-2px);
-                                    box-shadow: 0 4px 12px rgba(0, 0, 0, 0.3);
-                                }
-                                #bulk-add-btn:active {
-                                    transform: translateY(0);
-                                }
-                                #bulk-add-btn:disabled {
-                                    opacity: 0.6;
-                                    cursor: not-allowed;
-                                }
-                                .bulk-description {
-                                    color: white;
-                                    margin-top: 10px;
-                                    font-size: 13px;
-                                    opacity: 0.9;
-                                }
-                            </style>
-                            <button type="button" id="bulk-add-btn" onclick="increaseAllStock()">
-                                📦 Add +1 to ALL Parts Stock
-                            </button>
-                            <span id="bulk-loader" style="display:none; margin-left: 10px; font-size: 20px;">⏳</span>
-                            <div class="bulk-description">
-                                Increase stock quantity by 1 for all parts at once
-                            </div>
-                        `;
-                        partsInline.parentNode.insertBefore(bulkContainer, partsInline);
-                    }
-                });
-                </script>
-                '''
-            
-            return mark_safe(f'''
-                {script}
-                <style>
-                    .stock-btn-add {{
-                        background: #28a745;
-                        color: white;
-                        padding: 8px 16px;
-                        border: none;
-                        cursor: pointer;
-                        border-radius: 4px;
-                        font-weight: bold;
-                        margin-right: 5px;
-                        transition: all 0.2s ease;
-                    }}
-                    .stock-btn-add:hover {{
-                        background: #218838;
-                        transform: translateY(-2px);
-                        box-shadow: 0 4px 8px rgba(40, 167, 69, 0.3);
-                    }}
-                    .stock-btn-add:active {{
-                        transform: translateY(0);
-                    }}
-                    .stock-btn-remove {{
-                        background: #dc3545;
-                        color: white;
-                        padding: 8px 16px;
-                        border: none;
-                        cursor: pointer;
-                        border-radius: 4px;
-                        font-weight: bold;
-                        transition: all 0.2s ease;
-                    }}
-                    .stock-btn-remove:hover:not(:disabled) {{
-                        background: #c82333;
-                        transform: translateY(-2px);
-                        box-shadow: 0 4px 8px rgba(220, 53, 69, 0.3);
-                    }}
-                    .stock-btn-remove:active:not(:disabled) {{
-                        transform: translateY(0);
-                    }}
-                    .stock-btn-remove:disabled {{
-                        background: #6c757d;
-                        cursor: not-allowed;
-                        opacity: 0.5;
-                    }}
-                </style>
-                <div style="white-space: nowrap;">
-                    <button type="button" 
-                        class="stock-btn-add"
-                        onclick="adjustStock({stock.pk}, 'increase')">
-                        + Add
-                    </button>
-                    <button type="button" 
-                        class="stock-btn-remove"
-                        id="decrease-{stock.pk}"
-                        onclick="adjustStock({stock.pk}, 'decrease')"
-                        {disabled}>
-                        − Remove
-                    </button>
-                    <span id="loader-{stock.pk}" style="display:none; margin-left: 10px;">⏳</span>
-                </div>
-            ''')
-        except PartStock.DoesNotExist:
-            return format_html('<span style="color: #999;">Create part first</span>')
-    
-    stock_buttons.short_description = "Adjust Stock"
+# Upper bound for one "add to all parts" click
+MAX_BULK_DELTA = 100
+
+# Stock grid on the vehicle change page (rows fetched on demand)
+STOCK_GRID_PAGE_SIZE = 25
+# Matches myapp_part_keyset_idx
+STOCK_GRID_ORDERING = ('category', 'name', 'id')
+
+# Diff lines / errors listed on the import page
+IMPORT_REPORT_LINES = 200
+
+
+class PinPrimaryMixin:
+    """After an admin save or delete, read the catalog from the primary for a while"""
+
+    def response_add(self, request, obj, *args, **kwargs):
+        return pin_to_primary(super().response_add(request, obj, *args, **kwargs))
+
+    def response_change(self, request, obj):
+        return pin_to_primary(super().response_change(request, obj))
+
+    def response_delete(self, request, obj_display, obj_id):
+        return pin_to_primary(super().response_delete(request, obj_display, obj_id))
 
 
 # ----------------------------- 
 # Vehicle Admin (MAIN VIEW)
 # ----------------------------- 
 @admin.register(VehicleModel)
-class VehicleModelAdmin(admin.ModelAdmin):
+class VehicleModelAdmin(PinPrimaryMixin, admin.ModelAdmin):
     list_display = ('name', 'vehicle_type', 'manufacturer', 'total_parts_count')
     list_filter = ('vehicle_type', 'manufacturer')
     search_fields = ('name', 'manufacturer')
-    inlines = [PartWithStockInline]
+    # Parts are edited in a paginated stock grid loaded over JSON instead
+    # of an inline formset holding every part (see stock_grid.html)
+    change_form_template = 'admin/myapp/vehiclemodel/change_form.html'
     
     def total_parts_count(self, obj):
-        """Show how many parts this vehicle has"""
-        count = obj.parts.count()
+        """Show how many parts this vehicle has (denormalized column)"""
         return format_html(
             '<strong style="color: #0066cc;">{} parts</strong>',
-            count
+            obj.total_parts_count
         )
     
     total_parts_count.short_description = "Parts"
+    total_parts_count.admin_order_field = 'total_parts_count'
     
-    # Stock adjustment URLs (AJAX endpoints)
+    def change_view(self, request, object_id, form_url='', extra_context=None):
+        extra_context = {**(extra_context or {}), 'max_bulk_delta': MAX_BULK_DELTA}
+        return super().change_view(request, object_id, form_url, extra_context)
+    
+    # Stock grid / adjustment URLs (AJAX endpoints)
     def get_urls(self):
         urls = super().get_urls()
+        info = self.opts.app_label, self.opts.model_name
         custom = [
-            path('stock/increase/<int:stock_id>/', self.admin_site.admin_view(self.increase_stock)),
-            path('stock/decrease/<int:stock_id>/', self.admin_site.admin_view(self.decrease_stock)),
-            path('stock/increase-all/<int:vehicle_id>/', self.admin_site.admin_view(self.increase_all_stock)),
+            path('<int:vehicle_id>/stock-grid/',
+                 self.admin_site.admin_view(require_GET(self.stock_grid)),
+                 name='%s_%s_stock_grid' % info),
+            path('<int:vehicle_id>/stock-grid/save/',
+                 self.admin_site.admin_view(require_POST(self.save_stock_grid)),
+                 name='%s_%s_stock_grid_save' % info),
+            path('stock/increase-all/<int:vehicle_id>/',
+                 self.admin_site.admin_view(require_POST(self.increase_all_stock)),
+                 name='%s_%s_increase_all_stock' % info),
         ]
         return custom + urls
     
-    def increase_stock(self, request, stock_id):
-        """Add 1 to stock - returns JSON"""
-        stock = get_object_or_404(PartStock, pk=stock_id)
-        stock.quantity += 1
-        stock.save()
-        
-        # Determine status
-        if stock.quantity == 0:
-            status = 'OUT OF STOCK'
-            color = '#dc3545'
-        elif stock.is_low_stock:
-            status = 'LOW STOCK'
-            color = '#ffc107'
-        else:
-            status = 'IN STOCK'
-            color = '#28a745'
-        
-        return JsonResponse({
-            'success': True,
+    def _stock_grid_row(self, part):
+        row = {
+            'part_id': part.pk,
+            'name': part.name,
+            'category': part.category,
+            'condition': part.condition,
+            'url': reverse('admin:myapp_part_change', args=[part.pk]),
+            'stock_id': None,
+        }
+        try:
+            stock = part.stock
+        except PartStock.DoesNotExist:
+            return row
+        status, color = stock_status(stock.quantity, stock.low_stock_threshold)
+        row.update({
+            'stock_id': stock.pk,
             'quantity': stock.quantity,
+            'low_stock_threshold': stock.low_stock_threshold,
             'status': status,
-            'color': color
+            'color': color,
         })
+        return row
     
-    def decrease_stock(self, request, stock_id):
-        """Remove 1 from stock - returns JSON"""
-        stock = get_object_or_404(PartStock, pk=stock_id)
+    def stock_grid(self, request, vehicle_id):
+        """
+        One page of the vehicle's parts with their stock - returns JSON.
+        ?category= filters, ?cursor= continues after the previous page.
+        The first page also lists the vehicle's categories for the filter.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        vehicle = get_object_or_404(VehicleModel.objects.only('id'), pk=vehicle_id)
         
-        if stock.quantity > 0:
-            stock.quantity -= 1
-            stock.save()
-            
-            # Determine status
-            if stock.quantity == 0:
-                status = 'OUT OF STOCK'
-                color = '#dc3545'
-            elif stock.is_low_stock:
-                status = 'LOW STOCK'
-                color = '#ffc107'
-            else:
-                status = 'IN STOCK'
-                color = '#28a745'
-            
+        parts = Part.objects.filter(vehicle_model_id=vehicle.pk).select_related('stock')
+        category = request.GET.get('category', '')
+        if category:
+            parts = parts.filter(category=category)
+        cursor = request.GET.get('cursor')
+        rows, next_cursor = paginate_queryset(
+            parts, STOCK_GRID_ORDERING, cursor, page_size=STOCK_GRID_PAGE_SIZE
+        )
+        
+        data = {
+            'rows': [self._stock_grid_row(part) for part in rows],
+            'next_cursor': next_cursor,
+        }
+        if not cursor:
+            data['categories'] = list(
+                Part.objects.filter(vehicle_model_id=vehicle.pk)
+                .order_by('category').values_list('category', flat=True).distinct()
+            )
+        return JsonResponse(data)
+    
+    def save_stock_grid(self, request, vehicle_id):
+        """
+        Save the grid rows that changed - returns JSON.
+        Body: {"rows": [{"stock_id": 1, "quantity": 5,
+                         "low_stock_threshold": 2, "expected": 4}, ...]}
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        vehicle = get_object_or_404(VehicleModel.objects.only('id'), pk=vehicle_id)
+        
+        try:
+            payload = json.loads(request.body or b'{}')
+            changes = {}
+            for row in payload['rows']:
+                change = {
+                    'quantity': int(row['quantity']),
+                    'low_stock_threshold': int(row['low_stock_threshold']),
+                    'expected': None if row.get('expected') is None else int(row['expected']),
+                }
+                if change['quantity'] < 0 or change['low_stock_threshold'] < 0:
+                    raise ValueError
+                changes[int(row['stock_id'])] = change
+        except (ValueError, TypeError, KeyError):
             return JsonResponse({
-                'success': True,
-                'quantity': stock.quantity,
-                'status': status,
-                'color': color
-            })
-        else:
+                'success': False,
+                'error': 'Expected {"rows": [{"stock_id": int, "quantity": int >= 0, '
+                         '"low_stock_threshold": int >= 0, "expected": int}, ...]}'
+            }, status=400)
+        
+        try:
+            updates = set_stock_levels(vehicle.pk, changes)
+        except StockAdjustmentError as e:
+            # Send back current values so the grid can resync
             return JsonResponse({
                 'success': False,
-                'message': 'Stock is already 0'
-            })
+                'error': str(e),
+                'stock_ids': e.stock_ids,
+                'updates': stock_snapshot(list(changes)),
+            }, status=409)
+        
+        return pin_to_primary(JsonResponse({
+            'success': True,
+            'updates': updates,
+        }))
     
     def increase_all_stock(self, request, vehicle_id):
-        """Increase stock for all parts of this vehicle by 1"""
+        """
+        Increase stock for all parts of this vehicle (optionally one
+        category) by ``delta``: one UPDATE, then one SELECT for the result
+        """
+        if not self.has_change_permission(request):
+            raise PermissionDenied
         vehicle = get_object_or_404(VehicleModel, pk=vehicle_id)
-        parts = vehicle.parts.all()
         
-        updates = []
-        for part in parts:
-            try:
-                stock = part.stock
-                stock.quantity += 1
-                stock.save()
-                
-                # Determine status
-                if stock.quantity == 0:
-                    status = 'OUT OF STOCK'
-                    color = '#dc3545'
-                elif stock.is_low_stock:
-                    status = 'LOW STOCK'
-                    color = '#ffc107'
-                else:
-                    status = 'IN STOCK'
-                    color = '#28a745'
-                
-                updates.append({
-                    'stock_id': stock.pk,
-                    'quantity': stock.quantity,
-                    'status': status,
-                    'color': color
-                })
-            except PartStock.DoesNotExist:
-                continue
+        try:
+            delta = int(request.POST.get('delta', 1))
+        except ValueError:
+            delta = 0
+        if not 1 <= delta <= MAX_BULK_DELTA:
+            return JsonResponse({
+                'success': False,
+                'message': f'Delta must be between 1 and {MAX_BULK_DELTA}'
+            }, status=400)
+        category = request.POST.get('category', '').strip()
+        
+        increment_vehicle_stock(vehicle.pk, delta=delta, category=category or None)
+        updates = vehicle_stock_snapshot(vehicle.pk, category=category or None)
         
-        return JsonResponse({
+        return pin_to_primary(JsonResponse({
             'success': True,
             'message': f'Updated {len(updates)} parts',
             'updates': updates
-        })
+        }))
 
 
 # ----------------------------- 
 # Optional: Simple Part Admin
 # ----------------------------- 
+class VehicleModelAutocompleteFilter(admin.SimpleListFilter):
+    """
+    Vehicle filter backed by the admin autocomplete view, so the
+    changelist does not load every vehicle just to render the sidebar.
+    Only the currently selected vehicle is fetched (for its label).
+    """
+    title = 'vehicle model'
+    parameter_name = 'vehicle_model__id__exact'
+    template = 'admin/myapp/autocomplete_filter.html'
+    
+    def __init__(self, request, params, model, model_admin):
+        super().__init__(request, params, model, model_admin)
+        self.autocomplete_url = reverse('admin:autocomplete')
+    
+    def lookups(self, request, model_admin):
+        value = self.value()
+        if not value or not value.isdigit():
+            return []
+        return [(vehicle.pk, str(vehicle)) for vehicle in VehicleModel.objects.filter(pk=value)]
+    
+    def has_output(self):
+        return True
+    
+    def queryset(self, request, queryset):
+        value = self.value()
+        if value and value.isdigit():
+            return queryset.filter(vehicle_model_id=value)
+        return queryset
+
+
+class InventoryImportForm(forms.Form):
+    file = forms.FileField(label='CSV file')
+    dry_run = forms.BooleanField(
+        required=False, initial=True,
+        help_text='Only show what would change; upload again without this to apply.'
+    )
+    skip_invalid = forms.BooleanField(
+        required=False,
+        help_text='Apply the valid rows even if some rows are invalid.'
+    )
+
+
 @admin.register(Part)
-class PartAdmin(admin.ModelAdmin):
+class PartAdmin(PinPrimaryMixin, admin.ModelAdmin):
     list_display = ('name', 'vehicle_model', 'category', 'condition', 'quick_stock_info')
-    list_filter = ('vehicle_model', 'category', 'condition')
+    list_filter = (VehicleModelAutocompleteFilter, 'category', 'condition')
+    list_select_related = ('vehicle_model', 'stock')
     search_fields = ('name', 'vehicle_model__name')
+    # Adds the import / export buttons
+    change_list_template = 'admin/myapp/part/change_list.html'
+    
+    def get_urls(self):
+        info = self.opts.app_label, self.opts.model_name
+        custom = [
+            path('import-inventory/',
+                 self.admin_site.admin_view(self.import_inventory),
+                 name='%s_%s_import_inventory' % info),
+        ]
+        return custom + super().get_urls()
+    
+    def import_inventory(self, request):
+        """Upload a stock CSV (see myapp/inventory_import.py): dry-run diff or apply"""
+        if not self.has_change_permission(request):
+            raise PermissionDenied
+        report = None
+        if request.method == 'POST':
+            form = InventoryImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                lines = (line.decode('utf-8-sig') for line in form.cleaned_data['file'])
+                try:
+                    report = import_inventory(
+                        lines,
+                        dry_run=form.cleaned_data['dry_run'],
+                        skip_invalid=form.cleaned_data['skip_invalid'],
+                    )
+                except (InventoryImportError, UnicodeDecodeError, csv.Error) as e:
+                    form.add_error('file', str(e))
+                else:
+                    if report.applied:
+                        messages.success(request, f'Inventory imported: {report.summary()}')
+                    elif report.errors and not form.cleaned_data['dry_run']:
+                        messages.error(request, 'Nothing was imported: fix the invalid rows or skip them')
+        else:
+            form = InventoryImportForm()
+        
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': 'Import inventory',
+            'form': form,
+            'report': report,
+            'diff': list(report.diff_lines(IMPORT_REPORT_LINES)) if report else [],
+            'errors': report.errors[:IMPORT_REPORT_LINES] if report else [],
+            'conflicts': list(report.conflict_lines(IMPORT_REPORT_LINES)) if report else [],
+        }
+        response = TemplateResponse(request, 'admin/myapp/part/import_inventory.html', context)
+        if report and report.applied:
+            pin_to_primary(response)
+        return response
     
     def quick_stock_info(self, obj):
         """Quick stock overview"""
@@ -488,4 +331,16 @@ class PartAdmin(admin.ModelAdmin):
         except PartStock.DoesNotExist:
             return '-'
     
-    quick_stock_info.short_description = "Stock"
\ No newline at end of file
+    quick_stock_info.short_description = "Stock"
+    
+    class Media:
+        # select2 for VehicleModelAutocompleteFilter
+        css = {
+            'all': ('admin/css/vendor/select2/select2.min.css', 'admin/css/autocomplete.css'),
+        }
+        js = (
+            'admin/js/vendor/jquery/jquery.min.js',
+            'admin/js/vendor/select2/select2.full.min.js',
+            'admin/js/jquery.init.js',
+            'admin/js/autocomplete.js',
+        )
\ No newline at end of file
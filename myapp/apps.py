@@ -7,5 +7,4 @@ class MyappConfig(AppConfig):
     verbose_name = 'Auto Parts Inventory'
     
     def ready(self):
-        import myapp.signals
-        print("✅ Signals loaded successfully!")
\ No newline at end of file
+        import myapp.signals  # noqa: F401 (registers the receivers)
\ No newline at end of file
@@ -0,0 +1,260 @@
+"""
+Async versions of the public catalog views, for ASGI deployments
+
+Same URLs, templates, page cache and conditional GET handling as
+myapp/views.py; urls.py serves these instead when ASYNC_CATALOG_VIEWS
+is on. While a request waits on the database the event loop serves
+others, so a crawler burst no longer pins one worker thread per
+request.
+
+Sequential lookups use the async ORM API. Queries that do not depend
+on each other (parts page / category facets, search results / count)
+are started together with ``gather_queries``, each on a pool thread
+with its own connection, so their database time overlaps instead of
+adding up.
+"""
+import asyncio
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Sum
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, render
+from django.views.decorators.http import condition
+
+from .db_router import replica_reads
+from .facets import category_facets, category_total, vehicle_facets, vehicle_filter_counts
+from .models import Part, VehicleModel
+from .page_cache import cache_catalog_page
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor, paginate_queryset, wants_fragment
+from .search import MIN_QUERY_LENGTH, SEARCH_CURSOR, count_matches, load_parts, search_part_ids
+from . import related
+from .views import (
+    PART_ORDERING, _fragment_response, _next_page_url, _vehicle_catalog_state,
+    catalog_etag, catalog_last_modified,
+)
+
+logger = logging.getLogger('myapp.views')
+
+
+def _with_own_connection(func):
+    def run():
+        # Pool threads never see request_started / request_finished
+        close_old_connections()
+        try:
+            return func()
+        finally:
+            close_old_connections()
+    return run
+
+
+async def gather_queries(*funcs):
+    """
+    Run independent sync ORM callables concurrently and return their
+    results in order. Each runs on its own pool thread (and connection),
+    so this must not be used for reads that have to see the request's
+    uncommitted writes. With CATALOG_ASYNC_PARALLEL_QUERIES off they run
+    one after another on the request's thread.
+    """
+    if not getattr(settings, 'CATALOG_ASYNC_PARALLEL_QUERIES', False):
+        return [await sync_to_async(func)() for func in funcs]
+    return await asyncio.gather(*(
+        sync_to_async(_with_own_connection(func), thread_sensitive=False)()
+        for func in funcs
+    ))
+
+
+def with_catalog_state(view_func):
+    """
+    Load the vehicle's last-modified / ETag state before condition()
+    asks for it: condition() calls those functions synchronously, and
+    _vehicle_catalog_state memoizes the result on the request.
+    """
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        await sync_to_async(_vehicle_catalog_state)(request, kwargs['vehicle_slug'])
+        return await view_func(request, *args, **kwargs)
+    return wrapper
+
+
+def _active_stocked_parts(vehicle):
+    return Part.objects.filter(vehicle_model=vehicle, is_active=True, stock__quantity__gt=0)
+
+
+@replica_reads
+@cache_catalog_page
+async def home(request):
+    """Home page with quick stats"""
+    stats = await VehicleModel.objects.filter(is_active=True).aaggregate(
+        total_vehicles=Count('id'),
+        total_parts_in_stock=Sum('available_parts_count'),
+    )
+    context = {
+        'total_vehicles': stats['total_vehicles'],
+        'total_parts_in_stock': stats['total_parts_in_stock'] or 0,
+    }
+    return render(request, 'myapp/home.html', context)
+
+
+@replica_reads
+@cache_catalog_page
+async def vehicle_list(request):
+    """Display all active vehicle models with available parts count"""
+    vehicle_type = request.GET.get('type', '')
+    manufacturer = request.GET.get('manufacturer', '')
+
+    vehicles = VehicleModel.objects.filter(is_active=True)
+    if vehicle_type:
+        vehicles = vehicles.filter(vehicle_type=vehicle_type)
+    if manufacturer:
+        vehicles = vehicles.filter(manufacturer__icontains=manufacturer)
+
+    vehicles, facets = await gather_queries(lambda: list(vehicles), vehicle_facets)
+    counts = vehicle_filter_counts(facets, vehicle_type, manufacturer)
+    context = {
+        'vehicles': vehicles,
+        'vehicle_count': counts['total'],
+        'type_counts': counts['types'],
+        'manufacturers': counts['manufacturers'],
+        'selected_type': vehicle_type,
+        'selected_manufacturer': manufacturer,
+    }
+    return render(request, 'myapp/vehicles.html', context)
+
+
+@replica_reads
+@with_catalog_state
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+@cache_catalog_page
+async def parts_list(request, vehicle_slug):
+    """Display all available parts for a specific vehicle model"""
+    vehicle = await aget_object_or_404(VehicleModel, slug=vehicle_slug, is_active=True)
+
+    category = request.GET.get('category', '')
+    cursor = request.GET.get('cursor')
+
+    parts = _active_stocked_parts(vehicle).select_related('stock', 'vehicle_model')
+    if category:
+        parts = parts.filter(category__icontains=category)
+
+    def load_page():
+        return paginate_queryset(parts, PART_ORDERING, cursor)
+
+    if wants_fragment(request):
+        page, next_cursor = await sync_to_async(load_page)()
+        return _fragment_response(request, 'myapp/_part_cards.html', {
+            'vehicle': vehicle,
+            'parts': page,
+        }, next_cursor)
+
+    (page, next_cursor), categories = await gather_queries(
+        load_page,
+        lambda: category_facets(vehicle.pk),
+    )
+
+    context = {
+        'vehicle': vehicle,
+        'parts': page,
+        'total_count': category_total(categories, category),
+        'all_count': category_total(categories),
+        'categories': categories,
+        'selected_category': category,
+        'next_url': _next_page_url(request, next_cursor),
+    }
+    return render(request, 'myapp/parts.html', context)
+
+
+@replica_reads
+@with_catalog_state
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+@cache_catalog_page
+async def part_detail(request, vehicle_slug, part_slug):
+    """Display detailed information about a specific part"""
+    vehicle, part = await gather_queries(
+        VehicleModel.objects.filter(slug=vehicle_slug, is_active=True).first,
+        Part.objects.select_related('stock', 'vehicle_model').filter(
+            vehicle_model__slug=vehicle_slug,
+            vehicle_model__is_active=True,
+            slug=part_slug,
+            is_active=True,
+        ).first,
+    )
+    if vehicle is None or part is None:
+        raise Http404('No Part matches the given query.')
+
+    stock_available = part.is_in_stock()
+    stock_quantity = part.get_stock_quantity()
+
+    logger.debug(
+        "part_detail stock", extra={'part_id': part.pk, 'available': stock_available, 'quantity': stock_quantity}
+    )
+
+    if not stock_available:
+        context = {
+            'part': part,
+            'vehicle': vehicle,
+            'stock_quantity': 0,
+        }
+        return render(request, 'myapp/part_not_available.html', context)
+
+    related_parts = await sync_to_async(related.related_parts)(part)
+
+    context = {
+        'vehicle': vehicle,
+        'part': part,
+        'related_parts': related_parts,
+        'stock_quantity': stock_quantity,
+    }
+    return render(request, 'myapp/part_detail.html', context)
+
+
+@replica_reads
+async def search(request):
+    """Search for parts across all vehicles"""
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+    results = []
+    result_count = 0
+    next_cursor = None
+
+    if query and len(query) >= MIN_QUERY_LENGTH:
+        # The full-text lookups are raw SQL, which has no async API
+        after = decode_cursor(cursor, SEARCH_CURSOR)
+        if after:
+            hits = await sync_to_async(search_part_ids)(
+                query, PAGE_SIZE + 1, after=after[:2], corrected=bool(after[2])
+            )
+        else:
+            hits = await sync_to_async(search_part_ids)(query, PAGE_SIZE + 1)
+
+        rows = hits.rows[:PAGE_SIZE]
+        if len(hits.rows) > PAGE_SIZE:
+            last_id, last_score = rows[-1]
+            next_cursor = encode_cursor([last_score, last_id, hits.corrected])
+        ids = [part_id for part_id, _ in rows]
+
+        if wants_fragment(request):
+            results = await sync_to_async(load_parts)(ids)
+            return _fragment_response(request, 'myapp/_search_result_cards.html', {
+                'results': results,
+            }, next_cursor)
+
+        if after or next_cursor:
+            results, result_count = await gather_queries(
+                lambda: load_parts(ids),
+                lambda: count_matches(query, hits.corrected),
+            )
+        else:
+            results = await sync_to_async(load_parts)(ids)
+            result_count = len(results)
+
+    context = {
+        'query': query,
+        'results': results,
+        'result_count': result_count,
+        'next_url': _next_page_url(request, next_cursor),
+    }
+    return render(request, 'myapp/search.html', context)
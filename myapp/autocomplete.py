@@ -0,0 +1,208 @@
+"""
+Search-as-you-type suggestions served from an in-process prefix trie
+
+The trie holds active vehicle models plus the standard part names and
+categories (CAR_PARTS / BIKE_PARTS). It is built on the first request,
+kept current from this process's VehicleModel signals and rebuilt every
+TRIE_TTL seconds to pick up vehicles saved by other workers, so
+keystrokes almost never reach the database.
+"""
+import bisect
+import threading
+import time
+
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from .models import VehicleModel
+from .search import MIN_QUERY_LENGTH
+
+# Lower sorts first in the suggestion list
+KIND_PRIORITY = {'vehicle': 0, 'part': 1, 'category': 2}
+# Longest suggestion list a lookup can return
+MAX_SUGGESTIONS = 8
+# Node key for the subtree's best entries (characters are never empty)
+_TOP = ''
+# Other worker processes save vehicles too, so the trie is rebuilt periodically
+TRIE_TTL = 300
+
+
+class PrefixTrie:
+    """
+    Maps lowercase prefixes to suggestion entries.
+    Every word start of a label is indexed, so "city" finds "Honda City".
+
+    Each node keeps its subtree's best MAX_SUGGESTIONS entries, already
+    in suggestion order, so a lookup is a walk down the prefix and a
+    slice: it does not depend on how many entries the prefix matches.
+    """
+
+    def __init__(self):
+        self._root = {}
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def _keys(label):
+        words = label.lower().split()
+        return {' '.join(words[i:]) for i in range(len(words))}
+
+    @staticmethod
+    def _rank(entry_id, entry):
+        return (KIND_PRIORITY[entry['kind']], entry['label'], entry_id)
+
+    def add(self, entry_id, entry):
+        """Insert or replace an entry (dict with label/kind/url)"""
+        with self._lock:
+            self._remove(entry_id)
+            self._entries[entry_id] = entry
+            rank = self._rank(entry_id, entry)
+            for key in self._keys(entry['label']):
+                node = self._root
+                for char in key:
+                    node = node.setdefault(char, {})
+                    top = node.setdefault(_TOP, [])
+                    if rank not in top:
+                        bisect.insort(top, rank)
+                        del top[MAX_SUGGESTIONS:]
+                node.setdefault(None, set()).add(entry_id)
+
+    def remove(self, entry_id):
+        with self._lock:
+            self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        rank = self._rank(entry_id, entry)
+        paths = []
+        for key in self._keys(entry['label']):
+            node = self._root
+            path = []
+            for char in key:
+                path.append((node, char))
+                node = node[char]
+            node[None].discard(entry_id)
+            if not node[None]:
+                del node[None]
+            paths.append(path)
+        # Bottom-up, so each node is rebuilt from children that no longer
+        # hold the entry; a node shared by two keys is simply redone
+        for path in paths:
+            for parent, char in reversed(path):
+                node = parent.get(char)
+                if node is None:
+                    # Pruned while handling a longer key of the same label
+                    continue
+                if rank in node.get(_TOP, ()):
+                    self._refresh_top(node)
+                # Prune branches that no longer lead anywhere
+                if not node:
+                    del parent[char]
+
+    def _refresh_top(self, node):
+        ranks = {self._rank(entry_id, self._entries[entry_id]) for entry_id in node.get(None, ())}
+        for key, child in node.items():
+            if key is not None and key != _TOP:
+                ranks.update(child[_TOP])
+        if ranks:
+            node[_TOP] = sorted(ranks)[:MAX_SUGGESTIONS]
+        else:
+            node.pop(_TOP, None)
+
+    def suggest(self, prefix, limit=MAX_SUGGESTIONS):
+        """Entries with a word starting with ``prefix``, vehicles first"""
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+
+        with self._lock:
+            node = self._root
+            for char in prefix:
+                node = node.get(char)
+                if node is None:
+                    return []
+            return [self._entries[rank[-1]] for rank in node[_TOP][:limit]]
+
+
+_trie = None
+_trie_built_at = 0.0
+_trie_lock = threading.Lock()
+
+
+def _search_url(text):
+    return f"{reverse('myapp:search')}?{urlencode({'q': text})}"
+
+
+def vehicle_entry(vehicle):
+    return {
+        'label': f"{vehicle.manufacturer} {vehicle.name}",
+        'kind': 'vehicle',
+        'url': reverse('myapp:parts_list', kwargs={'vehicle_slug': vehicle.slug}),
+    }
+
+
+def _build_trie():
+    # Imported here: signals.py imports this module
+    from .signals import CAR_PARTS, BIKE_PARTS
+
+    trie = PrefixTrie()
+    for part_data in CAR_PARTS + BIKE_PARTS:
+        trie.add(('part', part_data['name']), {
+            'label': part_data['name'],
+            'kind': 'part',
+            'url': _search_url(part_data['name']),
+        })
+        # Search ignores short queries, so a link for "AC" would find nothing
+        if len(part_data['category']) < MIN_QUERY_LENGTH:
+            continue
+        trie.add(('category', part_data['category']), {
+            'label': part_data['category'],
+            'kind': 'category',
+            'url': _search_url(part_data['category']),
+        })
+
+    for vehicle in VehicleModel.objects.filter(is_active=True).only(
+        'id', 'name', 'manufacturer', 'slug'
+    ):
+        trie.add(('vehicle', vehicle.pk), vehicle_entry(vehicle))
+    return trie
+
+
+def _is_stale():
+    return _trie is None or time.monotonic() - _trie_built_at > TRIE_TTL
+
+
+def get_trie():
+    """Process-wide trie, built on first use and rebuilt every TRIE_TTL"""
+    global _trie, _trie_built_at
+    if _is_stale():
+        with _trie_lock:
+            if _is_stale():
+                _trie = _build_trie()
+                _trie_built_at = time.monotonic()
+    return _trie
+
+
+def update_vehicle(vehicle):
+    """Signal hook: reflect a saved vehicle (no-op until the trie is built)"""
+    if _trie is None:
+        return
+    if vehicle.is_active:
+        _trie.add(('vehicle', vehicle.pk), vehicle_entry(vehicle))
+    else:
+        _trie.remove(('vehicle', vehicle.pk))
+
+
+def remove_vehicle(vehicle_id):
+    """Signal hook: drop a deleted vehicle"""
+    if _trie is not None:
+        _trie.remove(('vehicle', vehicle_id))
+
+
+def suggest(prefix, limit=MAX_SUGGESTIONS):
+    return get_trie().suggest(prefix, limit)
@@ -0,0 +1,106 @@
+"""
+Read replicas for the public catalog pages
+
+DATABASE_REPLICA_URLS (settings.py) adds ``replica1``, ``replica2``, ...
+database aliases. ReplicaRouter sends reads of this app's models to
+one of them, but only while a view decorated with ``replica_reads`` is
+running, so:
+
+- the public catalog views read from a replica (one per request)
+- writes always go to ``default``
+- admin, stock endpoints, signal handlers, management commands and
+  sessions / auth read from ``default``
+
+Read-your-writes: the stock endpoints and admin saves call
+``pin_to_primary`` on their response, which sets a cookie for
+REPLICA_PIN_SECONDS; requests carrying it read from ``default``. The
+page cache also calls ``read_from_primary`` while a page's version is
+younger than that, so a lagging replica never refills the cache with
+a page from before the change.
+"""
+import contextvars
+import random
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'primary_db_pin'
+
+APP_LABEL = 'myapp'
+
+# Alias the current request reads catalog data from (None = default)
+_read_alias = contextvars.ContextVar('replica_read_alias', default=None)
+
+
+def replica_aliases():
+    return getattr(settings, 'DATABASE_REPLICAS', ())
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+
+def _choose_replica(request):
+    replicas = replica_aliases()
+    if not replicas or PIN_COOKIE in request.COOKIES:
+        return None
+    return random.choice(replicas)
+
+
+def replica_reads(view_func):
+    """Serve the view's catalog reads from a replica (sync or async view)"""
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def async_wrapper(request, *args, **kwargs):
+            token = _read_alias.set(_choose_replica(request))
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        token = _read_alias.set(_choose_replica(request))
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+def read_from_primary():
+    """Read from ``default`` for the rest of the current request"""
+    _read_alias.set(None)
+
+
+def pin_to_primary(response):
+    """Make this browser read from ``default`` until replicas have caught up"""
+    if replica_aliases():
+        response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(), httponly=True, samesite='Lax')
+    return response
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != APP_LABEL:
+            return None
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        # Explicit: Django would otherwise save an object loaded from a
+        # replica back to that replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # All aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db in replica_aliases():
+            return False
+        return None
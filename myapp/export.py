@@ -0,0 +1,105 @@
+"""
+Streaming inventory export (CSV / NDJSON)
+
+One row per Part with its vehicle and PartStock quantity, for
+marketplaces and accounting (views.export_inventory, manage.py
+export_inventory). Rows come from a single values_list() query read
+with iterator(chunk_size=...), a server-side cursor on PostgreSQL, and
+are written out as they arrive, so memory stays flat however large the
+catalog is.
+
+The columns line up with what import_inventory reads back.
+"""
+import csv
+import json
+
+from asgiref.sync import sync_to_async
+
+from .models import Part
+
+# (column, Part lookup)
+FIELDS = [
+    ('part_id', 'pk'),
+    ('vehicle_slug', 'vehicle_model__slug'),
+    ('vehicle', 'vehicle_model__name'),
+    ('manufacturer', 'vehicle_model__manufacturer'),
+    ('vehicle_type', 'vehicle_model__vehicle_type'),
+    ('part_slug', 'slug'),
+    ('part_number', 'part_number'),
+    ('name', 'name'),
+    ('category', 'category'),
+    ('condition', 'condition'),
+    ('quantity', 'stock__quantity'),
+    ('is_active', 'is_active'),
+]
+COLUMNS = [column for column, _ in FIELDS]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched per round trip / cursor fetch
+CHUNK_SIZE = 2000
+# Rows joined into one write: one per row makes the server flush tiny chunks
+ROWS_PER_WRITE = 500
+
+
+def export_rows(chunk_size=CHUNK_SIZE):
+    """Every part as a tuple in COLUMNS order, by id"""
+    parts = Part.objects.order_by('pk').values_list(*(lookup for _, lookup in FIELDS))
+    quantity = COLUMNS.index('quantity')
+    for row in parts.iterator(chunk_size=chunk_size):
+        if row[quantity] is None:
+            # Part without a stock row (see fix_stock)
+            row = (*row[:quantity], 0, *row[quantity + 1:])
+        yield row
+
+
+class _Echo:
+    """File-like object that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_lines(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def _ndjson_lines(rows):
+    for row in rows:
+        yield json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + '\n'
+
+
+FORMATS = {
+    'csv': _csv_lines,
+    'ndjson': _ndjson_lines,
+}
+
+
+def export_inventory(fmt='csv', chunk_size=CHUNK_SIZE):
+    """The whole export in ``fmt`` as an iterator of text chunks"""
+    batch = []
+    for line in FORMATS[fmt](export_rows(chunk_size)):
+        batch.append(line)
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+async def stream_async(chunks):
+    """
+    ``chunks`` as an async iterator, for ASGI: Django reads a sync
+    iterator into memory before sending it. Every step runs on the same
+    sync thread, which owns the database cursor.
+    """
+    next_chunk = sync_to_async(next)
+    done = object()
+    while (chunk := await next_chunk(chunks, done)) is not done:
+        yield chunk
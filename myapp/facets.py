@@ -0,0 +1,93 @@
+"""
+Facet counts for the catalog filters
+
+- category_facets: in-stock parts per category of one vehicle
+  (the category filter on parts_list)
+- vehicle_facets: active vehicles per (type, manufacturer) pair
+  (the type and manufacturer filters on vehicle_list)
+
+Each is one GROUP BY, cached under the page cache version of the
+vehicle / catalog. Stock and catalog changes bump those versions
+(page_cache.bump_versions), so counts are only recomputed after a
+change. Without a shared cache (page_cache.is_enabled) they are
+computed on every request.
+"""
+from collections import Counter
+
+from django.db.models import Count
+
+from . import page_cache
+from .models import Part, VehicleModel
+
+CATEGORY_FACETS_KEY = 'catalog:facets:categories:{}:{}'
+VEHICLE_FACETS_KEY = 'catalog:facets:vehicles:{}'
+
+
+def _cached(key, version, compute):
+    if not page_cache.is_enabled():
+        return compute()
+    cache = page_cache.get_cache()
+    value = cache.get(key)
+    if value is None:
+        page_cache.read_primary_if_recent(version)
+        value = compute()
+        cache.set(key, value, page_cache.page_timeout())
+    return value
+
+
+def icontains(value, query):
+    """Python side of the views' ``__icontains`` filters"""
+    return query.lower() in value.lower()
+
+
+def category_facets(vehicle_id):
+    """[(category, in-stock part count)] for a vehicle, by category"""
+    version = page_cache.current_version(vehicle_id)
+    return _cached(CATEGORY_FACETS_KEY.format(vehicle_id, version), version, lambda: list(
+        Part.objects.filter(vehicle_model_id=vehicle_id, is_active=True, stock__quantity__gt=0)
+        .values_list('category')
+        .annotate(count=Count('id'))
+        .order_by('category')
+    ))
+
+
+def category_total(facets, category=''):
+    """Parts matching the category filter (all of them when it is empty)"""
+    return sum(count for name, count in facets if not category or icontains(name, category))
+
+
+def vehicle_facets():
+    """[(vehicle_type, manufacturer, active vehicle count)]"""
+    version = page_cache.current_version()
+    return _cached(VEHICLE_FACETS_KEY.format(version), version, lambda: list(
+        VehicleModel.objects.filter(is_active=True)
+        .values_list('vehicle_type', 'manufacturer')
+        .annotate(count=Count('id'))
+        .order_by('manufacturer', 'vehicle_type')
+    ))
+
+
+def vehicle_filter_counts(facets, vehicle_type='', manufacturer=''):
+    """
+    Counts for the vehicle_list filters. Each filter's counts honour the
+    other filter's selection:
+
+    {'types': {'car': 12, ...}, 'manufacturers': [('Honda', 4), ...], 'total': 7}
+    """
+    types = Counter()
+    manufacturers = Counter()
+    total = 0
+    for facet_type, facet_manufacturer, count in facets:
+        type_matches = not vehicle_type or facet_type == vehicle_type
+        manufacturer_matches = not manufacturer or icontains(facet_manufacturer, manufacturer)
+        if manufacturer_matches:
+            types[facet_type] += count
+        # Every manufacturer stays listed, with 0 if it has none of the type
+        manufacturers[facet_manufacturer] += count if type_matches else 0
+        if type_matches and manufacturer_matches:
+            total += count
+    return {
+        'types': dict(types),
+        'manufacturers': sorted(manufacturers.items()),
+        'total': total,
+    }
@@ -0,0 +1,184 @@
+"""
+Resized renditions of uploaded Part / VehicleModel images
+
+Every upload gets WebP and JPEG copies at RENDITION_WIDTHS (never
+upscaled), re-encoded without EXIF after applying its orientation. The
+result is recorded on the model's ``image_renditions``:
+
+    {"source": "parts/x.jpg", "width": 3000, "height": 2000,
+     "renditions": [{"name": ..., "format": "webp", "width": 320, "height": 213}, ...]}
+
+and the ``responsive_image`` tag in part_tags turns it into a srcset.
+
+Renditions are built after the upload commits, on a small thread pool
+(IMAGE_RENDITIONS_ASYNC / IMAGE_RENDITION_WORKERS in settings), so the
+admin save does not wait for Pillow. ``manage.py generate_image_renditions``
+backfills existing uploads.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from . import page_cache
+
+logger = logging.getLogger(__name__)
+
+RENDITION_WIDTHS = (320, 640, 1024)
+RENDITION_DIR = 'renditions'
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def needs_renditions(instance):
+    """True if the instance's current upload has no renditions yet"""
+    name = instance.image.name if instance.image else ''
+    return name != (instance.image_renditions or {}).get('source', '')
+
+
+def _rendition_name(source_name, width, fmt):
+    stem, _ = os.path.splitext(source_name)
+    return f'{RENDITION_DIR}/{stem}-{width}w.{fmt}'
+
+
+def _flatten(image):
+    """RGB copy for JPEG; transparent areas become white"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def build_renditions(field_file, storage=default_storage):
+    """
+    Write the renditions of ``field_file`` to ``storage`` and return the
+    image_renditions dict describing them.
+    """
+    field_file.open('rb')
+    try:
+        with Image.open(field_file) as source:
+            # Bake the EXIF orientation into the pixels; EXIF itself is not copied
+            image = ImageOps.exif_transpose(source)
+            image.load()
+    finally:
+        field_file.close()
+
+    width, height = image.size
+    targets = [w for w in RENDITION_WIDTHS if w < width] or [width]
+    flat = _flatten(image)
+
+    renditions = []
+    for target in targets:
+        size = (target, max(1, round(height * target / width)))
+        resized = flat.resize(size, Image.LANCZOS) if size != flat.size else flat
+        for fmt, options in FORMATS.items():
+            buffer = io.BytesIO()
+            resized.save(buffer, **options)
+            name = _rendition_name(field_file.name, target, fmt)
+            if storage.exists(name):
+                storage.delete(name)
+            saved_name = storage.save(name, ContentFile(buffer.getvalue()))
+            renditions.append({
+                'name': saved_name,
+                'format': fmt,
+                'width': size[0],
+                'height': size[1],
+            })
+
+    return {
+        'source': field_file.name,
+        'width': width,
+        'height': height,
+        'renditions': renditions,
+    }
+
+
+def delete_renditions(data, keep=(), storage=default_storage):
+    """Remove the files listed in an image_renditions dict (except ``keep``)"""
+    for rendition in (data or {}).get('renditions', []):
+        if rendition['name'] in keep:
+            continue
+        try:
+            storage.delete(rendition['name'])
+        except OSError:
+            logger.warning("Could not delete rendition %s", rendition['name'])
+
+
+def generate_for(model_label, pk, force=False):
+    """
+    Build renditions for one saved object and store them.
+    Safe to run on any thread; does nothing if the upload changed again
+    before it got here.
+    """
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None or not (force or needs_renditions(instance)):
+        return
+    old = instance.image_renditions
+    data = build_renditions(instance.image) if instance.image else {}
+
+    # Conditional on the upload we processed: a newer upload wins
+    if instance.image:
+        same_upload = Q(image=instance.image.name)
+    else:
+        same_upload = Q(image='') | Q(image__isnull=True)
+    updated = model.objects.filter(same_upload, pk=pk).update(image_renditions=data)
+    if updated:
+        # A forced rebuild rewrites the same names; keep those
+        delete_renditions(old, keep={rendition['name'] for rendition in data.get('renditions', [])})
+        # Parts belong to a vehicle; a vehicle is its own
+        page_cache.bump_versions([getattr(instance, 'vehicle_model_id', instance.pk)])
+    else:
+        delete_renditions(data)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+                    thread_name_prefix='image-renditions',
+                )
+    return _executor
+
+
+def _run_in_worker(model_label, pk):
+    try:
+        generate_for(model_label, pk)
+    except Exception:
+        logger.exception("Building renditions failed for %s %s", model_label, pk)
+    finally:
+        # The worker thread has its own connection; honour CONN_MAX_AGE for it too
+        close_old_connections()
+
+
+def schedule_renditions(instance):
+    """Build renditions for ``instance`` once the current transaction commits"""
+    model_label = instance._meta.label
+    pk = instance.pk
+
+    def submit():
+        if getattr(settings, 'IMAGE_RENDITIONS_ASYNC', True):
+            _get_executor().submit(_run_in_worker, model_label, pk)
+        else:
+            generate_for(model_label, pk)
+
+    transaction.on_commit(submit)
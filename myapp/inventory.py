@@ -0,0 +1,274 @@
+"""
+Inventory bookkeeping shared by signals, views, admin and commands
+
+VehicleModel.available_parts_count / total_parts_count are denormalized
+so listings read a column instead of joining Part and PartStock on every
+page view. Signal handlers adjust them by +/-1 when a stock quantity
+crosses zero or a part is added, removed, activated or deactivated;
+anything that changes stock in bulk calls rebuild_vehicle_counters().
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from . import page_cache, related
+from .models import VehicleModel, Part, PartStock
+
+
+def _count_subquery(**filters):
+    return Subquery(
+        Part.objects.filter(vehicle_model=OuterRef('pk'), **filters)
+        .order_by()
+        .values('vehicle_model')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+
+
+def rebuild_vehicle_counters(vehicle_ids=None):
+    """
+    Recompute both counters from scratch with a single UPDATE.
+    ``vehicle_ids`` limits it to some vehicles; None rebuilds all.
+    Returns the number of vehicles updated.
+    """
+    vehicles = VehicleModel.objects.all()
+    if vehicle_ids is not None:
+        vehicles = vehicles.filter(pk__in=list(vehicle_ids))
+    return vehicles.update(
+        available_parts_count=Coalesce(
+            _count_subquery(is_active=True, stock__quantity__gt=0), Value(0)
+        ),
+        total_parts_count=Coalesce(_count_subquery(), Value(0)),
+    )
+
+
+def stale_counter_vehicles():
+    """Vehicles whose counters disagree with a recount (fix_stock)"""
+    return VehicleModel.objects.annotate(
+        actual_available=Coalesce(_count_subquery(is_active=True, stock__quantity__gt=0), Value(0)),
+        actual_total=Coalesce(_count_subquery(), Value(0)),
+    ).exclude(
+        available_parts_count=F('actual_available'),
+        total_parts_count=F('actual_total'),
+    )
+
+
+def adjust_vehicle_counters(vehicle_id, available=0, total=0):
+    """
+    Apply +/- deltas to a vehicle's counters in place (F expressions).
+    Returns the number of vehicles updated.
+    """
+    changes = {}
+    if available:
+        changes['available_parts_count'] = Greatest(F('available_parts_count') + available, Value(0))
+    if total:
+        changes['total_parts_count'] = Greatest(F('total_parts_count') + total, Value(0))
+    if not changes:
+        return 0
+    return VehicleModel.objects.filter(pk=vehicle_id).update(**changes)
+
+
+def stock_changed(vehicle_ids):
+    """
+    Bookkeeping after a bulk stock update that bypassed the model
+    signals: recount the vehicles, then re-rank related parts and
+    invalidate their cached pages once the transaction commits.
+    """
+    vehicle_ids = [pk for pk in set(vehicle_ids) if pk]
+    if not vehicle_ids:
+        return
+    rebuild_vehicle_counters(vehicle_ids)
+    related.schedule_refresh(vehicle_ids)
+    transaction.on_commit(lambda: page_cache.bump_versions(vehicle_ids))
+
+
+def ensure_stock_rows(vehicle_id):
+    """Create missing PartStock rows for a vehicle's parts (one anti-join)"""
+    missing = Part.objects.filter(
+        vehicle_model_id=vehicle_id, stock__isnull=True
+    ).values_list('id', flat=True)
+    PartStock.objects.bulk_create(
+        [PartStock(part_id=part_id, quantity=0) for part_id in missing],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def increment_vehicle_stock(vehicle_id, delta=1, category=None):
+    """
+    Add ``delta`` to the stock of every part of a vehicle (optionally one
+    category) with a single UPDATE ... SET quantity = quantity + delta.
+    Returns the number of stock rows updated.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ensure_stock_rows(vehicle_id)
+        stocks = PartStock.objects.filter(part__vehicle_model_id=vehicle_id)
+        if category:
+            stocks = stocks.filter(part__category=category)
+        changes = {'quantity': F('quantity') + delta, 'updated_at': now}
+        if delta > 0:
+            changes['last_restocked'] = now
+        updated = stocks.update(**changes)
+        stock_changed([vehicle_id])
+    return updated
+
+
+# -----------------------------
+# Stock adjustments
+# -----------------------------
+MAX_BATCH_SIZE = 500
+# Largest change one batch may make to a single stock row, well inside
+# the quantity column's range
+MAX_STOCK_DELTA = 10000
+
+
+class StockAdjustmentError(Exception):
+    """A batch could not be applied; nothing was changed"""
+
+    def __init__(self, message, stock_ids=()):
+        super().__init__(message)
+        self.stock_ids = sorted(stock_ids)
+
+
+def stock_status(quantity, low_stock_threshold):
+    """(label, colour) shown by the admin stock widgets"""
+    if quantity == 0:
+        return 'OUT OF STOCK', '#dc3545'
+    if quantity <= low_stock_threshold:
+        return 'LOW STOCK', '#ffc107'
+    return 'IN STOCK', '#28a745'
+
+
+def _snapshot(stocks):
+    rows = stocks.values('pk', 'quantity', 'low_stock_threshold', 'part__vehicle_model_id')
+    snapshot = []
+    for row in rows:
+        status, color = stock_status(row['quantity'], row['low_stock_threshold'])
+        snapshot.append({
+            'stock_id': row['pk'],
+            'vehicle_id': row['part__vehicle_model_id'],
+            'quantity': row['quantity'],
+            'status': status,
+            'color': color,
+        })
+    return snapshot
+
+
+def stock_snapshot(stock_ids):
+    """Current quantity / status of the given stock rows in one SELECT"""
+    return _snapshot(PartStock.objects.filter(pk__in=stock_ids))
+
+
+def vehicle_stock_snapshot(vehicle_id, category=None):
+    """Quantity / status of all (or one category of) a vehicle's stock rows"""
+    stocks = PartStock.objects.filter(part__vehicle_model_id=vehicle_id)
+    if category:
+        stocks = stocks.filter(part__category=category)
+    return _snapshot(stocks.order_by('pk'))
+
+
+def apply_stock_adjustments(adjustments):
+    """
+    Apply (stock_id, delta) pairs as one transaction of F() updates.
+    
+    Deltas for the same stock row are summed first and rows sharing a
+    delta are updated together. A delta beyond MAX_STOCK_DELTA, alone or
+    summed, is refused with StockAdjustmentError. The rows are locked for the duration, and
+    a row that would go below zero (or does not exist) aborts the whole
+    batch with StockAdjustmentError, so concurrent clicks can never lose
+    an update or leave a partial batch.
+    Returns the stock_snapshot() of every row touched.
+    """
+    deltas = defaultdict(int)
+    too_large = set()
+    for stock_id, delta in adjustments:
+        stock_id, delta = int(stock_id), int(delta)
+        if abs(delta) > MAX_STOCK_DELTA:
+            too_large.add(stock_id)
+        deltas[stock_id] += delta
+    if len(deltas) > MAX_BATCH_SIZE:
+        raise StockAdjustmentError(f'At most {MAX_BATCH_SIZE} stock rows per batch')
+    too_large.update(pk for pk, delta in deltas.items() if abs(delta) > MAX_STOCK_DELTA)
+    if too_large:
+        raise StockAdjustmentError(f'A stock row can change by at most {MAX_STOCK_DELTA}', too_large)
+    
+    by_delta = defaultdict(list)
+    for stock_id, delta in deltas.items():
+        if delta:
+            by_delta[delta].append(stock_id)
+    
+    now = timezone.now()
+    with transaction.atomic():
+        # Lock the rows so the checks below stay true until commit
+        current = dict(
+            PartStock.objects.select_for_update()
+            .filter(pk__in=list(deltas)).values_list('pk', 'quantity')
+        )
+        missing = set(deltas) - set(current)
+        if missing:
+            raise StockAdjustmentError('Stock record not found', missing)
+        negative = [pk for pk, delta in deltas.items() if current[pk] + delta < 0]
+        if negative:
+            raise StockAdjustmentError('Stock cannot go below 0', negative)
+        
+        for delta, stock_ids in by_delta.items():
+            PartStock.objects.filter(
+                pk__in=stock_ids, quantity__gte=max(0, -delta)
+            ).update(quantity=F('quantity') + delta, updated_at=now)
+        
+        snapshot = stock_snapshot(list(deltas))
+        if by_delta:
+            stock_changed(row['vehicle_id'] for row in snapshot)
+    return snapshot
+
+
+def set_stock_levels(vehicle_id, changes):
+    """
+    Write absolute quantity / threshold values to some of a vehicle's
+    stock rows in one transaction (the admin stock grid).
+    
+    ``changes`` maps stock_id -> {'quantity', 'low_stock_threshold',
+    'expected'} where ``expected`` is the quantity the editor started
+    from. Rows changed by someone else in the meantime (or not belonging
+    to the vehicle) abort the batch with StockAdjustmentError rather than
+    silently overwriting the other edit.
+    Returns the stock_snapshot() of the saved rows.
+    """
+    if len(changes) > MAX_BATCH_SIZE:
+        raise StockAdjustmentError(f'At most {MAX_BATCH_SIZE} stock rows per batch')
+    if not changes:
+        return []
+    
+    now = timezone.now()
+    with transaction.atomic():
+        stocks = {
+            stock.pk: stock for stock in PartStock.objects.select_for_update(of=('self',))
+            .filter(pk__in=list(changes), part__vehicle_model_id=vehicle_id)
+        }
+        missing = set(changes) - set(stocks)
+        if missing:
+            raise StockAdjustmentError('Stock record not found', missing)
+        conflicts = [
+            pk for pk, change in changes.items()
+            if change.get('expected') is not None and stocks[pk].quantity != change['expected']
+        ]
+        if conflicts:
+            raise StockAdjustmentError('Stock was changed by someone else, reload and retry', conflicts)
+        
+        for pk, change in changes.items():
+            stock = stocks[pk]
+            if change['quantity'] > stock.quantity:
+                stock.last_restocked = now
+            stock.quantity = change['quantity']
+            stock.low_stock_threshold = change['low_stock_threshold']
+            stock.updated_at = now
+        PartStock.objects.bulk_update(
+            stocks.values(), ['quantity', 'low_stock_threshold', 'last_restocked', 'updated_at']
+        )
+        
+        stock_changed([vehicle_id])
+        return stock_snapshot(list(changes))
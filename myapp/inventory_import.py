@@ -0,0 +1,330 @@
+"""
+Bulk stock import from a CSV (yard intake spreadsheets)
+
+Each row sets a part's stock to absolute values:
+
+    vehicle_slug,part_slug,part_number,quantity,low_stock_threshold
+
+A part is found by vehicle_slug plus part_slug, or part_number when
+part_slug is empty; low_stock_threshold is optional. Other columns are
+ignored, so a file from export.py can be edited and read back in.
+
+The file is read and validated IMPORT_CHUNK_SIZE rows at a time, with
+one query per chunk for the vehicles not seen yet and one for the parts
+and their stock. Nothing is written while reading, so a dry run reports
+exactly what an import would change. Changes are then applied in
+batches of IMPORT_BATCH_SIZE rows, each its own transaction, followed
+by the usual stock_changed() bookkeeping. If any row is invalid, nothing is written unless
+``skip_invalid`` is set.
+
+A row is only written if its stock still holds the values it was
+compared against. Stock changed by someone else between reading and
+writing is left alone and reported in ``ImportReport.conflicts``.
+"""
+import csv
+import operator
+from collections import defaultdict, namedtuple
+from functools import reduce
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .inventory import stock_changed
+from .models import Part, PartStock, VehicleModel
+
+IMPORT_CHUNK_SIZE = 2000
+IMPORT_BATCH_SIZE = 5000
+# Keeps each statement under the SQLite variable limit
+STATEMENT_BATCH_SIZE = 500
+
+REQUIRED_COLUMNS = {'vehicle_slug', 'quantity'}
+KEY_COLUMNS = ('part_slug', 'part_number')
+
+# old_quantity / old_threshold are None when the part has no stock row yet
+StockChange = namedtuple(
+    'StockChange', 'line part_id vehicle_id label quantity threshold old_quantity old_threshold'
+)
+
+
+class InventoryImportError(Exception):
+    """The file cannot be imported at all (e.g. missing columns)"""
+
+
+class ImportReport:
+    """What an import found and (unless it was a dry run) applied"""
+
+    def __init__(self):
+        self.rows = 0
+        self.unchanged = 0
+        self.changes = []
+        self.errors = []
+        # StockChanges not written: the stock changed after the file was read
+        self.conflicts = []
+        self.applied = False
+
+    @property
+    def created(self):
+        return [change for change in self.changes if change.old_quantity is None]
+
+    @property
+    def updated(self):
+        return [change for change in self.changes if change.old_quantity is not None]
+
+    def summary(self):
+        verb = 'applied' if self.applied else 'would apply'
+        skipped = {change.line for change in self.conflicts}
+        updated = sum(1 for change in self.updated if change.line not in skipped)
+        created = sum(1 for change in self.created if change.line not in skipped)
+        summary = (
+            f'{self.rows} row(s): {verb} {updated} update(s) and '
+            f'{created} new stock row(s); {self.unchanged} unchanged, {len(self.errors)} invalid'
+        )
+        if self.conflicts:
+            summary += f', {len(self.conflicts)} changed by someone else meanwhile (not applied)'
+        return summary
+
+    def diff_lines(self, limit=None):
+        """Human-readable diff, one line per change"""
+        for change in islice(self.changes, limit):
+            if change.old_quantity is None:
+                yield f'line {change.line}: {change.label}: new stock {change.quantity} (threshold {change.threshold})'
+                continue
+            parts = []
+            if change.quantity != change.old_quantity:
+                parts.append(f'quantity {change.old_quantity} -> {change.quantity}')
+            if change.threshold != change.old_threshold:
+                parts.append(f'threshold {change.old_threshold} -> {change.threshold}')
+            yield f"line {change.line}: {change.label}: {', '.join(parts)}"
+
+    def conflict_lines(self, limit=None):
+        for change in islice(self.conflicts, limit):
+            yield f'line {change.line}: {change.label}: stock changed since the file was read, not applied'
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def _non_negative_int(value, column):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{column} must be a whole number, got {value!r}')
+    if number < 0:
+        raise ValueError(f'{column} cannot be negative')
+    return number
+
+
+class _Validator:
+    """Resolves and checks rows chunk by chunk, filling in an ImportReport"""
+
+    def __init__(self, report):
+        self.report = report
+        self.vehicles = {}
+        self.seen = {}
+
+    def _load_vehicles(self, slugs):
+        missing = {slug for slug in slugs if slug not in self.vehicles}
+        if missing:
+            found = dict(VehicleModel.objects.filter(slug__in=missing).values_list('slug', 'pk'))
+            for slug in missing:
+                self.vehicles[slug] = found.get(slug)
+
+    def _load_parts(self, keyed):
+        """{(vehicle_id, key column, value): [part rows]} for the chunk"""
+        slug_keys = {(vehicle_id, value) for vehicle_id, column, value in keyed if column == 'part_slug'}
+        number_keys = {(vehicle_id, value) for vehicle_id, column, value in keyed if column == 'part_number'}
+        queries = []
+        if slug_keys:
+            queries.append(Q(
+                vehicle_model_id__in={vehicle_id for vehicle_id, _ in slug_keys},
+                slug__in={value for _, value in slug_keys},
+            ))
+        if number_keys:
+            queries.append(Q(
+                vehicle_model_id__in={vehicle_id for vehicle_id, _ in number_keys},
+                part_number__in={value for _, value in number_keys},
+            ))
+        parts = {}
+        if not queries:
+            return parts
+        for row in Part.objects.filter(reduce(operator.or_, queries)).values_list(
+            'pk', 'vehicle_model_id', 'slug', 'part_number', 'name',
+            'stock__quantity', 'stock__low_stock_threshold',
+        ):
+            pk, vehicle_id, slug, part_number, *_ = row
+            parts.setdefault((vehicle_id, 'part_slug', slug), []).append(row)
+            if part_number:
+                parts.setdefault((vehicle_id, 'part_number', part_number), []).append(row)
+        return parts
+
+    def validate(self, chunk):
+        """``chunk`` is a list of (line number, row dict)"""
+        report = self.report
+        self._load_vehicles({(row.get('vehicle_slug') or '').strip() for _, row in chunk})
+
+        pending = []
+        for line, row in chunk:
+            report.rows += 1
+            vehicle_slug = (row.get('vehicle_slug') or '').strip()
+            vehicle_id = self.vehicles.get(vehicle_slug)
+            if vehicle_id is None:
+                report.errors.append((line, f'unknown vehicle {vehicle_slug!r}'))
+                continue
+            column = next((column for column in KEY_COLUMNS if (row.get(column) or '').strip()), None)
+            if column is None:
+                report.errors.append((line, 'part_slug or part_number is required'))
+                continue
+            try:
+                quantity = _non_negative_int((row.get('quantity') or '').strip(), 'quantity')
+                threshold = (row.get('low_stock_threshold') or '').strip()
+                threshold = _non_negative_int(threshold, 'low_stock_threshold') if threshold else None
+            except ValueError as e:
+                report.errors.append((line, str(e)))
+                continue
+            pending.append((line, vehicle_id, vehicle_slug, column, row[column].strip(), quantity, threshold))
+
+        parts = self._load_parts({(vehicle_id, column, value) for _, vehicle_id, _, column, value, _, _ in pending})
+        for line, vehicle_id, vehicle_slug, column, value, quantity, threshold in pending:
+            matches = parts.get((vehicle_id, column, value), [])
+            if len(matches) != 1:
+                problem = 'no part' if not matches else f'{len(matches)} parts'
+                report.errors.append((line, f'{problem} with {column} {value!r} on {vehicle_slug}'))
+                continue
+            pk, _, slug, _, name, old_quantity, old_threshold = matches[0]
+            if pk in self.seen:
+                report.errors.append((line, f'{vehicle_slug}/{slug} is already set on line {self.seen[pk]}'))
+                continue
+            self.seen[pk] = line
+
+            if threshold is None:
+                threshold = old_threshold if old_threshold is not None else PartStock._meta.get_field(
+                    'low_stock_threshold'
+                ).default
+            if quantity == old_quantity and threshold == old_threshold:
+                report.unchanged += 1
+                continue
+            report.changes.append(StockChange(
+                line, pk, vehicle_id, f'{vehicle_slug}/{slug} ({name})',
+                quantity, threshold, old_quantity, old_threshold,
+            ))
+
+
+def read_inventory(lines, chunk_size=IMPORT_CHUNK_SIZE):
+    """Validate a CSV (any iterable of text lines) into an ImportReport"""
+    reader = csv.DictReader(lines)
+    columns = {column.strip() for column in reader.fieldnames or ()}
+    missing = REQUIRED_COLUMNS - columns
+    if missing or not columns & set(KEY_COLUMNS):
+        raise InventoryImportError(
+            'The CSV needs vehicle_slug, quantity and part_slug or part_number columns'
+        )
+    reader.fieldnames = [column.strip() for column in reader.fieldnames]
+
+    report = ImportReport()
+    validator = _Validator(report)
+    # Line numbers as a spreadsheet shows them (header is line 1)
+    for chunk in _chunks(enumerate(reader, 2), chunk_size):
+        validator.validate(chunk)
+    return report
+
+
+def _update_group(changes, old_values, new_values, now):
+    """
+    Write ``new_values`` to the stock of ``changes`` where it still holds
+    ``old_values``; returns the changes that were not written
+    """
+    conflicts = []
+    for chunk in _chunks(changes, STATEMENT_BATCH_SIZE):
+        part_ids = [change.part_id for change in chunk]
+        updated = PartStock.objects.filter(part_id__in=part_ids, **old_values).update(**new_values, updated_at=now)
+        if updated < len(chunk):
+            written = set(
+                PartStock.objects.filter(part_id__in=part_ids, updated_at=now, **new_values)
+                .values_list('part_id', flat=True)
+            )
+            conflicts.extend(change for change in chunk if change.part_id not in written)
+    return conflicts
+
+
+def _create_missing(changes, now):
+    """
+    Insert stock rows for parts that had none; returns the changes whose
+    row appeared in the meantime (those are not written)
+    """
+    conflicts = []
+    for chunk in _chunks(changes, STATEMENT_BATCH_SIZE):
+        existing = set(
+            PartStock.objects.filter(part_id__in=[change.part_id for change in chunk])
+            .values_list('part_id', flat=True)
+        )
+        conflicts.extend(change for change in chunk if change.part_id in existing)
+        # ignore_conflicts: a row inserted after the check above is kept, not overwritten
+        PartStock.objects.bulk_create([
+            PartStock(
+                part_id=change.part_id,
+                quantity=change.quantity,
+                low_stock_threshold=change.threshold,
+                last_restocked=now if change.quantity else None,
+            )
+            for change in chunk if change.part_id not in existing
+        ], ignore_conflicts=True)
+    return conflicts
+
+
+def apply_changes(changes, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Write StockChanges, ``batch_size`` rows per transaction, and return
+    the ones that were skipped because the stock changed after it was
+    read (the UPDATEs only match rows still holding the old values).
+
+    Existing rows with the same old and new values are updated together
+    (one UPDATE per chunk of ids, as in apply_stock_adjustments):
+    quantities repeat a lot, and bulk_update's per-row CASE expression
+    is far slower than the write itself. New rows go in with bulk_create.
+    Counters, related parts and cached pages are brought up to date once
+    at the end.
+    """
+    now = timezone.now()
+    vehicle_ids = set()
+    conflicts = []
+    for batch in _chunks(changes, batch_size):
+        groups = defaultdict(list)
+        created = []
+        for change in batch:
+            vehicle_ids.add(change.vehicle_id)
+            if change.old_quantity is None:
+                created.append(change)
+                continue
+            groups[change.old_quantity, change.old_threshold, change.quantity, change.threshold].append(change)
+
+        with transaction.atomic():
+            for (old_quantity, old_threshold, quantity, threshold), group in groups.items():
+                new_values = {'quantity': quantity, 'low_stock_threshold': threshold}
+                if quantity > old_quantity:
+                    new_values['last_restocked'] = now
+                conflicts += _update_group(
+                    group, {'quantity': old_quantity, 'low_stock_threshold': old_threshold}, new_values, now
+                )
+            conflicts += _create_missing(created, now)
+
+    stock_changed(vehicle_ids)
+    return conflicts
+
+
+def import_inventory(lines, dry_run=False, skip_invalid=False,
+                     chunk_size=IMPORT_CHUNK_SIZE, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Validate and (unless ``dry_run``) apply a stock CSV.
+    Returns the ImportReport; ``report.applied`` says whether it was written.
+    """
+    report = read_inventory(lines, chunk_size)
+    if dry_run or (report.errors and not skip_invalid):
+        return report
+    report.conflicts = apply_changes(report.changes, batch_size)
+    report.applied = True
+    return report
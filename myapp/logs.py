@@ -0,0 +1,176 @@
+"""
+Structured logging for the app
+
+- JsonFormatter: one JSON object per line, ``extra`` fields included
+- SamplingFilter: keeps a fraction (LOG_SAMPLE_RATE) of INFO/DEBUG
+  records; warnings and errors always pass
+- QueueingHandler: request threads only put the record on a bounded
+  queue; a QueueListener thread formats and writes it. When the queue
+  is full records are dropped instead of blocking, and counted in
+  myapp_log_records_dropped_total on /metrics.
+- signal_span / traced: time a signal handler and log its duration,
+  rows touched and queries issued (DEBUG, and only for a sampled
+  LOG_SPAN_SAMPLE_RATE of the calls)
+
+See LOGGING in settings.py for how they are wired together.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import QueryCounter, registry
+
+logger = logging.getLogger('myapp.signals')
+
+# Attributes every LogRecord has; anything else came from ``extra``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Render a record and its ``extra`` fields as one JSON line"""
+
+    def format(self, record):
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith('_'):
+                data[key] = value
+        if record.exc_info:
+            data['exc'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Pass ``rate`` of the INFO/DEBUG records (0..1); WARNING and up always pass"""
+
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        if random.random() < self.rate:
+            # Lets whoever aggregates the logs scale counts back up
+            record.sample_rate = getattr(record, 'sample_rate', 1.0) * self.rate
+            return True
+        return False
+
+
+class QueueingHandler(logging.handlers.QueueHandler):
+    """
+    Non-blocking handler: records go on a bounded queue and are written
+    by a background QueueListener (JSON lines on stderr). The listener
+    is started lazily, per process, so it also works after gunicorn forks.
+    """
+
+    def __init__(self, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        target = logging.StreamHandler(sys.stderr)
+        target.setFormatter(JsonFormatter())
+        self._listener = logging.handlers.QueueListener(self.queue, target, respect_handler_level=False)
+        self._listener.start()
+        atexit.register(self._listener.stop)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            registry.inc('myapp_log_records_dropped_total', {})
+
+    def emit(self, record):
+        self._ensure_listener()
+        super().emit(record)
+
+
+# -----------------------------
+# Signal handler spans
+# -----------------------------
+class Span:
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+        self.rows = None
+
+    def add_rows(self, count):
+        self.rows = (self.rows or 0) + (count or 0)
+
+
+_current_span = contextvars.ContextVar('signal_span', default=None)
+
+
+@contextmanager
+def signal_span(name, **fields):
+    """
+    Time the enclosed block and log it as one DEBUG ``signal`` record with
+    duration_ms, queries and rows (set via span.add_rows / span_rows).
+
+    Whether to trace is decided up front (DEBUG enabled for myapp.signals,
+    then LOG_SPAN_SAMPLE_RATE), so an untraced span costs a level check
+    and a random() call: no timer, no query wrappers, no record.
+    """
+    rate = settings.LOG_SPAN_SAMPLE_RATE
+    if not logger.isEnabledFor(logging.DEBUG) or (rate < 1 and random.random() >= rate):
+        yield None
+        return
+
+    span = Span(name, fields)
+    counter = QueryCounter()
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            yield span
+    finally:
+        _current_span.reset(token)
+        logger.debug('signal %s', name, extra={
+            'span': name,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 3),
+            'queries': counter.count,
+            'rows': span.rows,
+            'sample_rate': rate,
+            **fields,
+        })
+
+
+def span_rows(count):
+    """Record rows touched by the signal handler currently being traced"""
+    span = _current_span.get()
+    if span is not None:
+        span.add_rows(count)
+
+
+def traced(handler):
+    """Decorator: run a signal receiver inside a signal_span"""
+    @wraps(handler)
+    def wrapper(sender, **kwargs):
+        with signal_span(handler.__name__, sender=sender.__name__):
+            return handler(sender, **kwargs)
+    return wrapper
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from myapp.export import CHUNK_SIZE, FORMATS, export_inventory
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes every part with its vehicle, category, condition and stock quantity as '
+        'CSV or NDJSON, streaming rows so memory stays flat on any catalog size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='Output format (default csv)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help=f'Rows fetched per database round trip (default {CHUNK_SIZE})')
+
+    def handle(self, *args, **options):
+        chunks = export_inventory(options['format'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as f:
+            f.writelines(chunks)
+        self.stderr.write(self.style.SUCCESS(f"Exported inventory to {options['output']}"))
@@ -1,47 +1,45 @@
-# Create this file: myapp/management/commands/fix_stock.py
-# 
-# File structure:
-# myapp/
-#   management/
-#     __init__.py  (create empty file)
-#     commands/
-#       __init__.py  (create empty file)
-#       fix_stock.py  (this file)
+import json
 
 from django.core.management.base import BaseCommand
-from myapp.models import Part, PartStock
+from myapp.reconcile import CHECKS, DEFAULT_CHUNK_SIZE, reconcile
 
 
 class Command(BaseCommand):
-    help = 'Ensures all parts have PartStock entries'
+    help = (
+        'Checks inventory invariants (every part has a stock row, no orphaned stock, '
+        'standard part sets complete, vehicle counters right) with set-based queries '
+        'and repairs what it can in chunks.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report, change nothing')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Rows per query / repair transaction (default {DEFAULT_CHUNK_SIZE})')
+        parser.add_argument('--check', action='append', dest='checks', choices=[check.name for check in CHECKS],
+                            help='Only run this check (repeatable)')
+        parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format')
 
     def handle(self, *args, **options):
-        self.stdout.write('Checking all parts for stock entries...')
-        
-        parts = Part.objects.all()
-        created_count = 0
-        updated_count = 0
-        total_parts = parts.count()
-        
-        for part in parts:
-            try:
-                stock = part.stock
-                # Stock exists, check if it's valid
-                if stock.quantity is None:
-                    stock.quantity = 0
-                    stock.save()
-                    updated_count += 1
-                    self.stdout.write(f'  ✓ Fixed stock for: {part.name}')
-            except PartStock.DoesNotExist:
-                # Create missing stock entry
-                PartStock.objects.create(part=part, quantity=0)
-                created_count += 1
-                self.stdout.write(f'  + Created stock entry for: {part.name}')
-        
-        self.stdout.write(self.style.SUCCESS(f'\n✅ Complete!'))
-        self.stdout.write(f'Total parts: {total_parts}')
-        self.stdout.write(f'Created stock entries: {created_count}')
-        self.stdout.write(f'Updated stock entries: {updated_count}')
-        
-        if created_count > 0 or updated_count > 0:
-            self.stdout.write(self.style.WARNING(f'\n⚠️  Please check admin to set correct quantities!'))
\ No newline at end of file
+        report = reconcile(
+            dry_run=options['dry_run'],
+            chunk_size=options['chunk_size'],
+            checks=options['checks'],
+        )
+
+        if options['format'] == 'json':
+            self.stdout.write(json.dumps({'dry_run': options['dry_run'], 'checks': report}, indent=2))
+            return
+
+        for name, result in report.items():
+            line = f"{name}: {result['found']} found, {result['fixed']} fixed"
+            if not result['found']:
+                self.stdout.write(self.style.SUCCESS(line))
+                continue
+            sample = ', '.join(str(pk) for pk in result['sample'])
+            self.stdout.write(self.style.WARNING(f"{line} - {result['description']} (ids: {sample})"))
+
+        unfixed = sum(result['found'] - result['fixed'] for result in report.values())
+        if options['dry_run'] and unfixed:
+            self.stdout.write('Dry run: nothing was changed')
+        elif unfixed:
+            self.stdout.write(self.style.WARNING(f'{unfixed} problem(s) need a manual fix'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from myapp.images import generate_for, needs_renditions
+from myapp.models import Part, VehicleModel
+
+
+class Command(BaseCommand):
+    help = 'Builds resized WebP/JPEG renditions for uploaded part and vehicle images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild renditions that already exist (e.g. after changing RENDITION_WIDTHS)'
+        )
+
+    def handle(self, *args, **options):
+        force = options['force']
+        for model in (VehicleModel, Part):
+            built = 0
+            uploads = model.objects.exclude(image='').exclude(image__isnull=True)
+            for instance in uploads.only('pk', 'image', 'image_renditions').iterator():
+                if not force and not needs_renditions(instance):
+                    continue
+                try:
+                    generate_for(model._meta.label, instance.pk, force=force)
+                except OSError as e:
+                    self.stderr.write(f'{model.__name__} {instance.pk}: {e}')
+                    continue
+                built += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'Built renditions for {built} {model._meta.verbose_name_plural}'
+            ))
@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from myapp.inventory_import import (
+    IMPORT_BATCH_SIZE, IMPORT_CHUNK_SIZE, InventoryImportError, import_inventory,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Sets stock quantities from a CSV keyed by vehicle_slug + part_slug (or part_number), '
+        'with columns quantity and optionally low_stock_threshold. Validates the whole file '
+        'first; writes nothing if a row is invalid unless --skip-invalid is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file to import')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+        parser.add_argument('--skip-invalid', action='store_true', help='Apply the valid rows even if some are invalid')
+        parser.add_argument('--show', type=int, default=20,
+                            help='Changes / errors to list (default 20, 0 for all)')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE,
+                            help=f'Rows validated per lookup query (default {IMPORT_CHUNK_SIZE})')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE,
+                            help=f'Rows written per transaction (default {IMPORT_BATCH_SIZE})')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        limit = options['show'] or None
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as f:
+                report = import_inventory(
+                    f,
+                    dry_run=options['dry_run'],
+                    skip_invalid=options['skip_invalid'],
+                    chunk_size=options['chunk_size'],
+                    batch_size=options['batch_size'],
+                )
+        except (OSError, InventoryImportError) as e:
+            raise CommandError(str(e))
+
+        for line in report.diff_lines(limit):
+            self.stdout.write(line)
+        for line, message in report.errors[:limit]:
+            self.stderr.write(f'line {line}: {message}')
+        for line in report.conflict_lines(limit):
+            self.stderr.write(line)
+
+        summary = f'{report.summary()} ({time.perf_counter() - started:.1f}s)'
+        if report.errors and not (report.applied or options['dry_run']):
+            raise CommandError(f'{summary}. Nothing was imported; fix the rows or use --skip-invalid')
+        self.stdout.write(self.style.SUCCESS(summary))
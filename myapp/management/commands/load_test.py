@@ -0,0 +1,152 @@
+import asyncio
+import json
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from myapp.models import Part, VehicleModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-tests a running server with concurrent keep-alive clients and reports '
+        'throughput and latency per concurrency level. Run it once against the WSGI '
+        'server and once against the ASGI server (ASYNC_CATALOG_VIEWS=True) to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server to test (http only)')
+        parser.add_argument('--concurrency', default='1,8,32,64',
+                            help='Comma separated client counts (default 1,8,32,64)')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per concurrency level')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path to request (repeatable); default: the catalog pages of one vehicle')
+        parser.add_argument('--cookie', default='',
+                            help='Cookie header, e.g. a staff sessionid to bypass the page cache')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+        parser.add_argument('--output', help='Also write the results as JSON to this file')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must look like http://host:port')
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma separated list of integers')
+        paths = options['paths'] or self._catalog_paths()
+
+        results = []
+        self.stdout.write(f"{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'errors':>8}")
+        for level in levels:
+            result = asyncio.run(self._run_level(
+                url.hostname, url.port or 80, paths, level,
+                options['requests'], options['cookie'], options['timeout'],
+            ))
+            results.append(result)
+            self.stdout.write(
+                f"{level:>8}{result['requests_per_second']:>10.1f}{result['p50_ms']:>10.1f}"
+                f"{result['p95_ms']:>10.1f}{result['errors']:>8}"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'url': options['url'], 'paths': paths, 'results': results}, f, indent=2)
+
+    def _catalog_paths(self):
+        vehicle = (
+            VehicleModel.objects.filter(is_active=True, available_parts_count__gt=0)
+            .order_by('-available_parts_count', 'pk').first()
+        )
+        if vehicle is None:
+            raise CommandError('No vehicle with stock; pass --path or run "manage.py seed_catalog"')
+        part = Part.objects.filter(vehicle_model=vehicle, is_active=True, stock__quantity__gt=0).first()
+        return [
+            reverse('myapp:home'),
+            reverse('myapp:vehicle_list'),
+            vehicle.get_absolute_url(),
+            part.get_absolute_url(),
+            f"{reverse('myapp:search')}?q={part.name.split()[0]}",
+        ]
+
+    async def _run_level(self, host, port, paths, concurrency, total, cookie, timeout):
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(paths[i % len(paths)])
+        timings = []
+        errors = 0
+
+        async def client():
+            nonlocal errors
+            reader = writer = None
+            while not queue.empty():
+                path = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                    status, keep_alive = await asyncio.wait_for(
+                        _request(reader, writer, host, path, cookie), timeout
+                    )
+                except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    if writer is not None:
+                        writer.close()
+                    reader = writer = None
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+                if status >= 400:
+                    errors += 1
+                if not keep_alive:
+                    writer.close()
+                    reader = writer = None
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        timings.sort()
+        return {
+            'concurrency': concurrency,
+            'requests': total,
+            'errors': errors,
+            'requests_per_second': round(len(timings) / elapsed, 2) if elapsed else 0.0,
+            'p50_ms': round(statistics.median(timings), 2) if timings else 0.0,
+            'p95_ms': round(timings[max(0, round(0.95 * len(timings)) - 1)], 2) if timings else 0.0,
+        }
+
+
+async def _request(reader, writer, host, path, cookie):
+    """One HTTP/1.1 GET on an open connection; returns (status, keep_alive)"""
+    headers = [f'GET {path} HTTP/1.1', f'Host: {host}', 'Connection: keep-alive']
+    if cookie:
+        headers.append(f'Cookie: {cookie}')
+    writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode())
+    await writer.drain()
+
+    status_line = await reader.readuntil(b'\r\n')
+    status = int(status_line.split()[1])
+    response_headers = {}
+    while True:
+        line = await reader.readuntil(b'\r\n')
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        response_headers[name.strip().lower()] = value.strip()
+
+    if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in response_headers:
+        await reader.readexactly(int(response_headers['content-length']))
+    else:
+        # No length: the body runs to the end of the connection
+        await reader.read()
+        return status, False
+    return status, response_headers.get('connection', '').lower() != 'close'
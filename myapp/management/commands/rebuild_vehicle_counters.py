@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from myapp.inventory import rebuild_vehicle_counters
+
+
+class Command(BaseCommand):
+    help = 'Recomputes available_parts_count / total_parts_count for every vehicle model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'vehicle_ids', nargs='*', type=int,
+            help='Only rebuild these vehicle model ids (default: all)'
+        )
+
+    def handle(self, *args, **options):
+        vehicle_ids = options['vehicle_ids'] or None
+        updated = rebuild_vehicle_counters(vehicle_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} vehicle model(s)'))
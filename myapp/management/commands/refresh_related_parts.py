@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from myapp.activity import POPULARITY_DAYS, refresh_popularity
+from myapp.related import rebuild_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes part popularity from recent views / inquiries and rebuilds every '
+        'related-parts ranking. Stock changes keep the rankings current in between; '
+        'run this nightly so popularity moves them too.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=POPULARITY_DAYS,
+                            help=f'Activity window for popularity (default {POPULARITY_DAYS})')
+
+    def handle(self, *args, **options):
+        changed = refresh_popularity(options['days'])
+        ranked = rebuild_all()
+        self.stdout.write(self.style.SUCCESS(
+            f'Popularity changed for {len(changed)} part(s); related parts changed for {ranked} part(s)'
+        ))
@@ -0,0 +1,209 @@
+import itertools
+import json
+import platform
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from myapp.models import Part, PartStock, VehicleModel
+
+
+class Rollback(Exception):
+    """Raised to undo everything the benchmark wrote"""
+
+
+class Command(BaseCommand):
+    help = (
+        'Times the public views and stock endpoints through the test client, writes '
+        'p50/p95 latency and query counts to JSON and fails on regressions against a baseline. '
+        'Seed data first with seed_catalog.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30, help='Timed requests per scenario (default 30)')
+        parser.add_argument('--output', default='benchmarks/results.json', help='Where to write the results')
+        parser.add_argument('--baseline', default='benchmarks/baseline.json', help='Results to compare against')
+        parser.add_argument('--update-baseline', action='store_true', help='Store these results as the baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed p95 slowdown vs the baseline, as a fraction (default 0.25)')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='Ignore p95 slowdowns smaller than this many ms (timer noise)')
+
+    def handle(self, *args, **options):
+        vehicle = (
+            VehicleModel.objects.filter(is_active=True, available_parts_count__gt=0)
+            .order_by('-available_parts_count', 'pk').first()
+        )
+        if vehicle is None:
+            raise CommandError('No vehicle with stock; run "manage.py seed_catalog" first')
+        part = Part.objects.filter(vehicle_model=vehicle, is_active=True, stock__quantity__gt=0).first()
+        stock_ids = list(PartStock.objects.filter(part__vehicle_model=vehicle).values_list('pk', flat=True)[:5])
+        # Crossing zero is the expensive write: counters and related parts move
+        toggle_id = (
+            PartStock.objects.filter(part__vehicle_model=vehicle, part__is_active=True, quantity=0)
+            .exclude(pk__in=stock_ids).values_list('pk', flat=True).first()
+        )
+
+        # The test client talks to "testserver". Related parts are re-ranked
+        # inline so the write scenarios include that cost: a worker thread
+        # could not see the rolled-back transaction's changes anyway.
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], RELATED_PARTS_ASYNC=False):
+            try:
+                with transaction.atomic():
+                    results = self._run(vehicle, part, stock_ids, toggle_id, options['iterations'])
+                    raise Rollback
+            except Rollback:
+                pass
+
+        report = {
+            'meta': {
+                'created': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'vehicles': VehicleModel.objects.count(),
+                'parts': Part.objects.count(),
+                'iterations': options['iterations'],
+            },
+            'results': results,
+        }
+        self._print(results)
+        self._write(options['output'], report)
+        if options['update_baseline']:
+            self._write(options['baseline'], report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline updated: {options['baseline']}"))
+            return
+
+        baseline_path = Path(options['baseline'])
+        if not baseline_path.exists():
+            self.stdout.write(f'No baseline at {baseline_path}; run with --update-baseline to store one')
+            return
+        regressions = self._compare(
+            json.loads(baseline_path.read_text())['results'], results,
+            options['tolerance'], options['min_delta_ms'],
+        )
+        if regressions:
+            for line in regressions:
+                self.stderr.write(line)
+            raise CommandError(f'{len(regressions)} benchmark regression(s)')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+
+    # -----------------------------
+    # Scenarios
+    # -----------------------------
+    def _scenarios(self, vehicle, part, stock_ids, toggle_id):
+        parts_url = reverse('myapp:parts_list', kwargs={'vehicle_slug': vehicle.slug})
+        public = [
+            ('home', reverse('myapp:home')),
+            ('vehicle_list', reverse('myapp:vehicle_list')),
+            ('parts_list', parts_url),
+            ('parts_list_filtered', f'{parts_url}?category={part.category}'),
+            ('part_detail', part.get_absolute_url()),
+            ('search', f"{reverse('myapp:search')}?q={part.name.split()[0]}"),
+            ('autocomplete', f"{reverse('myapp:autocomplete')}?q={vehicle.manufacturer[:3]}"),
+        ]
+        scenarios = []
+        for name, url in public:
+            # Anonymous requests are served from the page cache after the first;
+            # staff requests bypass it and measure the view itself
+            scenarios.append((name, 'anonymous', 'get', url, None))
+            scenarios.append((f'{name}_uncached', 'staff', 'get', url, None))
+
+        adjust = json.dumps({'adjustments': [{'stock_id': pk, 'delta': 1} for pk in stock_ids]})
+        scenarios.append(('stock_adjust_batch', 'staff', 'post', reverse('myapp:adjust_stock_batch'), adjust))
+        if toggle_id:
+            # Alternates 0 -> 1 -> 0, so every request crosses zero; runs
+            # before admin_increase_all lifts every quantity
+            scenarios.append(('stock_adjust_cross_zero', 'staff', 'post', reverse('myapp:adjust_stock_batch'), [
+                json.dumps({'adjustments': [{'stock_id': toggle_id, 'delta': delta}]}) for delta in (1, -1)
+            ]))
+        scenarios += [
+            ('admin_stock_grid', 'staff', 'get',
+             reverse('admin:myapp_vehiclemodel_stock_grid', args=[vehicle.pk]), None),
+            ('admin_increase_all', 'staff', 'post',
+             reverse('admin:myapp_vehiclemodel_increase_all_stock', args=[vehicle.pk]), {'delta': 1}),
+        ]
+        return scenarios
+
+    def _run(self, vehicle, part, stock_ids, toggle_id, iterations):
+        clients = {'anonymous': Client(), 'staff': Client()}
+        staff = User.objects.create_superuser('benchmark', 'benchmark@example.com', None)
+        clients['staff'].force_login(staff)
+
+        results = {}
+        for name, who, method, url, data in self._scenarios(vehicle, part, stock_ids, toggle_id):
+            client = clients[who]
+            # A list of JSON bodies is sent in turn
+            bodies = itertools.cycle(data) if isinstance(data, list) else itertools.repeat(data)
+
+            def request():
+                body = next(bodies)
+                # Everything runs in one transaction that is rolled back, so
+                # nothing commits: run the on_commit work (related parts,
+                # cache versions) as part of the request it belongs to
+                with TestCase.captureOnCommitCallbacks(execute=True):
+                    if method == 'post' and isinstance(body, str):
+                        return client.post(url, body, content_type='application/json')
+                    return getattr(client, method)(url, body or {})
+
+            request()  # warm-up: caches, lazy indexes, first-query costs
+            timings, queries, status = [], [], None
+            for _ in range(iterations):
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries.append(len(captured))
+                status = response.status_code
+            results[name] = {
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(_percentile(timings, 95), 3),
+                'mean_ms': round(statistics.fmean(timings), 3),
+                'queries': max(queries),
+                'status': status,
+            }
+        return results
+
+    # -----------------------------
+    # Reporting
+    # -----------------------------
+    def _print(self, results):
+        self.stdout.write(f"{'scenario':<28}{'p50 ms':>10}{'p95 ms':>10}{'queries':>9}{'status':>8}")
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<28}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+                f"{result['queries']:>9}{result['status']:>8}"
+            )
+
+    def _write(self, path, report):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=2) + '\n')
+
+    def _compare(self, baseline, results, tolerance, min_delta_ms):
+        regressions = []
+        for name, result in results.items():
+            before = baseline.get(name)
+            if before is None:
+                continue
+            if result['status'] != before['status']:
+                regressions.append(f"{name}: status {before['status']} -> {result['status']}")
+            if result['queries'] > before['queries']:
+                regressions.append(f"{name}: queries {before['queries']} -> {result['queries']}")
+            limit = max(before['p95_ms'] * (1 + tolerance), before['p95_ms'] + min_delta_ms)
+            if result['p95_ms'] > limit:
+                regressions.append(f"{name}: p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+        return regressions
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
@@ -0,0 +1,103 @@
+import random
+import secrets
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from myapp import related, search
+from myapp.inventory import rebuild_vehicle_counters
+from myapp.models import PartStock, VehicleModel
+from myapp.signals import provision_default_parts
+
+MANUFACTURERS = {
+    'car': ['Maruti Suzuki', 'Hyundai', 'Honda', 'Toyota', 'Tata', 'Mahindra', 'Kia', 'Ford'],
+    'bike': ['Hero', 'Bajaj', 'TVS', 'Royal Enfield', 'Yamaha', 'Suzuki', 'Honda', 'KTM'],
+}
+MODEL_NAMES = [
+    'Swift', 'City', 'Creta', 'Innova', 'Nexon', 'Scorpio', 'Seltos', 'EcoSport', 'Alto', 'i20',
+    'Splendor', 'Pulsar', 'Apache', 'Classic 350', 'FZ', 'Access', 'Shine', 'Duke', 'Jupiter', 'Activa',
+]
+
+
+class Command(BaseCommand):
+    help = 'Generates a synthetic catalog (vehicles, their default parts and random stock) for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vehicles', type=int, default=100, help='Vehicle models to create (default 100)')
+        parser.add_argument('--bike-ratio', type=float, default=0.4, help='Share of bikes (default 0.4)')
+        parser.add_argument('--out-of-stock', type=float, default=0.3,
+                            help='Share of parts left at quantity 0 (default 0.3)')
+        parser.add_argument('--chunk', type=int, default=250, help='Vehicles per transaction (default 250)')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for repeatable catalogs')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total = options['vehicles']
+        chunk_size = options['chunk']
+        # Keeps slugs unique across several seeding runs
+        run_token = secrets.token_hex(3)
+        started = time.perf_counter()
+
+        created_vehicles = created_parts = 0
+        # Related parts are ranked once at the end, not after every chunk
+        with related.refresh_suspended():
+            for offset in range(0, total, chunk_size):
+                count = min(chunk_size, total - offset)
+                with transaction.atomic():
+                    vehicles = self._create_vehicles(rng, offset, count, run_token, options['bike_ratio'])
+                    parts = provision_default_parts(vehicles)
+                    self._randomize_stock(rng, parts, options['out_of_stock'])
+                    rebuild_vehicle_counters([vehicle.pk for vehicle in vehicles])
+                created_vehicles += len(vehicles)
+                created_parts += len(parts)
+                self.stdout.write(
+                    f'  {created_vehicles}/{total} vehicles, {created_parts} parts '
+                    f'({time.perf_counter() - started:.1f}s)'
+                )
+
+        ranking_started = time.perf_counter()
+        related.rebuild_all()
+        self.stdout.write(f'  related parts ranked in {time.perf_counter() - ranking_started:.1f}s')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {created_vehicles} vehicles and {created_parts} parts in {elapsed:.1f}s'
+        ))
+
+    def _create_vehicles(self, rng, offset, count, run_token, bike_ratio):
+        vehicles = []
+        for i in range(offset, offset + count):
+            vehicle_type = 'bike' if rng.random() < bike_ratio else 'car'
+            manufacturer = rng.choice(MANUFACTURERS[vehicle_type])
+            name = f'{rng.choice(MODEL_NAMES)} {rng.choice("ABCDEFGHJK")}{i}'
+            year_from = rng.randint(1998, 2022)
+            vehicles.append(VehicleModel(
+                name=name,
+                vehicle_type=vehicle_type,
+                manufacturer=manufacturer,
+                year_from=year_from,
+                year_to=year_from + rng.randint(2, 8),
+                slug=slugify(f'{manufacturer} {name} {year_from} {run_token}'),
+            ))
+        # bulk_create skips post_save; provision_default_parts does its work
+        vehicles = VehicleModel.objects.bulk_create(vehicles, batch_size=500)
+        search.add_terms(*(f'{vehicle.manufacturer} {vehicle.name}' for vehicle in vehicles))
+        return vehicles
+
+    def _randomize_stock(self, rng, parts, out_of_stock):
+        # One UPDATE per distinct quantity rather than one per row
+        by_quantity = defaultdict(list)
+        for part in parts:
+            quantity = 0 if rng.random() < out_of_stock else rng.randint(1, 10)
+            by_quantity[quantity].append(part.pk)
+        now = timezone.now()
+        for quantity, part_ids in by_quantity.items():
+            if not quantity:
+                continue
+            for start in range(0, len(part_ids), 900):
+                PartStock.objects.filter(part_id__in=part_ids[start:start + 900]).update(
+                    quantity=quantity, updated_at=now, last_restocked=now
+                )
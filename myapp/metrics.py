@@ -0,0 +1,425 @@
+"""
+Request metrics in Prometheus text format
+
+MetricsMiddleware records, per URL name:
+
+- request count (by method / status) and latency histogram
+- DB query count and time (a connection execute wrapper that reports
+  to the current request through a context variable, so queries run
+  via sync_to_async under ASGI are counted too)
+- page cache hits / misses (the X-Page-Cache header)
+
+and InstrumentedDjangoTemplates (the TEMPLATES backend) adds a render
+time histogram per template.
+
+Each process keeps its series in memory (a dict update per request) and
+writes a snapshot to METRICS_DIR/<pid>-<start time>.json at most every
+METRICS_FLUSH_INTERVAL seconds. The /metrics view sums the snapshots of
+all worker processes, so it works the same with one gunicorn worker or
+many, without a metrics server.
+
+The start time in the name keeps a new worker that reuses an old pid
+from overwriting its predecessor's totals. On scrape, snapshots of
+exited workers are merged into METRICS_DIR/retired.json and removed, so
+counters never go down and the directory does not grow with every
+restarted worker. A worker counts as exited when its pid is gone or a
+newer snapshot has the same pid, so METRICS_DIR must not be shared
+between hosts or containers.
+"""
+import contextvars
+import fcntl
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'myapp_http_requests_total': ('counter', 'Requests by URL name, method and status'),
+    'myapp_http_request_duration_seconds': ('histogram', 'Request latency by URL name'),
+    'myapp_db_queries_total': ('counter', 'Database queries by URL name'),
+    'myapp_db_query_duration_seconds_total': ('counter', 'Time spent in database queries by URL name'),
+    'myapp_template_render_duration_seconds': ('histogram', 'Template render time by template'),
+    'myapp_page_cache_requests_total': ('counter', 'Catalog page cache lookups by URL name and result'),
+    'myapp_log_records_dropped_total': ('counter', 'Log records dropped because the log queue was full'),
+}
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None) or os.path.join(tempfile.gettempdir(), 'myapp-metrics')
+
+
+def _flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 10)
+
+
+RETIRED_SNAPSHOT = 'retired.json'
+
+
+class Registry:
+    """In-process counters and histograms, keyed by (name, labels)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self._flushed_at = 0.0
+        self._pid = None
+        self._started = None
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self.counters[self._key(name, labels)] += amount
+
+    def observe(self, name, labels, value):
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {
+                    'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0,
+                }
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    histogram['buckets'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [
+                    [name, list(labels), dict(h, buckets=list(h['buckets']))]
+                    for (name, labels), h in self.histograms.items()
+                ],
+            }
+
+    def snapshot_name(self):
+        """<pid>-<start time>.json; the start time is taken per process, so also after a fork"""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._pid, self._started = pid, time.time_ns()
+        return f'{pid}-{self._started}.json'
+
+    def flush(self, force=False):
+        """Write this process's snapshot for /metrics (rate limited)"""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < _flush_interval():
+            return
+        self._flushed_at = now
+        directory = _metrics_dir()
+        path = os.path.join(directory, self.snapshot_name())
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_json(path, self.snapshot())
+        except OSError:
+            # Metrics must never break a request
+            logger.warning("Could not write metrics snapshot to %s", path, exc_info=True)
+
+
+registry = Registry()
+
+
+def _write_json(path, data):
+    """Replace ``path`` atomically, so readers never see half a file"""
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+# -----------------------------
+# Collection
+# -----------------------------
+class QueryCounter:
+    """execute_wrapper that counts queries and their time"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+_request_queries = contextvars.ContextVar('request_queries', default=None)
+
+
+def _count_request_query(execute, sql, params, many, context):
+    counter = _request_queries.get()
+    if counter is None:
+        return execute(sql, params, many, context)
+    return counter(execute, sql, params, many, context)
+
+
+def install_query_counter(connection, **kwargs):
+    """Add the per-request query counter to a connection (once)"""
+    if _count_request_query not in connection.execute_wrappers:
+        # At the front: execute_wrapper() blocks pop from the end
+        connection.execute_wrappers.insert(0, _count_request_query)
+
+
+connection_created.connect(install_query_counter)
+
+
+class MetricsMiddleware:
+    """Records latency, query and page cache metrics per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported
+        for connection in connections.all(initialized_only=True):
+            install_query_counter(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        token = _request_queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        token = _request_queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_queries.reset(token)
+        self.record(request, response, time.perf_counter() - start, counter)
+        return response
+
+    def record(self, request, response, elapsed, counter):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        labels = {'view': view}
+        registry.inc('myapp_http_requests_total', {
+            'view': view, 'method': request.method, 'status': str(response.status_code),
+        })
+        registry.observe('myapp_http_request_duration_seconds', labels, elapsed)
+        registry.inc('myapp_db_queries_total', labels, counter.count)
+        registry.inc('myapp_db_query_duration_seconds_total', labels, counter.duration)
+        page_cache = response.get('X-Page-Cache')
+        if page_cache:
+            registry.inc('myapp_page_cache_requests_total', {'view': view, 'result': page_cache})
+
+        registry.flush()
+
+
+class InstrumentedTemplate:
+    """Wraps a backend template to time render()"""
+
+    def __init__(self, template, name):
+        self.template = template
+        self.name = name
+
+    @property
+    def origin(self):
+        return self.template.origin
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            registry.observe(
+                'myapp_template_render_duration_seconds',
+                {'template': self.name},
+                time.perf_counter() - start,
+            )
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that records render time per template"""
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name), template_name)
+
+
+# -----------------------------
+# Exposition
+# -----------------------------
+def _worker(filename):
+    """(pid, start time) of a worker snapshot file name; None for other files"""
+    stem, ext = os.path.splitext(filename)
+    pid, _, started = stem.partition('-')
+    # Snapshots written before start times were added are just <pid>.json
+    if ext != '.json' or not pid.isdigit() or not (started.isdigit() or not started):
+        return None
+    return int(pid), int(started or 0)
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, owned by another user
+        return True
+    return True
+
+
+def _sum_snapshots(snapshots):
+    """Add up snapshots into ({(name, labels): value}, {(name, labels): histogram})"""
+    counters = defaultdict(float)
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, h in snapshot['histograms']:
+            key = name, tuple(map(tuple, labels))
+            total = histograms.setdefault(key, {'buckets': [0] * len(LATENCY_BUCKETS), 'sum': 0.0, 'count': 0})
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], h['buckets'])]
+            total['sum'] += h['sum']
+            total['count'] += h['count']
+    return counters, histograms
+
+
+def _retire_exited_workers(directory):
+    """
+    Fold the snapshots of exited workers into RETIRED_SNAPSHOT and delete
+    them (called with the scrape lock held)
+    """
+    workers = {filename: _worker(filename) for filename in os.listdir(directory)}
+    workers = {filename: worker for filename, worker in workers.items() if worker}
+    newest = {}
+    for pid, started in workers.values():
+        newest[pid] = max(newest.get(pid, 0), started)
+    exited = [
+        filename for filename, (pid, started) in workers.items()
+        if started < newest[pid] or not _is_running(pid)
+    ]
+    if not exited:
+        return
+
+    retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+    snapshots = []
+    if os.path.exists(retired_path):
+        with open(retired_path) as f:
+            snapshots.append(json.load(f))
+    merged = []
+    for filename in exited:
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except ValueError:
+            logger.warning("Skipping unreadable metrics snapshot %s", filename)
+            continue
+        merged.append(filename)
+    counters, histograms = _sum_snapshots(snapshots)
+    _write_json(retired_path, {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), h] for (name, labels), h in histograms.items()],
+    })
+    for filename in merged:
+        os.remove(os.path.join(directory, filename))
+
+
+def _read_snapshots():
+    """
+    Snapshots of every worker process (this one freshly flushed). If
+    METRICS_DIR cannot be used, just this process's, so /metrics still
+    answers.
+    """
+    registry.flush(force=True)
+    directory = _metrics_dir()
+    try:
+        lock = open(os.path.join(directory, '.scrape.lock'), 'w')
+    except OSError:
+        logger.warning("Could not read metrics snapshots in %s; serving this process only",
+                       directory, exc_info=True)
+        return [registry.snapshot()]
+    # One scrape at a time, so none reads a worker's snapshot and also
+    # the retired totals it was just merged into
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            _retire_exited_workers(directory)
+        except (OSError, ValueError):
+            # Retiring is housekeeping; the snapshots are summed either way
+            logger.warning("Could not retire old metrics snapshots in %s", directory, exc_info=True)
+        snapshots = []
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Mid-write or removed; it will be there next scrape
+                continue
+    return snapshots
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render_metrics():
+    """All processes' metrics, summed, in Prometheus text format"""
+    counters, histograms = _sum_snapshots(_read_snapshots())
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        if kind == 'counter':
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+            continue
+        for (series, labels), h in sorted(histograms.items()):
+            if series != name:
+                continue
+            for bound, count in zip(LATENCY_BUCKETS, h['buckets']):
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", f"{bound:g}"),))} {count}')
+            lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {h["count"]}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {h["sum"]:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {h["count"]}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,39 @@
+"""
+Middleware that runs natively under both WSGI and ASGI
+
+Django runs a sync-only middleware in a thread and the rest of the
+stack behind it through async_to_sync, so a single sync middleware costs
+every ASGI request a thread for its whole duration. The async views in
+myapp/async_views.py only pay off if nothing in MIDDLEWARE does that.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise with an async code path (the file lookup is a dict hit)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens the file; keep that off the event loop
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
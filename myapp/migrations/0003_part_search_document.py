@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+def populate_search_documents(apps, schema_editor):
+    Part = apps.get_model('myapp', 'Part')
+    parts = list(Part.objects.select_related('vehicle_model'))
+    for part in parts:
+        vehicle = part.vehicle_model
+        part.search_document = ' '.join(filter(None, [
+            part.name, part.category, part.part_number, vehicle.manufacturer, vehicle.name,
+        ]))
+    Part.objects.bulk_update(parts, ['search_document'], batch_size=500)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS myapp_part_search_gin ON myapp_part "
+            "USING GIN (to_tsvector('simple', search_document))"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS myapp_part_fts "
+            "USING fts5(document, tokenize='unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            "INSERT INTO myapp_part_fts(rowid, document) "
+            "SELECT id, search_document FROM myapp_part"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS myapp_part_search_gin")
+    elif vendor == 'sqlite':
+        schema_editor.execute("DROP TABLE IF EXISTS myapp_part_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_remove_partstock_id_alter_part_category_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='search_document',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
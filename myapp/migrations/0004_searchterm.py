@@ -0,0 +1,60 @@
+import re
+
+from django.db import migrations, models
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def populate_search_terms(apps, schema_editor):
+    SearchTerm = apps.get_model('myapp', 'SearchTerm')
+    Part = apps.get_model('myapp', 'Part')
+    VehicleModel = apps.get_model('myapp', 'VehicleModel')
+
+    terms = set()
+    for row in Part.objects.values_list('name', 'category').distinct():
+        terms.update(TOKEN_RE.findall(' '.join(row).lower()))
+    for row in VehicleModel.objects.values_list('name', 'manufacturer').distinct():
+        terms.update(TOKEN_RE.findall(' '.join(row).lower()))
+    SearchTerm.objects.bulk_create(
+        [SearchTerm(term=term) for term in terms if len(term) > 1 and not term.isdigit()],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def create_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS myapp_searchterm_trgm ON myapp_searchterm "
+            "USING GIST (term gist_trgm_ops)"
+        )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS myapp_searchterm_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_part_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=100, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Search Term',
+                'verbose_name_plural': 'Search Terms',
+                'ordering': ['term'],
+            },
+        ),
+        migrations.RunPython(populate_search_terms, migrations.RunPython.noop),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
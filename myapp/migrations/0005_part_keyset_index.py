@@ -0,0 +1,17 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_searchterm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['vehicle_model', 'category', 'name', 'id'], name='myapp_part_keyset_idx'),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:11
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    VehicleModel = apps.get_model('myapp', 'VehicleModel')
+    Part = apps.get_model('myapp', 'Part')
+
+    def count_subquery(**filters):
+        return Subquery(
+            Part.objects.filter(vehicle_model=OuterRef('pk'), **filters)
+            .order_by()
+            .values('vehicle_model')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+
+    VehicleModel.objects.update(
+        available_parts_count=Coalesce(count_subquery(is_active=True, stock__quantity__gt=0), Value(0)),
+        total_parts_count=Coalesce(count_subquery(), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_part_keyset_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehiclemodel',
+            name='available_parts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='vehiclemodel',
+            name='total_parts_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_vehiclemodel_parts_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partstock',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
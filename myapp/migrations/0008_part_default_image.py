@@ -0,0 +1,129 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:20
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of myapp.part_images as of this migration, so later edits to
+# the table (or the module) cannot change what this migration does
+DEFAULT_PART_IMAGES = {
+    'ac compressor': 'images/parts/ac-compressor.jpg',
+    'bonnet': 'images/parts/bonnet.jpg',
+    'boot lid': 'images/parts/boot-lid.jpg',
+    'front bumper': 'images/parts/bumper-front.jpg',
+    'rear bumper': 'images/parts/bumper-rear.jpg',
+    'front left door': 'images/parts/door.jpg',
+    'front right door': 'images/parts/door.jpg',
+    'rear left door': 'images/parts/door.jpg',
+    'rear right door': 'images/parts/door.jpg',
+    'front left fender': 'images/parts/fender.jpg',
+    'front right fender': 'images/parts/fender.jpg',
+    'side mirror left': 'images/parts/side-mirror.jpg',
+    'side mirror right': 'images/parts/side-mirror.jpg',
+    'radiator': 'images/parts/radiator.jpg',
+    'alternator': 'images/parts/alternator.jpg',
+    'battery': 'images/parts/battery.jpg',
+    'headlight left': 'images/parts/headlight.jpg',
+    'headlight right': 'images/parts/headlight.jpg',
+    'tail light left': 'images/parts/taillight.jpg',
+    'tail light right': 'images/parts/taillight.jpg',
+    'starter motor': 'images/parts/starter-motor.jpg',
+    'wiper motor': 'images/parts/wiper-motor.jpg',
+    'engine': 'images/parts/engine.jpg',
+    'catalytic converter': 'images/parts/catalytic-converter.jpg',
+    'exhaust system': 'images/parts/exhaust-system.jpg',
+    'fuel pump': 'images/parts/fuel-pump.jpg',
+    'windshield': 'images/parts/windshield.jpg',
+    'rear windshield': 'images/parts/rear-windshield.jpg',
+    'front left window': 'images/parts/window.jpg',
+    'front right window': 'images/parts/window.jpg',
+    'rear left window': 'images/parts/window.jpg',
+    'rear right window': 'images/parts/window.jpg',
+    'dashboard': 'images/parts/dashboard.jpg',
+    'steering wheel': 'images/parts/steering-wheel.jpg',
+    'front seats': 'images/parts/car-seat.jpg',
+    'rear seats': 'images/parts/car-seat.jpg',
+    'suspension (front)': 'images/parts/suspension.jpg',
+    'suspension (rear)': 'images/parts/suspension.jpg',
+    'gearbox': 'images/parts/gearbox.jpg',
+    'alloy wheels (set of 4)': 'images/parts/alloy-wheel.jpg',
+    'spare wheel': 'images/parts/alloy-wheel.jpg',
+    'fuel tank': 'images/parts/bike-fuel-tank.jpg',
+    'front fender': 'images/parts/bike-fender.jpg',
+    'rear fender': 'images/parts/bike-fender.jpg',
+    'side panel left': 'images/parts/bike-side-panel.jpg',
+    'side panel right': 'images/parts/bike-side-panel.jpg',
+    'tail panel': 'images/parts/bike-tail-panel.jpg',
+    'seat': 'images/parts/bike-seat.jpg',
+    'footrest left': 'images/parts/bike-footrest.jpg',
+    'footrest right': 'images/parts/bike-footrest.jpg',
+    'stand (main)': 'images/parts/bike-stand.jpg',
+    'stand (side)': 'images/parts/bike-stand.jpg',
+    'headlight': 'images/parts/bike-headlight.jpg',
+    'tail light': 'images/parts/bike-taillight.jpg',
+    'indicator lights (set)': 'images/parts/bike-indicator.jpg',
+    'spark plug': 'images/parts/spark-plug.jpg',
+    'cdi unit': 'images/parts/cdi-unit.jpg',
+    'wiring harness': 'images/parts/wiring-harness.jpg',
+    'speedometer': 'images/parts/speedometer.jpg',
+    'handlebar': 'images/parts/handlebar.jpg',
+    'handle grips': 'images/parts/handle-grips.jpg',
+    'clutch lever': 'images/parts/clutch-lever.jpg',
+    'brake lever': 'images/parts/brake-lever.jpg',
+    'throttle assembly': 'images/parts/throttle.jpg',
+    'front wheel': 'images/parts/bike-wheel.jpg',
+    'rear wheel': 'images/parts/bike-wheel.jpg',
+    'front tyre': 'images/parts/bike-tyre.jpg',
+    'rear tyre': 'images/parts/bike-tyre.jpg',
+    'front brake disc': 'images/parts/brake-disc.jpg',
+    'rear brake disc': 'images/parts/brake-disc.jpg',
+    'front brake caliper': 'images/parts/brake-caliper.jpg',
+    'rear brake caliper': 'images/parts/brake-caliper.jpg',
+    'carburetor': 'images/parts/carburetor.jpg',
+    'exhaust pipe': 'images/parts/exhaust-pipe.jpg',
+    'silencer': 'images/parts/silencer.jpg',
+    'chain': 'images/parts/bike-chain.jpg',
+    'sprocket set': 'images/parts/sprocket.jpg',
+    'front fork': 'images/parts/front-fork.jpg',
+    'rear shock absorber': 'images/parts/shock-absorber.jpg',
+}
+PLACEHOLDER_IMAGE = 'images/parts/placeholder.jpg'
+_CONTAINED_RE = re.compile('|'.join(
+    re.escape(keyword) for keyword in sorted(DEFAULT_PART_IMAGES, key=len, reverse=True)
+))
+
+
+def _resolve(text):
+    text = (text or '').lower().strip()
+    if not text:
+        return None
+    if text in DEFAULT_PART_IMAGES:
+        return DEFAULT_PART_IMAGES[text]
+    match = _CONTAINED_RE.search(text)
+    if match:
+        return DEFAULT_PART_IMAGES[match.group()]
+    keyword = next((keyword for keyword in DEFAULT_PART_IMAGES if text in keyword), None)
+    return DEFAULT_PART_IMAGES[keyword] if keyword else None
+
+
+def populate_default_images(apps, schema_editor):
+    Part = apps.get_model('myapp', 'Part')
+    parts = list(Part.objects.only('id', 'name', 'category'))
+    for part in parts:
+        part.default_image = _resolve(part.name) or _resolve(part.category) or PLACEHOLDER_IMAGE
+    Part.objects.bulk_update(parts, ['default_image'], batch_size=500)
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_partstock_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='default_image',
+            field=models.CharField(blank=True, editable=False, max_length=200),
+        ),
+        migrations.RunPython(populate_default_images, migrations.RunPython.noop),
+    ]
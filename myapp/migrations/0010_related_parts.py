@@ -0,0 +1,55 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0009_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='ranked_in_stock',
+            field=models.BooleanField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='PartActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('inquiries', models.PositiveIntegerField(default=0)),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='myapp.part')),
+            ],
+            options={
+                'verbose_name': 'Part Activity',
+                'verbose_name_plural': 'Part Activity',
+                'indexes': [models.Index(fields=['day'], name='myapp_parta_day_b4ea89_idx')],
+                'constraints': [models.UniqueConstraint(fields=('part', 'day'), name='myapp_partactivity_part_day_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RelatedPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_entries', to='myapp.part')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='myapp.part')),
+            ],
+            options={
+                'verbose_name': 'Related Part',
+                'verbose_name_plural': 'Related Parts',
+                'ordering': ['part', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('part', 'rank'), name='myapp_relatedpart_part_rank_uniq')],
+            },
+        ),
+    ]
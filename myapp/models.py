@@ -1,7 +1,9 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
 from django.core.validators import MinValueValidator
 
+from .part_images import default_image_for
+
 
 class VehicleModel(models.Model):
     """Represents a specific car or bike model"""
@@ -17,7 +19,12 @@ class VehicleModel(models.Model):
     year_to = models.PositiveIntegerField(null=True, blank=True)
     slug = models.SlugField(max_length=250, unique=True)
     image = models.ImageField(upload_to='vehicles/', null=True, blank=True)
+    # Resized copies of ``image`` and its dimensions (see images.py)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
+    # Denormalized counters, maintained by signals (see myapp/inventory.py)
+    available_parts_count = models.PositiveIntegerField(default=0, editable=False)
+    total_parts_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -29,6 +36,45 @@ class VehicleModel(models.Model):
     def __str__(self):
         return f"{self.manufacturer} {self.name} ({self.vehicle_type.upper()})"
     
+    COUNTER_FIELDS = ('available_parts_count', 'total_parts_count')
+    # Fields whose value before a save the post_save handlers compare against
+    TRACKED_FIELDS = ('slug', 'name', 'manufacturer')
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values so signals can detect changes"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """
+        Never write the denormalized counters from a (possibly stale)
+        instance; they are only changed with F() updates
+        """
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        # Read by the post_save handlers, e.g. to forget a renamed slug
+        self._previous_values = self._tracked_values_in_db()
+        super().save(*args, **kwargs)
+        self._loaded_values = {
+            field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields
+        }
+    
+    def _tracked_values_in_db(self):
+        """TRACKED_FIELDS as the row holds them now; None for a new vehicle"""
+        if self._state.adding:
+            return None
+        loaded = getattr(self, '_loaded_values', {})
+        if all(name in loaded for name in self.TRACKED_FIELDS):
+            return {name: loaded[name] for name in self.TRACKED_FIELDS}
+        # Saved without being loaded first, or with deferred fields
+        return type(self)._base_manager.filter(pk=self.pk).values(*self.TRACKED_FIELDS).first()
+    
     def get_absolute_url(self):
         return reverse('myapp:parts_list', kwargs={'vehicle_slug': self.slug})
 
@@ -42,8 +88,18 @@ class Part(models.Model):
     description = models.TextField(blank=True)
     condition = models.CharField(max_length=50, default='Used - Good')
     image = models.ImageField(upload_to='parts/', null=True, blank=True)
+    # Resized copies of ``image`` and its dimensions (see images.py)
+    image_renditions = models.JSONField(default=dict, blank=True, editable=False)
     slug = models.SlugField(max_length=250)
     is_active = models.BooleanField(default=True)
+    # Denormalized text for the full-text index (see myapp/search.py)
+    search_document = models.TextField(blank=True, editable=False)
+    # Static path of the stock photo used when there is no upload (see part_images)
+    default_image = models.CharField(max_length=200, blank=True, editable=False)
+    # Recent views / inquiries, refreshed by "manage.py refresh_related_parts"
+    popularity = models.FloatField(default=0, editable=False)
+    # In-stock state the RelatedPart rankings last saw; None = not ranked yet
+    ranked_in_stock = models.BooleanField(null=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -55,11 +111,42 @@ class Part(models.Model):
         indexes = [
             models.Index(fields=['vehicle_model', 'category']),
             models.Index(fields=['slug']),
+            # Keyset pagination of parts_list seeks on (category, name, id)
+            models.Index(fields=['vehicle_model', 'category', 'name', 'id'], name='myapp_part_keyset_idx'),
         ]
     
     def __str__(self):
         return f"{self.name} - {self.vehicle_model}"
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values so signals can detect transitions"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Keep the search document and default image in sync with the fields they derive from"""
+        self.search_document = self.build_search_document()
+        self.default_image = default_image_for(self.name, self.category)
+        # Atomic so the counter updates in post_save commit with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+    
+    def build_search_document(self, vehicle=None):
+        """
+        Text indexed for search: name, category, part number,
+        manufacturer and model name
+        """
+        vehicle = vehicle or self.vehicle_model
+        return ' '.join(filter(None, [
+            self.name,
+            self.category,
+            self.part_number,
+            vehicle.manufacturer,
+            vehicle.name,
+        ]))
+    
     def get_absolute_url(self):
         return reverse('myapp:part_detail', kwargs={
             'vehicle_slug': self.vehicle_model.slug,
@@ -121,6 +208,8 @@ class PartStock(models.Model):
     low_stock_threshold = models.PositiveIntegerField(default=2)
     last_restocked = models.DateTimeField(null=True, blank=True)
     notes = models.TextField(blank=True)
+    # Bulk F() updates must set this explicitly (auto_now only runs on save)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         verbose_name = 'Part Stock'
@@ -139,11 +228,20 @@ class PartStock(models.Model):
         """Returns True if in stock but below threshold"""
         return 0 < self.quantity <= self.low_stock_threshold
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember loaded values so signals can detect transitions"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+    
     def save(self, *args, **kwargs):
         """Override save to ensure quantity is never None"""
         if self.quantity is None:
             self.quantity = 0
-        super().save(*args, **kwargs)
+        # Atomic so the counter updates in post_save commit with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
 
 class VehicleStock(models.Model):
@@ -167,4 +265,69 @@ class VehicleStock(models.Model):
         verbose_name_plural = 'Vehicle Stocks'
     
     def __str__(self):
-        return f"{self.vehicle_model} - {self.chassis_number} ({self.year})"
\ No newline at end of file
+        return f"{self.vehicle_model} - {self.chassis_number} ({self.year})"
+    
+    def save(self, *args, **kwargs):
+        # Atomic so the stock increment in post_save commits with the row
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+
+class SearchTerm(models.Model):
+    """
+    Vocabulary of words used in part names, categories, vehicle names and
+    manufacturers. Typo-tolerant search matches query words against this
+    table by trigram similarity (see myapp/search.py)
+    """
+    term = models.CharField(max_length=100, unique=True)
+    
+    class Meta:
+        ordering = ['term']
+        verbose_name = 'Search Term'
+        verbose_name_plural = 'Search Terms'
+    
+    def __str__(self):
+        return self.term
+
+
+class PartActivity(models.Model):
+    """Views and WhatsApp inquiries of a part per day (feeds Part.popularity)"""
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='activity')
+    day = models.DateField()
+    views = models.PositiveIntegerField(default=0)
+    inquiries = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        verbose_name = 'Part Activity'
+        verbose_name_plural = 'Part Activity'
+        constraints = [
+            models.UniqueConstraint(fields=['part', 'day'], name='myapp_partactivity_part_day_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day']),
+        ]
+    
+    def __str__(self):
+        return f"{self.part_id} {self.day}: {self.views} views, {self.inquiries} inquiries"
+
+
+class RelatedPart(models.Model):
+    """
+    Precomputed recommendations shown on a part's detail page, best
+    first (see myapp/related.py)
+    """
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    
+    class Meta:
+        ordering = ['part', 'rank']
+        verbose_name = 'Related Part'
+        verbose_name_plural = 'Related Parts'
+        constraints = [
+            # Also the index part_detail reads through
+            models.UniqueConstraint(fields=['part', 'rank'], name='myapp_relatedpart_part_rank_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.part_id} -> {self.related_id} (#{self.rank})"
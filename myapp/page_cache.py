@@ -0,0 +1,216 @@
+"""
+Versioned page cache for the public catalog views
+
+Rendered responses are stored under the request URL plus a version
+counter:
+
+- home / vehicle_list use the global catalog version
+- parts_list / part_detail use the version of their vehicle
+
+The Part / PartStock / VehicleModel signal handlers bump the versions
+(after commit), so a stock change makes the old pages unreachable
+immediately and they simply age out of the cache. The versions must be
+seen by every worker, so the cache is only used with a shared backend
+(CATALOG_PAGE_CACHE, on when CACHE_URL is set; see settings.py). The
+decorator wraps sync and async views alike.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from . import db_router
+from .models import VehicleModel
+from .pagination import wants_fragment
+
+CATALOG_VERSION_KEY = 'catalog:version'
+VEHICLE_VERSION_KEY = 'catalog:vehicle:{}:version'
+VEHICLE_SLUG_KEY = 'catalog:vehicle-slug:{}'
+PAGE_KEY = 'catalog:page:{}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def page_timeout():
+    return getattr(settings, 'CATALOG_PAGE_CACHE_TIMEOUT', 60 * 60)
+
+
+def is_enabled():
+    return getattr(settings, 'CATALOG_PAGE_CACHE', False)
+
+
+def _fresh_version():
+    # Not 0: an evicted counter must never come back as an old value
+    return time.time_ns()
+
+
+def _get_versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _fresh_version(), None)
+            versions[key] = cache.get(key)
+    return versions
+
+
+def bump_versions(vehicle_ids=()):
+    """
+    Invalidate the catalog pages (and those of the given vehicles).
+    A version is the time of the change, so readers can tell a recent
+    one (see _lookup).
+    """
+    keys = [CATALOG_VERSION_KEY] + [VEHICLE_VERSION_KEY.format(pk) for pk in set(vehicle_ids) if pk]
+    get_cache().set_many(dict.fromkeys(keys, _fresh_version()), None)
+
+
+def forget_vehicle_slugs(slugs):
+    """Drop cached slug -> id mappings (slug changed or vehicle deleted)"""
+    get_cache().delete_many([VEHICLE_SLUG_KEY.format(slug) for slug in set(slugs) if slug])
+
+
+def _vehicle_id_for_slug(slug):
+    cache = get_cache()
+    key = VEHICLE_SLUG_KEY.format(slug)
+    vehicle_id = cache.get(key)
+    if vehicle_id is None:
+        vehicle_id = VehicleModel.objects.filter(slug=slug).values_list('id', flat=True).first()
+        if vehicle_id is None:
+            return None
+        cache.set(key, vehicle_id, None)
+    return vehicle_id
+
+
+def current_version(vehicle_id=None):
+    """Version of one vehicle's pages, or of the catalog-wide pages"""
+    key = VEHICLE_VERSION_KEY.format(vehicle_id) if vehicle_id else CATALOG_VERSION_KEY
+    return _get_versions([key])[key]
+
+
+def read_primary_if_recent(version):
+    """
+    Read from the primary database if ``version`` is only moments old:
+    a replica may not have the change yet, and whatever is rendered now
+    stays cached until the next change.
+    """
+    if time.time_ns() - version < db_router.pin_seconds() * 1_000_000_000:
+        db_router.read_from_primary()
+
+
+def _page_version(vehicle_slug=None):
+    """Current catalog / vehicle version; None for an unknown vehicle"""
+    if not vehicle_slug:
+        return current_version()
+    vehicle_id = _vehicle_id_for_slug(vehicle_slug)
+    if vehicle_id is None:
+        return None
+    return current_version(vehicle_id)
+
+
+def _page_key(request, version):
+    # The "load more" JSON shares its URL with the page (wants_fragment)
+    variant = 'fragment' if wants_fragment(request) else 'page'
+    url = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return PAGE_KEY.format(f'{url}:{variant}:{version}')
+
+
+def page_key(request, vehicle_slug=None):
+    """Cache key for this URL at the current catalog / vehicle version"""
+    version = _page_version(vehicle_slug)
+    if version is None:
+        return None
+    return _page_key(request, version)
+
+
+def _is_cacheable_method(request):
+    return request.method in ('GET', 'HEAD')
+
+
+def _is_cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'no-store' not in response.get('Cache-Control', '')
+    )
+
+
+def _lookup(request, vehicle_slug):
+    """(key, cached) for this request; key is None for unknown vehicles"""
+    version = _page_version(vehicle_slug)
+    if version is None:
+        return None, None
+    read_primary_if_recent(version)
+    key = _page_key(request, version)
+    return key, get_cache().get(key)
+
+
+def _cached_response(cached):
+    content, headers = cached
+    response = HttpResponse(content, headers=headers)
+    response['X-Page-Cache'] = 'hit'
+    return response
+
+
+def _store(key, response):
+    patch_vary_headers(response, ['X-Requested-With'])
+    if _is_cacheable_response(response):
+        get_cache().set(key, (response.content, dict(response.items())), page_timeout())
+        response['X-Page-Cache'] = 'miss'
+
+
+def _bypass(request):
+    return not is_enabled() or not _is_cacheable_method(request)
+
+
+def cache_catalog_page(view_func):
+    """
+    Serve anonymous GETs of a catalog view from the page cache.
+    Views taking ``vehicle_slug`` are keyed on that vehicle's version.
+    """
+    if iscoroutinefunction(view_func):
+        return _cache_async_catalog_page(view_func)
+
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if _bypass(request) or request.user.is_authenticated:
+            return view_func(request, *args, **kwargs)
+
+        key, cached = _lookup(request, kwargs.get('vehicle_slug'))
+        if key is None:
+            return view_func(request, *args, **kwargs)
+        if cached is not None:
+            return _cached_response(cached)
+
+        response = view_func(request, *args, **kwargs)
+        _store(key, response)
+        return response
+
+    return wrapper
+
+
+def _cache_async_catalog_page(view_func):
+    @wraps(view_func)
+    async def wrapper(request, *args, **kwargs):
+        if _bypass(request) or (await request.auser()).is_authenticated:
+            return await view_func(request, *args, **kwargs)
+
+        # Version lookups and the page read in one trip to the sync thread
+        key, cached = await sync_to_async(_lookup)(request, kwargs.get('vehicle_slug'))
+        if key is None:
+            return await view_func(request, *args, **kwargs)
+        if cached is not None:
+            return _cached_response(cached)
+
+        response = await view_func(request, *args, **kwargs)
+        await sync_to_async(_store)(key, response)
+        return response
+
+    return wrapper
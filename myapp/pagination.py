@@ -0,0 +1,93 @@
+"""
+Cursor (keyset) pagination helpers
+
+A cursor is the sort key of the last row on the previous page, so the
+next page is a "WHERE key > cursor ORDER BY key LIMIT n" seek: deep pages
+cost the same as the first one, unlike OFFSET.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+
+PAGE_SIZE = 24
+
+
+def encode_cursor(values):
+    """Opaque, URL-safe token for a list of sort key values"""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, converters):
+    """
+    Inverse of encode_cursor: ``converters`` turn each decoded value back
+    into its type (e.g. int, or a model field's to_python). Returns None
+    for a missing or tampered token so callers simply fall back to the
+    first page.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(converters) or None in values:
+        return None
+    try:
+        return [convert(value) for convert, value in zip(converters, values)]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def _field_converter(model, path):
+    """to_python of the model field behind an ordering like 'stock__quantity'"""
+    *relations, name = path.split(LOOKUP_SEP)
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.get_field(name).to_python
+
+
+def keyset_filter(fields, values):
+    """
+    Q object selecting rows strictly after ``values`` in ascending
+    ``fields`` order: (a > x) OR (a = x AND b > y) OR ...
+    """
+    condition = Q()
+    for i, field in enumerate(fields):
+        step = Q(**{f'{field}__gt': values[i]})
+        for prev_field, prev_value in zip(fields[:i], values[:i]):
+            step &= Q(**{prev_field: prev_value})
+        condition |= step
+    return condition
+
+
+def paginate_queryset(queryset, fields, cursor, page_size=PAGE_SIZE):
+    """
+    Fetch one page of ``queryset`` ordered by ``fields`` starting after
+    ``cursor``. Returns (rows, next_cursor); next_cursor is None on the
+    last page. One query, page_size + 1 rows.
+    """
+    after = decode_cursor(cursor, [_field_converter(queryset.model, field) for field in fields])
+    queryset = queryset.order_by(*fields)
+    if after is not None:
+        queryset = queryset.filter(keyset_filter(fields, after))
+
+    rows = list(queryset[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, field) for field in fields)
+    return rows, next_cursor
+
+
+def wants_fragment(request):
+    """True for "load more" requests that expect JSON with an HTML fragment"""
+    return (
+        request.GET.get('format') == 'json'
+        or request.headers.get('x-requested-with') == 'XMLHttpRequest'
+    )
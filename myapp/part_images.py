@@ -0,0 +1,184 @@
+"""
+Default (stock photo) images for parts without an uploaded image
+
+DEFAULT_PART_IMAGES maps lowercase part names / categories to static
+paths. Resolution is precompiled at import:
+
+- exact names hit a dict
+- otherwise the longest keyword contained in the text wins (one regex)
+- otherwise a text that is part of a keyword (e.g. "brake caliper")
+  is looked up in one joined keyword string
+
+Results are memoized, and Part.save() stores the resolved path in
+``Part.default_image`` so listings do no matching at all.
+"""
+import bisect
+import re
+from functools import lru_cache
+
+# ============================================================================
+# LOCAL PART IMAGES - Using your own downloaded isolated part photos
+# Store images in: myapp/static/images/parts/
+# ============================================================================
+
+DEFAULT_PART_IMAGES = {
+    
+    # ========== AC (1 part) ==========
+    'ac compressor': 'images/parts/ac-compressor.jpg',
+    
+    # ========== BODY PARTS (13 parts) ==========
+    'bonnet': 'images/parts/bonnet.jpg',
+    'boot lid': 'images/parts/boot-lid.jpg',
+    
+    'front bumper': 'images/parts/bumper-front.jpg',
+    'rear bumper': 'images/parts/bumper-rear.jpg',  # Or use same as front
+    
+    'front left door': 'images/parts/door.jpg',
+    'front right door': 'images/parts/door.jpg',  # Same image
+    'rear left door': 'images/parts/door.jpg',  # Same image
+    'rear right door': 'images/parts/door.jpg',  # Same image
+    
+    'front left fender': 'images/parts/fender.jpg',
+    'front right fender': 'images/parts/fender.jpg',  # Same image
+    
+    'side mirror left': 'images/parts/side-mirror.jpg',
+    'side mirror right': 'images/parts/side-mirror.jpg',  # Same image
+    
+    # ========== COOLING (1 part) ==========
+    'radiator': 'images/parts/radiator.jpg',  # Like your example!
+    
+    # ========== ELECTRICAL PARTS (9 parts) ==========
+    'alternator': 'images/parts/alternator.jpg',
+    'battery': 'images/parts/battery.jpg',
+    
+    'headlight left': 'images/parts/headlight.jpg',
+    'headlight right': 'images/parts/headlight.jpg',  # Same image
+    
+    'tail light left': 'images/parts/taillight.jpg',
+    'tail light right': 'images/parts/taillight.jpg',  # Same image
+    
+    'starter motor': 'images/parts/starter-motor.jpg',
+    'wiper motor': 'images/parts/wiper-motor.jpg',
+    
+    # ========== ENGINE (1 part) ==========
+    'engine': 'images/parts/engine.jpg',
+    
+    # ========== EXHAUST (2 parts) ==========
+    'catalytic converter': 'images/parts/catalytic-converter.jpg',
+    'exhaust system': 'images/parts/exhaust-system.jpg',
+    
+    # ========== FUEL SYSTEM (1 part) ==========
+    'fuel pump': 'images/parts/fuel-pump.jpg',
+    
+    # ========== GLASS (6 parts) ==========
+    'windshield': 'images/parts/windshield.jpg',
+    'rear windshield': 'images/parts/rear-windshield.jpg',
+    
+    'front left window': 'images/parts/window.jpg',
+    'front right window': 'images/parts/window.jpg',  # Same image
+    'rear left window': 'images/parts/window.jpg',  # Same image
+    'rear right window': 'images/parts/window.jpg',  # Same image
+    
+    # ========== INTERIOR (4 parts) ==========
+    'dashboard': 'images/parts/dashboard.jpg',
+    'steering wheel': 'images/parts/steering-wheel.jpg',
+    'front seats': 'images/parts/car-seat.jpg',
+    'rear seats': 'images/parts/car-seat.jpg',  # Same image
+    
+    # ========== SUSPENSION (2 parts) ==========
+    'suspension (front)': 'images/parts/suspension.jpg',
+    'suspension (rear)': 'images/parts/suspension.jpg',  # Same image
+    
+    # ========== TRANSMISSION (1 part) ==========
+    'gearbox': 'images/parts/gearbox.jpg',
+    
+    # ========== WHEELS (2 parts) ==========
+    'alloy wheels (set of 4)': 'images/parts/alloy-wheel.jpg',
+    'spare wheel': 'images/parts/alloy-wheel.jpg',  # Same image
+    
+    # ========== BIKE PARTS ==========
+    'fuel tank': 'images/parts/bike-fuel-tank.jpg',
+    'front fender': 'images/parts/bike-fender.jpg',
+    'rear fender': 'images/parts/bike-fender.jpg',
+    'side panel left': 'images/parts/bike-side-panel.jpg',
+    'side panel right': 'images/parts/bike-side-panel.jpg',
+    'tail panel': 'images/parts/bike-tail-panel.jpg',
+    'seat': 'images/parts/bike-seat.jpg',
+    'footrest left': 'images/parts/bike-footrest.jpg',
+    'footrest right': 'images/parts/bike-footrest.jpg',
+    'stand (main)': 'images/parts/bike-stand.jpg',
+    'stand (side)': 'images/parts/bike-stand.jpg',
+    'headlight': 'images/parts/bike-headlight.jpg',
+    'tail light': 'images/parts/bike-taillight.jpg',
+    'indicator lights (set)': 'images/parts/bike-indicator.jpg',
+    'spark plug': 'images/parts/spark-plug.jpg',
+    'cdi unit': 'images/parts/cdi-unit.jpg',
+    'wiring harness': 'images/parts/wiring-harness.jpg',
+    'speedometer': 'images/parts/speedometer.jpg',
+    'handlebar': 'images/parts/handlebar.jpg',
+    'handle grips': 'images/parts/handle-grips.jpg',
+    'clutch lever': 'images/parts/clutch-lever.jpg',
+    'brake lever': 'images/parts/brake-lever.jpg',
+    'throttle assembly': 'images/parts/throttle.jpg',
+    'front wheel': 'images/parts/bike-wheel.jpg',
+    'rear wheel': 'images/parts/bike-wheel.jpg',
+    'front tyre': 'images/parts/bike-tyre.jpg',
+    'rear tyre': 'images/parts/bike-tyre.jpg',
+    'front brake disc': 'images/parts/brake-disc.jpg',
+    'rear brake disc': 'images/parts/brake-disc.jpg',
+    'front brake caliper': 'images/parts/brake-caliper.jpg',
+    'rear brake caliper': 'images/parts/brake-caliper.jpg',
+    'carburetor': 'images/parts/carburetor.jpg',
+    'exhaust pipe': 'images/parts/exhaust-pipe.jpg',
+    'silencer': 'images/parts/silencer.jpg',
+    'chain': 'images/parts/bike-chain.jpg',
+    'sprocket set': 'images/parts/sprocket.jpg',
+    'front fork': 'images/parts/front-fork.jpg',
+    'rear shock absorber': 'images/parts/shock-absorber.jpg',
+}
+
+PLACEHOLDER_IMAGE = 'images/parts/placeholder.jpg'
+
+# Longest first, so "front brake disc" beats "brake disc"
+_KEYWORDS = sorted(DEFAULT_PART_IMAGES, key=len, reverse=True)
+_CONTAINED_RE = re.compile('|'.join(re.escape(keyword) for keyword in _KEYWORDS))
+
+# All keywords in one string; a match offset maps back to its keyword
+_SEPARATOR = '\n'
+_ALL_KEYWORDS = _SEPARATOR.join(DEFAULT_PART_IMAGES)
+_KEYWORD_STARTS = []
+_offset = 0
+for _keyword in DEFAULT_PART_IMAGES:
+    _KEYWORD_STARTS.append(_offset)
+    _offset += len(_keyword) + len(_SEPARATOR)
+_KEYWORD_LIST = list(DEFAULT_PART_IMAGES)
+
+
+@lru_cache(maxsize=1024)
+def resolve_image_path(text):
+    """Static path of the default image for a name / category, or None"""
+    search_text = (text or '').lower().strip()
+    if not search_text:
+        return None
+    
+    # Exact match
+    if search_text in DEFAULT_PART_IMAGES:
+        return DEFAULT_PART_IMAGES[search_text]
+    
+    # A keyword inside the text ("Front Bumper (Used)")
+    match = _CONTAINED_RE.search(search_text)
+    if match:
+        return DEFAULT_PART_IMAGES[match.group()]
+    
+    # The text inside a keyword ("bumper")
+    if _SEPARATOR not in search_text:
+        offset = _ALL_KEYWORDS.find(search_text)
+        if offset != -1:
+            keyword = _KEYWORD_LIST[bisect.bisect_right(_KEYWORD_STARTS, offset) - 1]
+            return DEFAULT_PART_IMAGES[keyword]
+    return None
+
+
+def default_image_for(name, category=''):
+    """Static path for a part: by name, then by category, then the placeholder"""
+    return resolve_image_path(name) or resolve_image_path(category) or PLACEHOLDER_IMAGE
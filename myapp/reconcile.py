@@ -0,0 +1,124 @@
+"""
+Inventory invariants and their repairs (manage.py fix_stock)
+
+Each check is one set-based query (mostly an anti-join) for the rows
+that break an invariant, read in keyset chunks of ids so a large
+catalog never has to be held in memory or locked in one transaction.
+A check with a ``fix`` repairs each chunk in its own transaction with
+bulk statements; the others only report, because the right repair is a
+decision for a person.
+"""
+from collections import namedtuple
+
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef, Q
+
+from . import page_cache
+from .inventory import rebuild_vehicle_counters, stale_counter_vehicles
+from .models import Part, PartStock, VehicleModel
+from .signals import BIKE_PARTS, CAR_PARTS, provision_default_parts
+
+DEFAULT_CHUNK_SIZE = 1000
+# Ids listed per check in the report
+SAMPLE_SIZE = 20
+
+Check = namedtuple('Check', 'name description queryset fix')
+
+
+def _parts_without_stock():
+    return Part.objects.filter(stock__isnull=True)
+
+
+def _create_stock(part_ids):
+    # Zero stock: no counter, related-parts or page changes to follow up
+    PartStock.objects.bulk_create(
+        [PartStock(part_id=part_id, quantity=0) for part_id in part_ids],
+        ignore_conflicts=True,
+    )
+
+
+def _orphaned_stock():
+    # Only possible where foreign keys are not enforced (or were not, once)
+    return PartStock.objects.filter(~Exists(Part.objects.filter(pk=OuterRef('part_id'))))
+
+
+def _delete_stock(stock_ids):
+    PartStock.objects.filter(pk__in=stock_ids).delete()
+
+
+def _stock_on_inactive_parts():
+    return PartStock.objects.filter(quantity__gt=0, part__is_active=False)
+
+
+def _vehicles_missing_default_parts():
+    # default_parts_for(): cars get CAR_PARTS, everything else BIKE_PARTS
+    car_names = [part['name'] for part in CAR_PARTS]
+    bike_names = [part['name'] for part in BIKE_PARTS]
+    is_car = Q(vehicle_type='car')
+    return VehicleModel.objects.alias(
+        default_count=Count(
+            'parts__name',
+            filter=(is_car & Q(parts__name__in=car_names)) | (~is_car & Q(parts__name__in=bike_names)),
+            distinct=True,
+        ),
+    ).filter(
+        (is_car & Q(default_count__lt=len(car_names))) | (~is_car & Q(default_count__lt=len(bike_names)))
+    )
+
+
+def _provision_missing_parts(vehicle_ids):
+    provision_default_parts(VehicleModel.objects.filter(pk__in=vehicle_ids), only_missing=True)
+
+
+def _rebuild_counters(vehicle_ids):
+    rebuild_vehicle_counters(vehicle_ids)
+    transaction.on_commit(lambda: page_cache.bump_versions(vehicle_ids))
+
+
+CHECKS = [
+    Check('parts_without_stock', 'Parts with no PartStock row', _parts_without_stock, _create_stock),
+    Check('orphaned_stock', 'PartStock rows whose part no longer exists', _orphaned_stock, _delete_stock),
+    Check('stock_on_inactive_parts', 'Inactive parts that still have stock (review in the admin)',
+          _stock_on_inactive_parts, None),
+    Check('vehicles_missing_default_parts', 'Vehicles missing part of the standard part set',
+          _vehicles_missing_default_parts, _provision_missing_parts),
+    Check('stale_vehicle_counters', 'Vehicles whose part counters disagree with a recount',
+          stale_counter_vehicles, _rebuild_counters),
+]
+
+
+def _keyset_chunks(queryset, chunk_size):
+    """Ids of ``queryset`` in ascending chunks, one LIMIT query per chunk"""
+    last = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last is not None:
+            chunk = chunk.filter(pk__gt=last)
+        ids = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def reconcile(dry_run=False, chunk_size=DEFAULT_CHUNK_SIZE, checks=None):
+    """
+    Run the checks (all, or the names in ``checks``) and repair what
+    they find unless ``dry_run``. Returns a JSON-able report:
+    {check name: {'description', 'found', 'fixed', 'sample'}}.
+    """
+    report = {}
+    for check in CHECKS:
+        if checks and check.name not in checks:
+            continue
+        result = {'description': check.description, 'found': 0, 'fixed': 0, 'sample': []}
+        for ids in _keyset_chunks(check.queryset(), chunk_size):
+            result['found'] += len(ids)
+            result['sample'].extend(ids[:SAMPLE_SIZE - len(result['sample'])])
+            if dry_run or check.fix is None:
+                continue
+            with transaction.atomic():
+                check.fix(ids)
+            result['fixed'] += len(ids)
+        report[check.name] = result
+    return report
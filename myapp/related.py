@@ -0,0 +1,333 @@
+"""
+Precomputed "related parts" for the part detail page
+
+For every part, RelatedPart stores the best RELATED_PARTS_STORED picks
+among its siblings, so the detail page reads them with one indexed
+lookup (related_parts()) instead of filtering the parts table. Siblings
+are the other active parts
+
+- of the same vehicle and category, and
+- with the same name on other vehicles of the same manufacturer and
+  vehicle type (the same door or headlight for a sister model)
+
+ranked in-stock first, then by popularity (activity.refresh_popularity),
+then same-vehicle first. The page still drops entries that went out of
+stock since, so a stale ranking never shows a part that is gone.
+
+Part.ranked_in_stock remembers the in-stock state each part had when
+the rankings were last written. refresh() re-ranks only the siblings of
+parts whose state flipped (or that were edited), which is what keeps
+the table current as stock moves. Changes queue it with
+schedule_refresh(): after commit, on a background thread
+(RELATED_PARTS_ASYNC), so the request that made the change does not
+wait for a re-rank whose cost grows with the manufacturer's catalog.
+A refresh lost with its process is caught up by the next change to
+the vehicle, or by rebuild_all() (manage.py refresh_related_parts),
+which redoes everything, e.g. nightly after the popularity refresh.
+"""
+import logging
+import threading
+from collections import defaultdict, namedtuple
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from . import page_cache
+from .models import Part, RelatedPart, VehicleModel
+
+logger = logging.getLogger(__name__)
+
+RELATED_PARTS_STORED = 8
+RELATED_PARTS_SHOWN = 4
+
+# Keeps IN (...) lists under the SQLite variable limit
+CHUNK_SIZE = 500
+
+Row = namedtuple('Row', 'id vehicle_id category name popularity is_active in_stock')
+
+
+def _chunks(values, size=CHUNK_SIZE):
+    values = iter(values)
+    while chunk := list(islice(values, size)):
+        yield chunk
+
+
+def _in_stock(is_active, quantity):
+    return bool(is_active and (quantity or 0) > 0)
+
+
+def _load_partition(manufacturer, vehicle_type):
+    """All parts of one manufacturer / vehicle type: the candidate pool"""
+    rows = Part.objects.filter(
+        vehicle_model__manufacturer=manufacturer,
+        vehicle_model__vehicle_type=vehicle_type,
+    ).values_list('id', 'vehicle_model_id', 'category', 'name', 'popularity', 'is_active', 'stock__quantity')
+    return [
+        Row(pk, vehicle_id, category, name, popularity, is_active, _in_stock(is_active, quantity))
+        for pk, vehicle_id, category, name, popularity, is_active, quantity in rows
+    ]
+
+
+def _candidate_order(row, same_vehicle=True):
+    return (not row.in_stock, -row.popularity, not same_vehicle, row.name, row.id)
+
+
+def _rank_partition(rows, targets):
+    """{part_id: [related part ids, best first]} for the ``targets`` rows"""
+    by_group = defaultdict(list)
+    by_name = defaultdict(list)
+    for row in sorted((row for row in rows if row.is_active), key=_candidate_order):
+        by_group[row.vehicle_id, row.category].append(row)
+        by_name[row.name].append(row)
+
+    rankings = {}
+    for target in targets:
+        candidates = [
+            (row, True) for row in by_group[target.vehicle_id, target.category][:RELATED_PARTS_STORED + 1]
+        ]
+        siblings = (row for row in by_name[target.name] if row.vehicle_id != target.vehicle_id)
+        candidates += [(row, False) for row in islice(siblings, RELATED_PARTS_STORED)]
+        candidates.sort(key=lambda item: _candidate_order(*item))
+        rankings[target.id] = [row.id for row, _ in candidates if row.id != target.id][:RELATED_PARTS_STORED]
+    return rankings
+
+
+def _stored(part_ids):
+    """{part_id: [related part ids, by rank]} as currently stored"""
+    stored = defaultdict(list)
+    for chunk in _chunks(part_ids):
+        for part_id, related_id in RelatedPart.objects.filter(
+            part_id__in=chunk
+        ).order_by('part_id', 'rank').values_list('part_id', 'related_id'):
+            stored[part_id].append(related_id)
+    return stored
+
+
+def _write(rankings):
+    """
+    Replace the stored rankings of the parts in ``rankings`` that
+    differ; returns their ids. Plain executemany: a rebuild writes ~8 rows per part, and
+    building a model instance for each costs more than the insert.
+    The parts' updated_at moves too: it feeds the ETag / Last-Modified
+    of their pages (views.catalog_etag).
+    """
+    stored = _stored(rankings)
+    rankings = {pk: related_ids for pk, related_ids in rankings.items() if stored.get(pk, []) != related_ids}
+    quote = connection.ops.quote_name
+    table = quote(RelatedPart._meta.db_table)
+    columns = ', '.join(quote(RelatedPart._meta.get_field(name).column) for name in ('part', 'related', 'rank'))
+    with transaction.atomic(), connection.cursor() as cursor:
+        for part_ids in _chunks(rankings):
+            RelatedPart.objects.filter(part_id__in=part_ids).delete()
+        cursor.executemany(
+            f"INSERT INTO {table} ({columns}) VALUES (%s, %s, %s)",
+            [
+                (part_id, related_id, rank)
+                for part_id, related_ids in rankings.items()
+                for rank, related_id in enumerate(related_ids)
+            ],
+        )
+        now = timezone.now()
+        for part_ids in _chunks(rankings):
+            Part.objects.filter(pk__in=part_ids).update(updated_at=now)
+    return set(rankings)
+
+
+def _mark_ranked(states):
+    """Record the in-stock state ({part_id: bool}) the rankings now reflect"""
+    for in_stock in (True, False):
+        part_ids = [pk for pk, state in states.items() if state is in_stock]
+        for chunk in _chunks(part_ids):
+            Part.objects.filter(pk__in=chunk).update(ranked_in_stock=in_stock)
+
+
+def refresh_parts(part_ids):
+    """
+    Re-rank every part that has one of ``part_ids`` among its siblings
+    (and those parts themselves). Returns the number of rankings that
+    changed.
+    """
+    part_ids = set(part_ids)
+    partitions = defaultdict(lambda: (set(), set()))
+    for chunk in _chunks(part_ids):
+        for manufacturer, vehicle_type, vehicle_id, category, name in Part.objects.filter(
+            pk__in=chunk
+        ).values_list('vehicle_model__manufacturer', 'vehicle_model__vehicle_type',
+                      'vehicle_model_id', 'category', 'name'):
+            groups, names = partitions[manufacturer, vehicle_type]
+            groups.add((vehicle_id, category))
+            names.add(name)
+
+    rankings = {}
+    states = {}
+    vehicles = {}
+    for (manufacturer, vehicle_type), (groups, names) in partitions.items():
+        rows = _load_partition(manufacturer, vehicle_type)
+        targets = [row for row in rows if (row.vehicle_id, row.category) in groups or row.name in names]
+        rankings.update(_rank_partition(rows, targets))
+        states.update({row.id: row.in_stock for row in rows if row.id in part_ids})
+        vehicles.update({row.id: row.vehicle_id for row in targets})
+
+    with transaction.atomic():
+        written = _write(rankings)
+        _mark_ranked(states)
+    if written:
+        # Pages of sister models show these rankings too
+        vehicle_ids = {vehicles[pk] for pk in written}
+        transaction.on_commit(lambda: page_cache.bump_versions(vehicle_ids))
+    return len(written)
+
+
+def refresh(vehicle_ids, part_ids=()):
+    """
+    Bring the rankings up to date after a committed change to some
+    vehicles' parts or stock: re-ranks around ``part_ids`` (edited
+    parts) and any part of the vehicles whose in-stock state no longer
+    matches Part.ranked_in_stock. Cheap (one query) when nothing
+    flipped, so it runs after every stock change.
+    """
+    changed = set(part_ids)
+    rows = Part.objects.filter(
+        vehicle_model_id__in=[pk for pk in set(vehicle_ids) if pk]
+    ).values_list('pk', 'ranked_in_stock', 'is_active', 'stock__quantity')
+    for pk, ranked_in_stock, is_active, quantity in rows:
+        if ranked_in_stock is None or ranked_in_stock != _in_stock(is_active, quantity):
+            changed.add(pk)
+    if not changed:
+        return 0
+    return refresh_parts(changed)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending_lock = threading.Lock()
+_pending_vehicles = set()
+_pending_parts = set()
+_suspended = threading.local()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # One worker: refreshes never race each other's writes
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='related-parts')
+    return _executor
+
+
+def _refresh_pending():
+    with _pending_lock:
+        vehicle_ids, part_ids = set(_pending_vehicles), set(_pending_parts)
+        _pending_vehicles.clear()
+        _pending_parts.clear()
+    try:
+        refresh(vehicle_ids, part_ids)
+    except Exception:
+        logger.exception("Refreshing related parts failed for vehicles %s", sorted(vehicle_ids))
+    finally:
+        # The worker thread has its own connection; honour CONN_MAX_AGE for it too
+        close_old_connections()
+
+
+def run_in_background(func):
+    """
+    Run ``func()`` on the related-parts worker thread (inline when
+    RELATED_PARTS_ASYNC is off), for other best-effort writes that should
+    not hold up a request, e.g. activity.flush_activity.
+    """
+    if not getattr(settings, 'RELATED_PARTS_ASYNC', True):
+        func()
+        return
+
+    def run():
+        try:
+            func()
+        except Exception:
+            logger.exception("Background task %s failed", func.__name__)
+        finally:
+            close_old_connections()
+
+    _get_executor().submit(run)
+
+
+def schedule_refresh(vehicle_ids, part_ids=()):
+    """
+    refresh() once the current transaction commits. Changes queued while
+    a refresh runs are merged into the next one, so a burst of stock
+    edits costs one re-rank rather than one each.
+    """
+    if getattr(_suspended, 'active', False):
+        return
+    vehicle_ids = {pk for pk in vehicle_ids if pk}
+    part_ids = set(part_ids)
+
+    def submit():
+        if not getattr(settings, 'RELATED_PARTS_ASYNC', True):
+            refresh(vehicle_ids, part_ids)
+            return
+        with _pending_lock:
+            idle = not (_pending_vehicles or _pending_parts)
+            _pending_vehicles.update(vehicle_ids)
+            _pending_parts.update(part_ids)
+        if idle:
+            _get_executor().submit(_refresh_pending)
+
+    transaction.on_commit(submit, robust=True)
+
+
+@contextmanager
+def refresh_suspended():
+    """
+    Skip schedule_refresh() in this thread for the duration of a bulk
+    load that ends with rebuild_all() (seed_catalog): re-ranking after
+    every chunk costs more the larger the catalog gets.
+    """
+    _suspended.active = True
+    try:
+        yield
+    finally:
+        _suspended.active = False
+
+
+def rebuild_all():
+    """Recompute every ranking. Returns the number that changed."""
+    partitions = (
+        VehicleModel.objects.order_by()
+        .values_list('manufacturer', 'vehicle_type').distinct()
+    )
+    ranked = 0
+    with transaction.atomic():
+        # Every part is in some partition; unchanged rankings are left alone
+        for manufacturer, vehicle_type in partitions:
+            rows = _load_partition(manufacturer, vehicle_type)
+            ranked += len(_write(_rank_partition(rows, rows)))
+            _mark_ranked({row.id: row.in_stock for row in rows})
+        vehicle_ids = list(VehicleModel.objects.values_list('pk', flat=True))
+        transaction.on_commit(lambda: page_cache.bump_versions(vehicle_ids))
+    return ranked
+
+
+def related_parts(part, limit=RELATED_PARTS_SHOWN):
+    """The parts to recommend on ``part``'s detail page, best first"""
+    if part.ranked_in_stock is None:
+        # Not ranked yet (new part, or before the first rebuild)
+        return list(
+            Part.objects.filter(
+                vehicle_model_id=part.vehicle_model_id,
+                category=part.category,
+                is_active=True,
+                stock__quantity__gt=0,
+            ).exclude(pk=part.pk).select_related('stock', 'vehicle_model')[:limit]
+        )
+    entries = RelatedPart.objects.filter(
+        part=part,
+        related__is_active=True,
+        related__stock__quantity__gt=0,
+        related__vehicle_model__is_active=True,
+    ).select_related('related__stock', 'related__vehicle_model')[:limit]
+    return [entry.related for entry in entries]
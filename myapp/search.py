@@ -0,0 +1,379 @@
+"""
+Full-text search for parts
+
+Every Part carries a denormalized ``search_document`` (name, category,
+part number, manufacturer and model name). The index behind it depends
+on the database:
+
+- PostgreSQL: GIN index on to_tsvector('simple', search_document),
+  maintained by the database itself (see migration 0003)
+- SQLite: FTS5 virtual table ``myapp_part_fts`` keyed by part id,
+  kept in sync from the Part / VehicleModel signal handlers
+
+Any other backend falls back to a plain icontains scan.
+
+Typo tolerance ("alternater", "hondaa city") works on the SearchTerm
+vocabulary: when a query finds nothing, each unknown word is replaced by
+its closest vocabulary terms by trigram similarity and the full-text
+query is re-run. PostgreSQL answers the similarity lookup from a pg_trgm
+GiST index; SQLite uses the in-process NgramIndex below.
+"""
+import re
+import time
+from collections import defaultdict
+
+from django.db import connection, connections, router
+from django.db.models import Q
+
+from .models import Part, PartStock, SearchTerm
+
+FTS_TABLE = 'myapp_part_fts'
+TS_CONFIG = 'simple'
+
+# Same scale as pg_trgm's similarity(); 0.2 lets "lite" reach "light"
+FUZZY_THRESHOLD = 0.2
+FUZZY_ALTERNATIVES = 3
+# Shorter queries are not searched
+MIN_QUERY_LENGTH = 3
+# Other worker processes add terms too, so the in-process index is reloaded periodically
+NGRAM_INDEX_TTL = 300
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+_fts_ready = None
+_ngram_index = None
+_ngram_loaded_at = 0.0
+
+
+def tokenize(query):
+    """Split a user query into lowercase word tokens"""
+    return _TOKEN_RE.findall(query.lower())
+
+
+def vocabulary_terms(*texts):
+    """Words worth keeping in the fuzzy-match vocabulary"""
+    terms = set()
+    for text in texts:
+        terms.update(tokenize(text or ''))
+    # Part names allow longer words than SearchTerm.term holds
+    max_length = SearchTerm._meta.get_field('term').max_length
+    return {term for term in terms if 1 < len(term) <= max_length and not term.isdigit()}
+
+
+def _sqlite_fts_ready():
+    """True if the FTS5 table exists (SQLite builds without FTS5 skip it)"""
+    global _fts_ready
+    if _fts_ready is None:
+        _fts_ready = FTS_TABLE in connection.introspection.table_names()
+    return _fts_ready
+
+
+# -----------------------------
+# Index maintenance
+# -----------------------------
+def index_parts(parts):
+    """
+    Push the current search_document of the given parts into the index.
+    PostgreSQL maintains its expression index itself, so this only
+    matters for the SQLite FTS5 table. Returns the number of rows written.
+    """
+    if connection.vendor != 'sqlite' or not _sqlite_fts_ready():
+        return 0
+    rows = [(part.pk, part.search_document) for part in parts if part.pk]
+    if not rows:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk, _ in rows])
+        cursor.executemany(f"INSERT INTO {FTS_TABLE}(rowid, document) VALUES (%s, %s)", rows)
+    return len(rows)
+
+
+def remove_parts(part_ids):
+    """Drop deleted parts from the index; returns the number of rows removed"""
+    if connection.vendor != 'sqlite' or not _sqlite_fts_ready():
+        return 0
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in part_ids])
+        return cursor.rowcount
+
+
+def add_terms(*texts):
+    """Record the words of part / vehicle names in the search vocabulary"""
+    terms = vocabulary_terms(*texts)
+    if _ngram_index is not None:
+        terms = {term for term in terms if term not in _ngram_index}
+        for term in terms:
+            _ngram_index.add(term)
+    if terms:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=term) for term in terms],
+            ignore_conflicts=True,
+        )
+
+
+def reindex_vehicle(vehicle):
+    """
+    Rebuild search documents after a vehicle's name/manufacturer changed.
+    Returns the number of parts updated.
+    """
+    parts = list(Part.objects.filter(vehicle_model=vehicle))
+    for part in parts:
+        part.search_document = part.build_search_document(vehicle)
+    updated = Part.objects.bulk_update(parts, ['search_document'], batch_size=500)
+    index_parts(parts)
+    return updated
+
+
+# -----------------------------
+# Trigram similarity
+# -----------------------------
+def trigrams(word):
+    """pg_trgm compatible trigram set (two leading spaces, one trailing)"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class NgramIndex:
+    """
+    In-process trigram index over the search vocabulary.
+    Stands in for pg_trgm on SQLite; the vocabulary is a few thousand
+    words at most, so lookups stay well under a millisecond.
+    """
+
+    def __init__(self, terms=()):
+        self._postings = defaultdict(set)
+        self._grams = {}
+        for term in terms:
+            self.add(term)
+
+    def __contains__(self, term):
+        return term in self._grams
+
+    def __len__(self):
+        return len(self._grams)
+
+    def add(self, term):
+        if term in self._grams:
+            return
+        grams = trigrams(term)
+        self._grams[term] = len(grams)
+        for gram in grams:
+            self._postings[gram].add(term)
+
+    def lookup(self, word, limit=FUZZY_ALTERNATIVES, threshold=FUZZY_THRESHOLD):
+        """Closest terms to ``word`` as (term, similarity), best first"""
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in grams:
+            for term in self._postings.get(gram, ()):
+                shared[term] += 1
+
+        matches = []
+        for term, common in shared.items():
+            score = common / (len(grams) + self._grams[term] - common)
+            if score >= threshold:
+                matches.append((term, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches[:limit]
+
+
+def get_ngram_index():
+    """Process-wide NgramIndex, loaded from SearchTerm and refreshed every NGRAM_INDEX_TTL"""
+    global _ngram_index, _ngram_loaded_at
+    if _ngram_index is None or time.monotonic() - _ngram_loaded_at > NGRAM_INDEX_TTL:
+        _ngram_index = NgramIndex(SearchTerm.objects.values_list('term', flat=True).iterator())
+        _ngram_loaded_at = time.monotonic()
+    return _ngram_index
+
+
+def _read_connection():
+    """Connection for search queries (a replica inside the catalog views)"""
+    return connections[router.db_for_read(Part)]
+
+
+def similar_terms(word):
+    """Vocabulary terms closest to ``word`` by trigram similarity"""
+    if connection.vendor == 'postgresql':
+        with _read_connection().cursor() as cursor:
+            # KNN ordering (<->) is served by the GiST trigram index
+            cursor.execute(
+                f"SELECT term FROM {SearchTerm._meta.db_table} "
+                f"WHERE similarity(term, %s) >= %s "
+                f"ORDER BY term <-> %s LIMIT %s",
+                [word, FUZZY_THRESHOLD, word, FUZZY_ALTERNATIVES]
+            )
+            return [row[0] for row in cursor.fetchall()]
+    return [term for term, _ in get_ngram_index().lookup(word)]
+
+
+def correct_tokens(tokens):
+    """
+    Replace each query word with its closest vocabulary terms.
+    Returns one list of alternatives per token; words that are already
+    known (or too short / numeric to correct) are kept as-is.
+    """
+    corrected = []
+    for token in tokens:
+        alternatives = []
+        if len(token) > 2 and not token.isdigit():
+            alternatives = similar_terms(token)
+        if not alternatives or alternatives[0] == token:
+            alternatives = [token]
+        corrected.append(alternatives)
+    return corrected
+
+
+# -----------------------------
+# Querying
+# -----------------------------
+class SearchResult:
+    """
+    One page of search hits.
+    ``rows`` are (part_id, score) pairs, lower score = better match;
+    ``corrected`` says whether typo correction produced them, so later
+    pages of the same search stay on the same query.
+    """
+
+    def __init__(self, rows, corrected=False):
+        self.rows = rows
+        self.corrected = corrected
+
+    @property
+    def ids(self):
+        return [part_id for part_id, _ in self.rows]
+
+
+# Types of the search results' keyset cursor: (score, id, corrected)
+SEARCH_CURSOR = (float, int, bool)
+
+
+def search_part_ids(query, limit=50, after=None, corrected=None):
+    """
+    Find active, in-stock parts matching ``query``, best match first.
+
+    ``after`` is the (score, id) of the last hit already shown (keyset
+    pagination). ``corrected`` forces typo correction on or off; by
+    default a first page that finds nothing is retried with corrected
+    words.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return SearchResult([])
+
+    if not _has_fts_index():
+        return SearchResult(_scan_part_rows(query, limit, after))
+
+    groups = [[token] for token in tokens]
+    if corrected:
+        return SearchResult(_fts_part_rows(correct_tokens(tokens), limit, after), True)
+
+    rows = _fts_part_rows(groups, limit, after)
+    if not rows and corrected is None and after is None:
+        fixed = correct_tokens(tokens)
+        if fixed != groups:
+            return SearchResult(_fts_part_rows(fixed, limit, after), True)
+    return SearchResult(rows)
+
+
+def count_matches(query, corrected=False):
+    """Total number of hits for ``query`` (for the "Found N parts" line)"""
+    tokens = tokenize(query)
+    if not tokens:
+        return 0
+    if not _has_fts_index():
+        return _scan_queryset(query).count()
+
+    groups = correct_tokens(tokens) if corrected else [[token] for token in tokens]
+    sql, params = _fts_sql(groups)
+    with _read_connection().cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM ({sql}) hits", params)
+        return cursor.fetchone()[0]
+
+
+def _has_fts_index():
+    if connection.vendor == 'postgresql':
+        return True
+    return connection.vendor == 'sqlite' and _sqlite_fts_ready()
+
+
+def _fts_sql(groups):
+    """
+    SELECT (id, score) for the full-text query. ``groups`` holds one list
+    of alternative words per query word: groups are ANDed, alternatives
+    ORed, and every word matches as a prefix.
+    """
+    part_table = Part._meta.db_table
+    stock_table = PartStock._meta.db_table
+
+    if connection.vendor == 'postgresql':
+        ts_query = ' & '.join(
+            '(' + ' | '.join(f"{word}:*" for word in group) + ')' for group in groups
+        )
+        sql = (
+            f"SELECT p.id AS id, "
+            f"-ts_rank(to_tsvector('{TS_CONFIG}', p.search_document), "
+            f"to_tsquery('{TS_CONFIG}', %s))::float8 AS score "
+            f"FROM {part_table} p "
+            f"JOIN {stock_table} s ON s.part_id = p.id "
+            f"WHERE to_tsvector('{TS_CONFIG}', p.search_document) @@ to_tsquery('{TS_CONFIG}', %s) "
+            f"AND p.is_active = %s AND s.quantity > 0"
+        )
+        return sql, [ts_query, ts_query, True]
+
+    match = ' AND '.join(
+        '(' + ' OR '.join(f'"{word}"*' for word in group) + ')' for group in groups
+    )
+    sql = (
+        f"SELECT p.id AS id, bm25({FTS_TABLE}) AS score "
+        f"FROM {FTS_TABLE} f "
+        f"JOIN {part_table} p ON p.id = f.rowid "
+        f"JOIN {stock_table} s ON s.part_id = p.id "
+        f"WHERE {FTS_TABLE} MATCH %s "
+        f"AND p.is_active = %s AND s.quantity > 0"
+    )
+    return sql, [match, True]
+
+
+def _fts_part_rows(groups, limit, after=None):
+    sql, params = _fts_sql(groups)
+    sql = f"SELECT id, score FROM ({sql}) hits"
+    if after is not None:
+        sql += " WHERE (score > %s OR (score = %s AND id > %s))"
+        params += [after[0], after[0], after[1]]
+    sql += " ORDER BY score, id LIMIT %s"
+    params.append(limit)
+
+    with _read_connection().cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def _scan_queryset(query):
+    return Part.objects.filter(
+        Q(name__icontains=query) |
+        Q(category__icontains=query) |
+        Q(part_number__icontains=query) |
+        Q(vehicle_model__name__icontains=query) |
+        Q(vehicle_model__manufacturer__icontains=query),
+        is_active=True,
+        stock__quantity__gt=0
+    )
+
+
+def _scan_part_rows(query, limit, after=None):
+    """Fallback for databases without a full-text index (unranked, score 0)"""
+    queryset = _scan_queryset(query)
+    if after is not None:
+        queryset = queryset.filter(id__gt=after[1])
+    ids = queryset.order_by('id').values_list('id', flat=True).distinct()[:limit]
+    return [(part_id, 0.0) for part_id in ids]
+
+
+def load_parts(ids):
+    """Part objects (stock and vehicle loaded) in the order of ``ids``"""
+    parts = Part.objects.select_related('vehicle_model', 'stock').in_bulk(ids)
+    return [parts[pk] for pk in ids if pk in parts]
+
+
+def search_parts(query, limit=50):
+    """Ranked list of Part objects for ``query`` (first page only)"""
+    return load_parts(search_part_ids(query, limit).ids)
@@ -1,10 +1,13 @@
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_save, pre_save, post_delete
+from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.text import slugify
+from .logs import span_rows, traced
 from .models import VehicleModel, Part, PartStock, VehicleStock
+from .part_images import default_image_for
+from . import autocomplete, images, inventory, page_cache, related, search
 
-print("🔥 Signals module loaded!")
 
 # Predefined parts for each vehicle type
 CAR_PARTS = [
@@ -96,40 +99,112 @@ BIKE_PARTS = [
 
 
 @receiver(post_save, sender=VehicleModel)
+@traced
 def create_default_parts_for_vehicle(sender, instance, created, **kwargs):
     """Automatically create all standard parts when a new vehicle model is added"""
-    if created:
-        print(f"✅ Creating parts for NEW vehicle: {instance.name}")
-        
-        parts_list = CAR_PARTS if instance.vehicle_type == 'car' else BIKE_PARTS
+    if not created:
+        # Name / manufacturer are part of every part's search document
+        previous = getattr(instance, '_previous_values', None) or {}
+        if any(previous.get(field) != getattr(instance, field) for field in ('name', 'manufacturer')):
+            search.add_terms(instance.name, instance.manufacturer)
+            span_rows(search.reindex_vehicle(instance))
+        return
+    
+    search.add_terms(instance.name, instance.manufacturer)
+    
+    parts = provision_default_parts([instance])
+    span_rows(len(parts))
+
+
+def default_parts_for(vehicle):
+    return CAR_PARTS if vehicle.vehicle_type == 'car' else BIKE_PARTS
+
+
+def provision_default_parts(vehicles, only_missing=False):
+    """
+    Create the standard part set (and zero stock rows) for ``vehicles``;
+    with ``only_missing``, just the standard parts a vehicle has no part
+    of that name for (fix_stock).
+    
+    Slugs are computed in memory and Part / PartStock rows go in with
+    bulk_create inside one transaction, so the query count does not grow
+    with the number of parts. bulk_create skips the per-row signals, so
+    their work (search index, vocabulary, counters, page cache) is done
+    here once for the whole batch.
+    """
+    vehicles = [vehicle for vehicle in vehicles if vehicle.pk]
+    if not vehicles:
+        return []
+    
+    with transaction.atomic():
+        taken = {}
+        names = {}
+        for vehicle_id, slug, name in Part.objects.filter(
+            vehicle_model__in=vehicles
+        ).values_list('vehicle_model_id', 'slug', 'name'):
+            taken.setdefault(vehicle_id, set()).add(slug)
+            names.setdefault(vehicle_id, set()).add(name)
         
-        parts_created = 0
-        for part_data in parts_list:
-            try:
+        new_parts = []
+        for vehicle in vehicles:
+            slugs = taken.setdefault(vehicle.pk, set())
+            for part_data in default_parts_for(vehicle):
+                if only_missing and part_data['name'] in names.get(vehicle.pk, ()):
+                    continue
                 base_slug = slugify(part_data['name'])
                 slug = base_slug
                 counter = 1
-                
-                while Part.objects.filter(vehicle_model=instance, slug=slug).exists():
+                while slug in slugs:
                     slug = f"{base_slug}-{counter}"
                     counter += 1
+                slugs.add(slug)
                 
-                Part.objects.create(
-                    vehicle_model=instance,
+                part = Part(
+                    vehicle_model=vehicle,
                     name=part_data['name'],
                     category=part_data['category'],
                     slug=slug,
                     condition='Used - Good'
                 )
-                parts_created += 1
-                
-            except Exception as e:
-                print(f"❌ Error creating part {part_data['name']}: {e}")
+                part.search_document = part.build_search_document(vehicle)
+                part.default_image = default_image_for(part.name, part.category)
+                new_parts.append(part)
+        
+        if not new_parts:
+            return []
+        Part.objects.bulk_create(new_parts, batch_size=500)
+        PartStock.objects.bulk_create(
+            [PartStock(part=part, quantity=0) for part in new_parts],
+            batch_size=500
+        )
         
-        print(f"🎉 Successfully created {parts_created} parts for {instance.name}!")
+        # What the Part / PartStock post_save handlers would have done per row
+        search.index_parts(new_parts)
+        search.add_terms(*{f"{part.name} {part.category}" for part in new_parts})
+        vehicle_ids = [vehicle.pk for vehicle in vehicles]
+        inventory.rebuild_vehicle_counters(vehicle_ids)
+        _invalidate_pages(vehicle_ids)
+    
+    return new_parts
+
+
+@receiver(post_save, sender=VehicleModel)
+@traced
+def update_autocomplete_vehicle(sender, instance, raw, **kwargs):
+    """Keep the in-process autocomplete trie in step with vehicle edits"""
+    if raw:
+        return
+    autocomplete.update_vehicle(instance)
+
+
+@receiver(post_delete, sender=VehicleModel)
+@traced
+def remove_autocomplete_vehicle(sender, instance, **kwargs):
+    autocomplete.remove_vehicle(instance.pk)
 
 
 @receiver(post_save, sender=Part)
+@traced
 def create_part_stock(sender, instance, created, **kwargs):
     """Automatically create PartStock when a new Part is created"""
     if created:
@@ -138,66 +213,225 @@ def create_part_stock(sender, instance, created, **kwargs):
             defaults={'quantity': 0}
         )
         if stock_created:
-            print(f"📦 Created stock entry for: {instance.name}")
+            span_rows(1)
+
+
+@receiver(post_save, sender=Part)
+@traced
+def update_part_search_index(sender, instance, raw, **kwargs):
+    """Keep the full-text index in step with the part row"""
+    if raw:
+        return
+    span_rows(search.index_parts([instance]))
+    search.add_terms(instance.name, instance.category)
+
+
+@receiver(post_delete, sender=Part)
+@traced
+def remove_part_from_search_index(sender, instance, **kwargs):
+    span_rows(search.remove_parts([instance.pk]))
+
+
+def _vehicle_id_for_stock(stock):
+    """Vehicle of a PartStock, without a query when the part is already loaded"""
+    if 'part' in stock._state.fields_cache:
+        return stock.part.vehicle_model_id
+    return Part.objects.filter(pk=stock.part_id).values_list('vehicle_model_id', flat=True).first()
+
+
+# -----------------------------
+# Denormalized vehicle counters
+# -----------------------------
+@receiver(post_save, sender=Part)
+@traced
+def update_counters_on_part_save(sender, instance, created, raw, **kwargs):
+    """Track part creation, is_active flips and moves between vehicles"""
+    if raw:
+        return
+    
+    previous = getattr(instance, '_loaded_values', None)
+    instance._loaded_values = {
+        'vehicle_model_id': instance.vehicle_model_id,
+        'is_active': instance.is_active,
+    }
+    
+    if created:
+        # Stock starts at 0 (create_part_stock), so only the total moves
+        span_rows(inventory.adjust_vehicle_counters(instance.vehicle_model_id, total=1))
+        return
+    
+    if previous is None or previous.get('vehicle_model_id') != instance.vehicle_model_id:
+        # Unknown previous state or moved to another vehicle: recount
+        vehicle_ids = {instance.vehicle_model_id}
+        if previous and previous.get('vehicle_model_id'):
+            vehicle_ids.add(previous['vehicle_model_id'])
+        span_rows(inventory.rebuild_vehicle_counters(vehicle_ids))
+        return
+    
+    if previous.get('is_active') != instance.is_active:
+        in_stock = PartStock.objects.filter(part=instance, quantity__gt=0).exists()
+        if in_stock:
+            span_rows(inventory.adjust_vehicle_counters(
+                instance.vehicle_model_id,
+                available=1 if instance.is_active else -1
+            ))
+
+
+@receiver(post_delete, sender=Part)
+@traced
+def update_counters_on_part_delete(sender, instance, **kwargs):
+    span_rows(inventory.rebuild_vehicle_counters([instance.vehicle_model_id]))
+
+
+@receiver(post_save, sender=PartStock)
+@traced
+def update_counters_on_stock_save(sender, instance, created, raw, **kwargs):
+    """Move available_parts_count when a quantity crosses zero"""
+    if raw:
+        return
+    
+    previous = getattr(instance, '_loaded_values', None)
+    instance._loaded_values = {'quantity': instance.quantity}
+    
+    if created:
+        was_available = False
+    elif previous is None:
+        # Saved without being loaded first, old quantity unknown
+        span_rows(inventory.rebuild_vehicle_counters([_vehicle_id_for_stock(instance)]))
+        return
+    else:
+        was_available = (previous.get('quantity') or 0) > 0
+    
+    is_available = instance.quantity > 0
+    if was_available == is_available:
+        return
+    
+    part = Part.objects.filter(pk=instance.part_id).values('vehicle_model_id', 'is_active').first()
+    if part and part['is_active']:
+        span_rows(inventory.adjust_vehicle_counters(
+            part['vehicle_model_id'],
+            available=1 if is_available else -1
+        ))
+
+
+@receiver(post_delete, sender=PartStock)
+@traced
+def update_counters_on_stock_delete(sender, instance, **kwargs):
+    if instance.quantity > 0:
+        vehicle_id = _vehicle_id_for_stock(instance)
+        if vehicle_id:
+            span_rows(inventory.rebuild_vehicle_counters([vehicle_id]))
+
+
+# -----------------------------
+# Page cache invalidation
+# -----------------------------
+def _invalidate_pages(vehicle_ids, part_ids=()):
+    """Re-rank related parts and bump cache versions once the change is committed"""
+    related.schedule_refresh(vehicle_ids, part_ids)
+    transaction.on_commit(lambda: page_cache.bump_versions(vehicle_ids))
+
+
+@receiver(post_save, sender=VehicleModel)
+@receiver(post_delete, sender=VehicleModel)
+@traced
+def invalidate_vehicle_pages(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    # Also the slug before a rename: another vehicle may take it later
+    previous = getattr(instance, '_previous_values', None) or {}
+    page_cache.forget_vehicle_slugs([instance.slug, previous.get('slug')])
+    _invalidate_pages([instance.pk])
+
+
+@receiver(post_save, sender=Part)
+@receiver(post_delete, sender=Part)
+@traced
+def invalidate_part_pages(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    if kwargs['signal'] is post_save:
+        # Name / category / vehicle may have changed: re-rank its siblings
+        _invalidate_pages([instance.vehicle_model_id], [instance.pk])
+    else:
+        _invalidate_pages([instance.vehicle_model_id])
+
+
+@receiver(post_save, sender=PartStock)
+@receiver(post_delete, sender=PartStock)
+@traced
+def invalidate_stock_pages(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    _invalidate_pages([_vehicle_id_for_stock(instance)])
+
+
+# -----------------------------
+# Image renditions
+# -----------------------------
+@receiver(post_save, sender=VehicleModel)
+@receiver(post_save, sender=Part)
+@traced
+def build_image_renditions(sender, instance, raw, **kwargs):
+    """Resize a new / replaced upload after commit (off the request thread)"""
+    if raw:
+        return
+    if images.needs_renditions(instance):
+        images.schedule_renditions(instance)
+
+
+@receiver(post_delete, sender=VehicleModel)
+@receiver(post_delete, sender=Part)
+@traced
+def delete_image_renditions(sender, instance, **kwargs):
+    data = instance.image_renditions
+    if data:
+        transaction.on_commit(lambda: images.delete_renditions(data))
+
+
+@receiver(pre_save, sender=VehicleStock)
+@traced
+def track_processing_transition(sender, instance, raw, **kwargs):
+    """
+    Detect the is_processed False -> True transition before the row is
+    written. For existing rows this is a compare-and-set UPDATE, so when
+    two requests process the same vehicle only one of them wins.
+    """
+    instance._processing_transition = False
+    if raw or not instance.is_processed:
+        return
+    
+    if instance._state.adding:
+        # New vehicle stock created as processed
+        instance._processing_transition = True
+        return
+    
+    claimed = VehicleStock.objects.filter(
+        pk=instance.pk, is_processed=False
+    ).update(is_processed=True)
+    instance._processing_transition = bool(claimed)
+    span_rows(claimed)
 
 
 @receiver(post_save, sender=VehicleStock)
+@traced
 def increment_parts_stock_on_processing(sender, instance, created, raw, **kwargs):
     """
-    Increment stock for ALL parts when vehicle is marked as processed
-    FIXED: Only increment once when is_processed changes from False to True
+    Increment stock for ALL parts when vehicle is marked as processed.
+    One UPDATE for every stock row of the model, only on a real transition.
     """
-    if raw:  # Don't run during fixtures/loaddata
+    if raw or not getattr(instance, '_processing_transition', False):
         return
+    instance._processing_transition = False
+    
+    with transaction.atomic():
+        updated = inventory.increment_vehicle_stock(instance.vehicle_model_id, delta=1)
         
-    if instance.is_processed:
-        # Use a flag to prevent double processing
-        if not hasattr(instance, '_stock_incremented'):
-            # Check if this is a new instance or status just changed
-            should_increment = False
-            
-            if created:
-                # New vehicle stock created as processed
-                should_increment = True
-                print(f"📦 NEW Vehicle added as processed: {instance.chassis_number}")
-            else:
-                # Existing vehicle - check if status just changed
-                try:
-                    # Get the old instance from database
-                    old_instance = VehicleStock.objects.get(pk=instance.pk)
-                    # Check if is_processed changed from False to True
-                    if not old_instance.is_processed and instance.is_processed:
-                        should_increment = True
-                        print(f"📦 Vehicle marked as processed: {instance.chassis_number}")
-                except VehicleStock.DoesNotExist:
-                    pass
-            
-            if should_increment:
-                parts = instance.vehicle_model.parts.all()
-                updated = 0
-                
-                for part in parts:
-                    try:
-                        stock, _ = PartStock.objects.get_or_create(
-                            part=part,
-                            defaults={'quantity': 0}
-                        )
-                        stock.quantity += 1
-                        stock.last_restocked = timezone.now()
-                        stock.save()
-                        updated += 1
-                    except Exception as e:
-                        print(f"❌ Error updating stock for {part.name}: {e}")
-                
-                print(f"✅ Incremented stock for {updated} parts!")
-                
-                # Set the flag to prevent double increment
-                instance._stock_incremented = True
-                
-                # Update processed date if not set
-                if not instance.processed_date:
-                    VehicleStock.objects.filter(pk=instance.pk).update(
-                        processed_date=timezone.now()
-                    )
-
-print("✅ All signal handlers registered!")
\ No newline at end of file
+        # Update processed date if not set
+        if not instance.processed_date:
+            instance.processed_date = timezone.now()
+            VehicleStock.objects.filter(pk=instance.pk).update(
+                processed_date=instance.processed_date
+            )
+    
+    span_rows(updated)
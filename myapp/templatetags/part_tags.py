@@ -1,159 +1,32 @@
+from functools import lru_cache
+
 from django import template
+from django.core.files.storage import default_storage
 from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from ..part_images import PLACEHOLDER_IMAGE, default_image_for, resolve_image_path
 
 register = template.Library()
 
-# ============================================================================
-# LOCAL PART IMAGES - Using your own downloaded isolated part photos
-# Store images in: myapp/static/images/parts/
-# ============================================================================
 
-DEFAULT_PART_IMAGES = {
-    
-    # ========== AC (1 part) ==========
-    'ac compressor': 'images/parts/ac-compressor.jpg',
-    
-    # ========== BODY PARTS (13 parts) ==========
-    'bonnet': 'images/parts/bonnet.jpg',
-    'boot lid': 'images/parts/boot-lid.jpg',
-    
-    'front bumper': 'images/parts/bumper-front.jpg',
-    'rear bumper': 'images/parts/bumper-rear.jpg',  # Or use same as front
-    
-    'front left door': 'images/parts/door.jpg',
-    'front right door': 'images/parts/door.jpg',  # Same image
-    'rear left door': 'images/parts/door.jpg',  # Same image
-    'rear right door': 'images/parts/door.jpg',  # Same image
-    
-    'front left fender': 'images/parts/fender.jpg',
-    'front right fender': 'images/parts/fender.jpg',  # Same image
-    
-    'side mirror left': 'images/parts/side-mirror.jpg',
-    'side mirror right': 'images/parts/side-mirror.jpg',  # Same image
-    
-    # ========== COOLING (1 part) ==========
-    'radiator': 'images/parts/radiator.jpg',  # Like your example!
-    
-    # ========== ELECTRICAL PARTS (9 parts) ==========
-    'alternator': 'images/parts/alternator.jpg',
-    'battery': 'images/parts/battery.jpg',
-    
-    'headlight left': 'images/parts/headlight.jpg',
-    'headlight right': 'images/parts/headlight.jpg',  # Same image
-    
-    'tail light left': 'images/parts/taillight.jpg',
-    'tail light right': 'images/parts/taillight.jpg',  # Same image
-    
-    'starter motor': 'images/parts/starter-motor.jpg',
-    'wiper motor': 'images/parts/wiper-motor.jpg',
-    
-    # ========== ENGINE (1 part) ==========
-    'engine': 'images/parts/engine.jpg',
-    
-    # ========== EXHAUST (2 parts) ==========
-    'catalytic converter': 'images/parts/catalytic-converter.jpg',
-    'exhaust system': 'images/parts/exhaust-system.jpg',
-    
-    # ========== FUEL SYSTEM (1 part) ==========
-    'fuel pump': 'images/parts/fuel-pump.jpg',
-    
-    # ========== GLASS (6 parts) ==========
-    'windshield': 'images/parts/windshield.jpg',
-    'rear windshield': 'images/parts/rear-windshield.jpg',
-    
-    'front left window': 'images/parts/window.jpg',
-    'front right window': 'images/parts/window.jpg',  # Same image
-    'rear left window': 'images/parts/window.jpg',  # Same image
-    'rear right window': 'images/parts/window.jpg',  # Same image
-    
-    # ========== INTERIOR (4 parts) ==========
-    'dashboard': 'images/parts/dashboard.jpg',
-    'steering wheel': 'images/parts/steering-wheel.jpg',
-    'front seats': 'images/parts/car-seat.jpg',
-    'rear seats': 'images/parts/car-seat.jpg',  # Same image
-    
-    # ========== SUSPENSION (2 parts) ==========
-    'suspension (front)': 'images/parts/suspension.jpg',
-    'suspension (rear)': 'images/parts/suspension.jpg',  # Same image
-    
-    # ========== TRANSMISSION (1 part) ==========
-    'gearbox': 'images/parts/gearbox.jpg',
-    
-    # ========== WHEELS (2 parts) ==========
-    'alloy wheels (set of 4)': 'images/parts/alloy-wheel.jpg',
-    'spare wheel': 'images/parts/alloy-wheel.jpg',  # Same image
-    
-    # ========== BIKE PARTS ==========
-    'fuel tank': 'images/parts/bike-fuel-tank.jpg',
-    'front fender': 'images/parts/bike-fender.jpg',
-    'rear fender': 'images/parts/bike-fender.jpg',
-    'side panel left': 'images/parts/bike-side-panel.jpg',
-    'side panel right': 'images/parts/bike-side-panel.jpg',
-    'tail panel': 'images/parts/bike-tail-panel.jpg',
-    'seat': 'images/parts/bike-seat.jpg',
-    'footrest left': 'images/parts/bike-footrest.jpg',
-    'footrest right': 'images/parts/bike-footrest.jpg',
-    'stand (main)': 'images/parts/bike-stand.jpg',
-    'stand (side)': 'images/parts/bike-stand.jpg',
-    'headlight': 'images/parts/bike-headlight.jpg',
-    'tail light': 'images/parts/bike-taillight.jpg',
-    'indicator lights (set)': 'images/parts/bike-indicator.jpg',
-    'spark plug': 'images/parts/spark-plug.jpg',
-    'cdi unit': 'images/parts/cdi-unit.jpg',
-    'wiring harness': 'images/parts/wiring-harness.jpg',
-    'speedometer': 'images/parts/speedometer.jpg',
-    'handlebar': 'images/parts/handlebar.jpg',
-    'handle grips': 'images/parts/handle-grips.jpg',
-    'clutch lever': 'images/parts/clutch-lever.jpg',
-    'brake lever': 'images/parts/brake-lever.jpg',
-    'throttle assembly': 'images/parts/throttle.jpg',
-    'front wheel': 'images/parts/bike-wheel.jpg',
-    'rear wheel': 'images/parts/bike-wheel.jpg',
-    'front tyre': 'images/parts/bike-tyre.jpg',
-    'rear tyre': 'images/parts/bike-tyre.jpg',
-    'front brake disc': 'images/parts/brake-disc.jpg',
-    'rear brake disc': 'images/parts/brake-disc.jpg',
-    'front brake caliper': 'images/parts/brake-caliper.jpg',
-    'rear brake caliper': 'images/parts/brake-caliper.jpg',
-    'carburetor': 'images/parts/carburetor.jpg',
-    'exhaust pipe': 'images/parts/exhaust-pipe.jpg',
-    'silencer': 'images/parts/silencer.jpg',
-    'chain': 'images/parts/bike-chain.jpg',
-    'sprocket set': 'images/parts/sprocket.jpg',
-    'front fork': 'images/parts/front-fork.jpg',
-    'rear shock absorber': 'images/parts/shock-absorber.jpg',
-}
+@lru_cache(maxsize=None)
+def _static_url(path):
+    return static(path)
 
 
 def get_default_part_image(part_name_or_category):
     """Get default image URL based on part name or category"""
-    search_text = part_name_or_category.lower().strip()
-    
-    # Try exact match
-    if search_text in DEFAULT_PART_IMAGES:
-        return static(DEFAULT_PART_IMAGES[search_text])
-    
-    # Try partial match
-    for keyword, image_path in DEFAULT_PART_IMAGES.items():
-        if keyword in search_text or search_text in keyword:
-            return static(image_path)
-    
-    # Default fallback - placeholder
-    return static('images/parts/placeholder.jpg')
+    return _static_url(resolve_image_path(part_name_or_category) or PLACEHOLDER_IMAGE)
 
 
 @register.simple_tag
 def part_default_image(part):
-    """Get default image URL for a part"""
-    image_url = get_default_part_image(part.name)
-    
-    # If fallback, try category
-    if 'placeholder' in image_url and hasattr(part, 'category'):
-        category_image = get_default_part_image(part.category)
-        if 'placeholder' not in category_image:
-            return category_image
-    
-    return image_url
+    """Get default image URL for a part (resolved when the part was saved)"""
+    path = getattr(part, 'default_image', '') or default_image_for(
+        part.name, getattr(part, 'category', '')
+    )
+    return _static_url(path)
 
 
 @register.filter
@@ -162,6 +35,43 @@ def has_image(obj):
     return bool(obj.image and hasattr(obj.image, 'url'))
 
 
+def _srcset(renditions, fmt):
+    return format_html_join(
+        ', ', '{} {}w',
+        ((default_storage.url(r['name']), r['width']) for r in renditions if r['format'] == fmt)
+    )
+
+
+@register.simple_tag
+def responsive_image(obj, sizes='100vw', css_class='', alt='', loading='lazy'):
+    """
+    <picture> for an uploaded image using its resized renditions
+    (WebP with JPEG fallback, see myapp/images.py), so the browser picks
+    the smallest file for the slot. Falls back to the original upload
+    while renditions are still being built.
+    """
+    data = getattr(obj, 'image_renditions', None) or {}
+    renditions = data.get('renditions') if data.get('source') == obj.image.name else None
+    if not renditions:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="{}" decoding="async">',
+            obj.image.url, alt, css_class, loading
+        )
+    
+    jpegs = [r for r in renditions if r['format'] == 'jpeg']
+    largest = jpegs[-1]
+    return format_html(
+        '<picture style="display: contents">'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" '
+        'loading="{}" decoding="async">'
+        '</picture>',
+        _srcset(renditions, 'webp'), sizes,
+        default_storage.url(jpegs[0]['name']), _srcset(renditions, 'jpeg'), sizes,
+        largest['width'], largest['height'], alt, css_class, loading
+    )
+
+
 # ============================================================================
 # SETUP INSTRUCTIONS
 # ============================================================================
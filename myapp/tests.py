@@ -1,3 +1,1150 @@
-from django.test import TestCase
+import csv
+import importlib
+import json
+import logging
+import os
+import subprocess
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, router
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, reverse
+from PIL import Image
+
+from . import activity, autocomplete, search, urls
+from .activity import INQUIRY_WEIGHT, flush_activity, record_activity, refresh_popularity
+from .db_router import PIN_COOKIE, replica_reads
+from .facets import category_facets, vehicle_facets, vehicle_filter_counts
+from .inventory import MAX_STOCK_DELTA, apply_stock_adjustments
+from .inventory_import import apply_changes, read_inventory
+from .logs import JsonFormatter, QueueingHandler, SamplingFilter, signal_span
+from .metrics import registry, render_metrics
+from .models import Part, PartActivity, PartStock, SearchTerm, VehicleModel, VehicleStock
+from .page_cache import VEHICLE_SLUG_KEY, get_cache
+from .pagination import PAGE_SIZE, encode_cursor
+from .part_images import PLACEHOLDER_IMAGE, default_image_for
+from .related import rebuild_all, related_parts
+from .signals import BIKE_PARTS, CAR_PARTS, default_parts_for, provision_default_parts
+from .templatetags.part_tags import responsive_image
+from .views import PART_ORDERING
+
+
+def create_vehicle(name='City', manufacturer='Honda', vehicle_type='car', slug=None):
+    """A vehicle with its default parts and zero stock rows (from the post_save signal)"""
+    return VehicleModel.objects.create(
+        name=name, manufacturer=manufacturer, vehicle_type=vehicle_type, year_from=2020,
+        slug=slug or f'{manufacturer}-{name}'.lower().replace(' ', '-'),
+    )
+
+
+class VehicleStockProcessingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+
+    def quantities(self):
+        return set(PartStock.objects.filter(part__vehicle_model=self.vehicle).values_list('quantity', flat=True))
+
+    def create_stock(self, **kwargs):
+        return VehicleStock.objects.create(
+            vehicle_model=self.vehicle, chassis_number='MA3EWB22S00123456', year=2020,
+            acquired_date='2024-01-15', **kwargs
+        )
+
+    def test_processing_adds_one_of_every_part_once(self):
+        vehicle_stock = self.create_stock()
+        self.assertEqual(self.quantities(), {0})
+
+        vehicle_stock.is_processed = True
+        vehicle_stock.save()
+        self.assertEqual(self.quantities(), {1})
+        vehicle_stock.refresh_from_db()
+        self.assertIsNotNone(vehicle_stock.processed_date)
+
+        vehicle_stock.save()
+        self.assertEqual(self.quantities(), {1})
+
+    def test_a_stale_instance_cannot_process_twice(self):
+        # Two requests loaded the row before either saved it
+        first = self.create_stock()
+        second = VehicleStock.objects.get(pk=first.pk)
+        for vehicle_stock in (first, second):
+            vehicle_stock.is_processed = True
+            vehicle_stock.save()
+        self.assertEqual(self.quantities(), {1})
+
+    def test_created_processed(self):
+        self.create_stock(is_processed=True)
+        self.assertEqual(self.quantities(), {1})
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.available_parts_count, self.vehicle.total_parts_count)
+
+
+class DefaultImageTests(TestCase):
+    def test_resolution_order(self):
+        cases = [
+            (('Front Bumper', 'Body'), 'images/parts/bumper-front.jpg'),  # exact name
+            (('Front Brake Disc (Used)', ''), 'images/parts/brake-disc.jpg'),  # longest keyword inside
+            (('bumper', ''), 'images/parts/bumper-front.jpg'),  # inside a keyword
+            (('Widget', 'Spark Plug'), 'images/parts/spark-plug.jpg'),  # by category
+            (('Widget', 'Misc'), PLACEHOLDER_IMAGE),
+        ]
+        for args, expected in cases:
+            self.assertEqual(default_image_for(*args), expected, args)
+
+    def test_saved_on_the_part(self):
+        vehicle = create_vehicle()
+        part = vehicle.parts.get(name='Radiator')
+        self.assertEqual(part.default_image, 'images/parts/radiator.jpg')
+        part.name = 'Battery'
+        part.save()
+        part.refresh_from_db()
+        self.assertEqual(part.default_image, 'images/parts/battery.jpg')
+
+
+class ProvisionDefaultPartsTests(TestCase):
+    def test_query_count_does_not_grow_with_the_part_list(self):
+        counts = {}
+        for vehicle_type, name in [('bike', 'Shine'), ('car', 'Jazz')]:
+            with CaptureQueriesContext(connection) as queries:
+                vehicle = create_vehicle(name, vehicle_type=vehicle_type)
+            counts[vehicle_type] = len(queries)
+            parts = vehicle.parts.all()
+            self.assertEqual(parts.count(), len(default_parts_for(vehicle)))
+            self.assertEqual(PartStock.objects.filter(part__in=parts).count(), parts.count())
+            vehicle.refresh_from_db()
+            self.assertEqual(vehicle.total_parts_count, parts.count())
+        self.assertNotEqual(len(CAR_PARTS), len(BIKE_PARTS))
+        self.assertEqual(counts['bike'], counts['car'])
+
+    def test_only_missing_parts_are_added(self):
+        vehicle = create_vehicle()
+        vehicle.parts.filter(name='Bonnet').delete()
+        added = provision_default_parts([vehicle], only_missing=True)
+        self.assertEqual([part.name for part in added], ['Bonnet'])
+        self.assertEqual(provision_default_parts([vehicle], only_missing=True), [])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), IMAGE_RENDITIONS_ASYNC=False)
+class ImageRenditionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.part = create_vehicle().parts.first()
+
+    def upload(self, name, size, mode='RGBA'):
+        buffer = BytesIO()
+        Image.new(mode, size, (200, 30, 30, 128) if mode == 'RGBA' else (200, 30, 30)).save(buffer, 'PNG')
+        self.part.image = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.save()
+        self.part.refresh_from_db()
+        return self.part.image_renditions
+
+    def test_upload_gets_webp_and_jpeg_at_each_smaller_width(self):
+        data = self.upload('door.png', (800, 400))
+        self.assertEqual((data['source'], data['width'], data['height']), (self.part.image.name, 800, 400))
+        self.assertEqual(
+            sorted((r['format'], r['width'], r['height']) for r in data['renditions']),
+            [('jpeg', 320, 160), ('jpeg', 640, 320), ('webp', 320, 160), ('webp', 640, 320)],
+        )
+        for rendition in data['renditions']:
+            with default_storage.open(rendition['name']) as f, Image.open(f) as image:
+                self.assertEqual(image.format, rendition['format'].upper())
+                self.assertEqual(image.size, (rendition['width'], rendition['height']))
+
+        html = responsive_image(self.part, sizes='50vw')
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(' 640w', html)
+        self.assertIn('width="640" height="320"', html)
+
+    def test_small_upload_is_not_upscaled_and_replacing_it_cleans_up(self):
+        old = self.upload('small.png', (200, 100), mode='RGB')
+        self.assertEqual({r['width'] for r in old['renditions']}, {200})
+
+        self.upload('large.png', (1200, 600))
+        for rendition in old['renditions']:
+            self.assertFalse(default_storage.exists(rendition['name']))
+
+
+class AdminQueryBudgetTests(TestCase):
+    """
+    The admin changelists and change form must run a fixed number of
+    queries, however many vehicles / parts the catalog holds.
+    Each request includes 2 queries for the session and the user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.vehicle = cls.create_vehicles(1)[0]
+
+    @staticmethod
+    def create_vehicles(count, start=0):
+        # Each vehicle gets its ~40 default parts from the post_save signal
+        return [create_vehicle(f'Model {i}') for i in range(start, start + count)]
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        ContentType.objects.clear_cache()
+
+    def assertBudget(self, url, queries):
+        """Same query count with one vehicle and with several"""
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        self.create_vehicles(3, start=1)
+        ContentType.objects.clear_cache()
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_vehicle_changelist(self):
+        self.assertBudget('/admin/myapp/vehiclemodel/', 6)
+
+    def test_part_changelist(self):
+        self.assertBudget('/admin/myapp/part/', 7)
+
+    def test_part_changelist_filtered_by_vehicle(self):
+        self.assertBudget(f'/admin/myapp/part/?vehicle_model__id__exact={self.vehicle.pk}', 8)
+
+    def test_vehicle_change_form(self):
+        self.assertBudget(f'/admin/myapp/vehiclemodel/{self.vehicle.pk}/change/', 4)
+
+    def test_increase_all_stock_needs_change_permission(self):
+        self.client.force_login(User.objects.create_user('viewer', is_staff=True))
+        url = reverse('admin:myapp_vehiclemodel_increase_all_stock', args=[self.vehicle.pk])
+        response = self.client.post(url, {'delta': 5})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(PartStock.objects.filter(part__vehicle_model=self.vehicle, quantity__gt=0).exists())
+
+    def test_stock_grid_page(self):
+        self.assertBudget(f'/admin/myapp/vehiclemodel/{self.vehicle.pk}/stock-grid/', 5)
+
+
+class StockGridTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.vehicle = create_vehicle()
+        cls.url = f'/admin/myapp/vehiclemodel/{cls.vehicle.pk}/stock-grid/'
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def save(self, rows):
+        return self.client.post(f'{self.url}save/', json.dumps({'rows': rows}), content_type='application/json')
+
+    def test_pages_cover_every_part_once(self):
+        seen = []
+        data = self.client.get(self.url).json()
+        self.assertIn('Body', data['categories'])
+        seen += [row['part_id'] for row in data['rows']]
+        while data['next_cursor']:
+            data = self.client.get(self.url, {'cursor': data['next_cursor']}).json()
+            seen += [row['part_id'] for row in data['rows']]
+        self.assertEqual(sorted(seen), sorted(self.vehicle.parts.values_list('id', flat=True)))
+
+    def test_save_changed_rows(self):
+        stock = PartStock.objects.filter(part__vehicle_model=self.vehicle).first()
+        response = self.save([{
+            'stock_id': stock.pk, 'quantity': 5, 'low_stock_threshold': 1, 'expected': stock.quantity,
+        }])
+        self.assertEqual(response.status_code, 200)
+        stock.refresh_from_db()
+        self.assertEqual((stock.quantity, stock.low_stock_threshold), (5, 1))
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.available_parts_count, 1)
+
+    def test_stale_row_is_rejected(self):
+        stock = PartStock.objects.filter(part__vehicle_model=self.vehicle).first()
+        response = self.save([{
+            'stock_id': stock.pk, 'quantity': 5, 'low_stock_threshold': 1, 'expected': stock.quantity + 1,
+        }])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['stock_ids'], [stock.pk])
+        stock.refresh_from_db()
+        self.assertEqual(stock.quantity, 0)
+
+    def test_increase_all_stock_of_one_category(self):
+        url = reverse('admin:myapp_vehiclemodel_increase_all_stock', args=[self.vehicle.pk])
+        glass = self.vehicle.parts.filter(category='Glass').count()
+        response = self.client.post(url, {'delta': 2, 'category': 'Glass'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['updates']), glass)
+        quantities = dict(
+            PartStock.objects.filter(part__vehicle_model=self.vehicle)
+            .values_list('part__category', 'quantity').distinct()
+        )
+        self.assertEqual((quantities['Glass'], quantities['Body']), (2, 0))
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.available_parts_count, glass)
+
+        # Session, user, vehicle, missing stock rows, one UPDATE, counters,
+        # result, plus a savepoint pair - whatever the number of parts
+        with self.assertNumQueries(9):
+            self.client.post(url, {'delta': 1})
+        self.assertEqual(self.client.post(url, {'delta': 0}).status_code, 400)
+
+
+@override_settings(METRICS_DIR=tempfile.mkdtemp(), METRICS_TOKEN='scrape-token')
+class MetricsTests(TestCase):
+
+    def test_requires_staff_or_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-token')
+        self.assertEqual(response.status_code, 200)
+
+    def test_records_views(self):
+        self.client.get('/')
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('myapp_http_requests_total{method="GET",status="200",view="myapp:home"}', body)
+        self.assertIn('myapp_http_request_duration_seconds_bucket{view="myapp:home",le="+Inf"}', body)
+        self.assertIn('myapp_template_render_duration_seconds_count{template="myapp/home.html"}', body)
+
+    def test_exited_workers_are_folded_into_retired_totals(self):
+        directory = tempfile.mkdtemp()
+        exited = subprocess.Popen(['true'])
+        exited.wait()
+        snapshot = {'counters': [['myapp_log_records_dropped_total', [], 5]], 'histograms': []}
+        # An exited worker, and an earlier process that had this pid
+        for name in [f'{exited.pid}-1.json', f'{os.getpid()}-1.json']:
+            with open(os.path.join(directory, name), 'w') as f:
+                json.dump(snapshot, f)
+
+        with override_settings(METRICS_DIR=directory):
+            dropped = registry.counters[registry._key('myapp_log_records_dropped_total', {})]
+            for _ in range(2):
+                body = render_metrics()
+                self.assertIn(f'myapp_log_records_dropped_total {int(dropped) + 10}\n', body)
+        self.assertEqual(sorted(os.listdir(directory)), sorted([
+            '.scrape.lock', 'retired.json', registry.snapshot_name(),
+        ]))
+
+    def test_unusable_directory_serves_this_process(self):
+        # A directory below a regular file can be neither created nor read
+        with tempfile.NamedTemporaryFile() as f, override_settings(METRICS_DIR=os.path.join(f.name, 'metrics')):
+            registry.inc('myapp_log_records_dropped_total', {})
+            dropped = registry.counters[registry._key('myapp_log_records_dropped_total', {})]
+            with self.assertLogs('myapp.metrics', logging.WARNING):
+                body = render_metrics()
+        self.assertIn(f'myapp_log_records_dropped_total {int(dropped)}\n', body)
+
+
+class LoggingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+
+    def record(self, level=logging.INFO, **extra):
+        record = logging.LogRecord('myapp.signals', level, __file__, 1, 'signal %s', ('x',), None)
+        record.__dict__.update(extra)
+        return record
+
+    def test_json_lines_carry_extra_fields(self):
+        data = json.loads(JsonFormatter().format(self.record(span='x', rows=3)))
+        self.assertEqual((data['message'], data['span'], data['rows']), ('signal x', 'x', 3))
+
+    def test_sampling_keeps_warnings(self):
+        never = SamplingFilter(0)
+        self.assertFalse(never.filter(self.record()))
+        self.assertTrue(never.filter(self.record(logging.WARNING)))
+
+    def test_full_queue_drops_and_counts(self):
+        handler = QueueingHandler(maxsize=1)
+        key = registry._key('myapp_log_records_dropped_total', {})
+        before = registry.counters[key]
+        handler.enqueue(self.record())
+        handler.enqueue(self.record())
+        self.assertEqual(handler.dropped, 1)
+        self.assertEqual(registry.counters[key], before + 1)
+
+    def spans(self, logs):
+        return {record.span: record for record in logs.records}
+
+    @override_settings(LOG_SPAN_SAMPLE_RATE=0)
+    def test_unsampled_spans_are_not_timed(self):
+        with self.assertLogs('myapp.signals', logging.DEBUG) as logs:
+            with signal_span('x') as span:
+                self.assertIsNone(span)
+            logging.getLogger('myapp.signals').warning('end')
+        self.assertEqual([record.getMessage() for record in logs.records], ['end'])
+
+    @override_settings(LOG_SPAN_SAMPLE_RATE=1)
+    def test_handlers_report_rows_they_write(self):
+        stock = PartStock.objects.filter(part__vehicle_model=self.vehicle).first()
+        stock.quantity = 2
+        with self.assertLogs('myapp.signals', logging.DEBUG) as logs:
+            stock.save()
+        span = self.spans(logs)['update_counters_on_stock_save']
+        self.assertEqual((span.rows, span.sender), (1, 'PartStock'))
+        self.assertGreaterEqual(span.queries, 2)
+
+        self.vehicle.name = 'Amaze'
+        with self.assertLogs('myapp.signals', logging.DEBUG) as logs:
+            self.vehicle.save()
+        self.assertEqual(self.spans(logs)['create_default_parts_for_vehicle'].rows, self.vehicle.parts.count())
+
+
+class BenchmarkTests(TestCase):
+
+    def test_regression_against_baseline_fails(self):
+        call_command('seed_catalog', vehicles=2, seed=1, stdout=StringIO())
+        directory = tempfile.mkdtemp()
+        output = os.path.join(directory, 'results.json')
+        baseline = os.path.join(directory, 'baseline.json')
+        options = {'iterations': 2, 'output': output, 'baseline': baseline, 'stdout': StringIO()}
+
+        call_command('run_benchmarks', update_baseline=True, **options)
+        with open(baseline) as f:
+            report = json.load(f)
+        self.assertEqual(report['results']['parts_list']['status'], 200)
+        self.assertEqual(report['results']['stock_adjust_batch']['status'], 200)
+        self.assertEqual(report['results']['stock_adjust_cross_zero']['status'], 200)
+        # Nothing the benchmark wrote is kept
+        self.assertFalse(User.objects.filter(username='benchmark').exists())
+
+        for result in report['results'].values():
+            result['queries'] = 0
+        with open(baseline, 'w') as f:
+            json.dump(report, f)
+        with self.assertRaisesMessage(CommandError, 'benchmark regression'):
+            call_command('run_benchmarks', stderr=StringIO(), **options)
+
+
+# Shares the test's connection: other connections cannot see its data
+@override_settings(CATALOG_ASYNC_PARALLEL_QUERIES=False, CATALOG_PAGE_CACHE=True)
+class AsyncCatalogViewTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.route_catalog(async_views=True)
+        cls.addClassCleanup(cls.route_catalog, async_views=False)
+
+    @staticmethod
+    def route_catalog(async_views):
+        with override_settings(ASYNC_CATALOG_VIEWS=async_views):
+            importlib.reload(urls)
+        clear_url_caches()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        PartStock.objects.filter(part__vehicle_model=cls.vehicle).update(quantity=3)
+        cls.part = cls.vehicle.parts.order_by('category', 'name').first()
+
+    def setUp(self):
+        get_cache().clear()
+
+    async def test_pages_render(self):
+        for url in ['/', '/vehicles/', self.vehicle.get_absolute_url(), f'/search/?q={self.part.name}']:
+            response = await self.async_client.get(url)
+            self.assertEqual(response.status_code, 200, url)
+        response = await self.async_client.get(self.vehicle.get_absolute_url())
+        self.assertContains(response, self.part.name)
+        self.assertContains(response, self.part.category)
+
+    async def test_part_detail_and_missing_part(self):
+        response = await self.async_client.get(self.part.get_absolute_url())
+        self.assertContains(response, self.part.name)
+        response = await self.async_client.get(f'{self.vehicle.get_absolute_url()}no-such-part/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_page_cache_and_conditional_get(self):
+        url = self.vehicle.get_absolute_url()
+        first = await self.async_client.get(url)
+        self.assertEqual(first['X-Page-Cache'], 'miss')
+        second = await self.async_client.get(url)
+        self.assertEqual(second['X-Page-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+        response = await self.async_client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        # Search only lists parts in stock
+        PartStock.objects.filter(part__vehicle_model=cls.vehicle, part__name='Front Bumper').update(quantity=1)
+
+    def result_names(self, query):
+        response = self.client.get(reverse('myapp:search'), {'q': query})
+        return [str(part) for part in response.context['results']]
+
+    def test_results_are_ranked_and_only_in_stock(self):
+        # "bumper" twice in its document: ranks above Front Bumper
+        clip = Part.objects.create(vehicle_model=self.vehicle, name='Bumper Clip', category='Bumper', slug='bumper-clip')
+        PartStock.objects.filter(part=clip).update(quantity=3)
+        self.assertEqual(self.result_names('bumper'), [
+            'Bumper Clip - Honda City (CAR)',
+            'Front Bumper - Honda City (CAR)',
+        ])
+        # Every word must match, as a prefix
+        self.assertEqual(self.result_names('fro bump'), ['Front Bumper - Honda City (CAR)'])
+
+    def test_typos_are_corrected_when_nothing_matches(self):
+        response = self.client.get(reverse('myapp:search'), {'q': 'frnt bumpr'})
+        self.assertEqual([str(part) for part in response.context['results']], ['Front Bumper - Honda City (CAR)'])
+        self.assertEqual(search.correct_tokens(['bumpr'])[0][0], 'bumper')
+
+    def test_overlong_words_stay_out_of_the_vocabulary(self):
+        word = 'x' * 150
+        Part.objects.create(vehicle_model=self.vehicle, name=f'Clip {word}', category='Bumper', slug='long-clip')
+        self.assertTrue(SearchTerm.objects.filter(term='clip').exists())
+        self.assertFalse(SearchTerm.objects.filter(term=word).exists())
+
+    def test_renamed_vehicle_is_reindexed(self):
+        self.vehicle.name = 'Amaze'
+        self.vehicle.save()
+        self.assertIn('Front Bumper - Honda Amaze (CAR)', self.result_names('amaze bumper'))
+        self.assertEqual(self.result_names('city bumper'), [])
+
+    def test_saves_that_keep_the_name_skip_the_reindex(self):
+        with mock.patch.object(search, 'reindex_vehicle') as reindex:
+            self.vehicle.year_to = 2024
+            self.vehicle.save()
+            VehicleModel.objects.get(pk=self.vehicle.pk).save()
+            reindex.assert_not_called()
+
+            self.vehicle.manufacturer = 'Honda Cars'
+            self.vehicle.save()
+            reindex.assert_called_once_with(self.vehicle)
+
+
+class AutocompleteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+
+    def setUp(self):
+        # Every test starts without a trie, like a fresh worker
+        patcher = mock.patch.object(autocomplete, '_trie', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def suggest(self, query):
+        response = self.client.get(reverse('myapp:autocomplete'), {'q': query})
+        return [(entry['kind'], entry['label']) for entry in response.json()['suggestions']]
+
+    def test_vehicles_are_found_by_any_word_and_listed_first(self):
+        self.assertEqual(self.suggest('cit')[0], ('vehicle', 'Honda City'))
+        self.assertIn(('vehicle', 'Honda City'), self.suggest('hon'))
+        self.assertIn(('part', 'Front Bumper'), self.suggest('bump'))
+
+    def test_short_categories_are_not_suggested(self):
+        # Search ignores 2-letter queries, so the link would show nothing
+        self.assertNotIn(('category', 'AC'), self.suggest('a'))
+        self.assertIn(('category', 'Body'), self.suggest('bod'))
+
+    def test_removing_a_top_entry_promotes_the_next_one(self):
+        trie = autocomplete.PrefixTrie()
+        for i in range(autocomplete.MAX_SUGGESTIONS + 1):
+            trie.add(('part', i), {'label': f'Door {i}', 'kind': 'part', 'url': ''})
+        trie.add(('vehicle', 1), {'label': 'Dodge Door', 'kind': 'vehicle', 'url': ''})
+        labels = [entry['label'] for entry in trie.suggest('do')]
+        self.assertEqual(labels[:2], ['Dodge Door', 'Door 0'])
+        self.assertEqual(len(labels), autocomplete.MAX_SUGGESTIONS)
+
+        trie.remove(('vehicle', 1))
+        labels = [entry['label'] for entry in trie.suggest('do')]
+        self.assertEqual(labels, [f'Door {i}' for i in range(autocomplete.MAX_SUGGESTIONS)])
+
+    def test_vehicles_saved_by_other_workers_appear_after_the_ttl(self):
+        self.assertEqual(self.suggest('jazz'), [])
+        # bulk_create skips the signal hooks, like a save in another process
+        VehicleModel.objects.bulk_create([VehicleModel(
+            name='Jazz', manufacturer='Honda', vehicle_type='car', year_from=2020, slug='honda-jazz',
+        )])
+        self.assertEqual(self.suggest('jazz'), [])
+
+        autocomplete._trie_built_at -= autocomplete.TRIE_TTL + 1
+        with self.assertNumQueries(1):
+            self.assertEqual(self.suggest('jazz'), [('vehicle', 'Honda Jazz')])
+
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        PartStock.objects.filter(part__vehicle_model=cls.vehicle).update(quantity=1)
+
+    def test_pages_meet_without_gaps_or_repeats(self):
+        url = self.vehicle.get_absolute_url()
+        response = self.client.get(url)
+        seen = [part.pk for part in response.context['parts']]
+        self.assertEqual(len(seen), PAGE_SIZE)
+        next_url = response.context['next_url']
+        while next_url:
+            response = self.client.get(f'{url}{next_url}')
+            self.assertTrue(response.context['parts'])
+            seen += [part.pk for part in response.context['parts']]
+            next_url = response.context['next_url']
+        # The "load more" JSON carries the same cursor
+        data = self.client.get(url, {'format': 'json'}).json()
+        self.assertEqual(data['next_url'], self.client.get(url).context['next_url'])
+
+        expected = Part.objects.filter(vehicle_model=self.vehicle).order_by(*PART_ORDERING)
+        self.assertEqual(seen, list(expected.values_list('pk', flat=True)))
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        first = [part.pk for part in self.client.get(self.vehicle.get_absolute_url()).context['parts']]
+        for values in (['a', {'x': 1}, 'z'], ['Body', 'Bonnet', 'z'], ['Body', None, 1], [1, 2]):
+            cursor = encode_cursor(values)
+            response = self.client.get(self.vehicle.get_absolute_url(), {'cursor': cursor})
+            self.assertEqual(response.status_code, 200, values)
+            self.assertEqual([part.pk for part in response.context['parts']], first)
+            response = self.client.get('/search/', {'q': 'bumper', 'cursor': cursor})
+            self.assertEqual(response.status_code, 200, values)
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.total = cls.vehicle.parts.count()
+
+    def assertCounters(self, available, total):
+        self.vehicle.refresh_from_db()
+        self.assertEqual(
+            (self.vehicle.available_parts_count, self.vehicle.total_parts_count), (available, total)
+        )
+
+    def test_stock_crossing_zero_moves_the_available_count(self):
+        self.assertCounters(0, self.total)
+        stock = PartStock.objects.filter(part__vehicle_model=self.vehicle).first()
+        for quantity, available in [(2, 1), (5, 1), (0, 0), (1, 1)]:
+            stock.quantity = quantity
+            stock.save()
+            self.assertCounters(available, self.total)
+
+    def test_batch_adjustments_cross_zero_too(self):
+        stock_ids = list(PartStock.objects.filter(part__vehicle_model=self.vehicle).values_list('pk', flat=True)[:3])
+        apply_stock_adjustments([(pk, 2) for pk in stock_ids])
+        self.assertCounters(3, self.total)
+        apply_stock_adjustments([(stock_ids[0], -2), (stock_ids[1], -1)])
+        self.assertCounters(2, self.total)
+
+    def test_deactivating_and_deleting_parts(self):
+        part = Part.objects.filter(vehicle_model=self.vehicle).first()
+        part.stock.quantity = 4
+        part.stock.save()
+        self.assertCounters(1, self.total)
+
+        part.is_active = False
+        part.save()
+        self.assertCounters(0, self.total)
+        part.delete()
+        self.assertCounters(0, self.total - 1)
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.part = cls.vehicle.parts.first()
+
+    def test_unchanged_pages_answer_304(self):
+        for url in [self.vehicle.get_absolute_url(), self.part.get_absolute_url()]:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            revalidated = self.client.get(url, headers={'If-None-Match': response['ETag']})
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(revalidated.content, b'')
+            since = self.client.get(url, headers={'If-Modified-Since': response['Last-Modified']})
+            self.assertEqual(since.status_code, 304)
+
+    def test_stock_changes_and_deletions_move_the_etag(self):
+        url = self.vehicle.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        stock = self.part.stock
+        stock.quantity = 3
+        stock.save()
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+        # Deleting a part moves no timestamp; the part count catches it
+        etag = response['ETag']
+        self.vehicle.parts.exclude(pk=self.part.pk).first().delete()
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 200)
+
+    def test_unknown_vehicle_is_a_404(self):
+        response = self.client.get(reverse('myapp:parts_list', kwargs={'vehicle_slug': 'no-such-car'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class StockBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.stock_ids = list(PartStock.objects.filter(part__vehicle_model=cls.vehicle).values_list('pk', flat=True)[:3])
+        PartStock.objects.filter(pk__in=cls.stock_ids).update(quantity=2)
+        cls.user = User.objects.create_user('staff', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, adjustments):
+        return self.client.post(
+            reverse('myapp:adjust_stock_batch'),
+            json.dumps({'adjustments': [{'stock_id': pk, 'delta': delta} for pk, delta in adjustments]}),
+            content_type='application/json',
+        )
+
+    def quantities(self):
+        return list(PartStock.objects.filter(pk__in=self.stock_ids).order_by('pk').values_list('quantity', flat=True))
+
+    def test_deltas_for_one_row_are_summed(self):
+        first, second, third = self.stock_ids
+        response = self.post([(first, 3), (second, -2), (first, -1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['stock_id']: row['quantity'] for row in response.json()['updates']}, {first: 4, second: 0})
+        self.assertEqual(self.quantities(), [4, 0, 2])
+
+    def test_one_bad_row_rolls_back_the_batch(self):
+        first, second, third = self.stock_ids
+        response = self.post([(first, 5), (second, -1), (third, -3)])
+        self.assertEqual(response.status_code, 409)
+        data = response.json()
+        self.assertEqual(data['stock_ids'], [third])
+        # Current values, so the client can resync
+        self.assertEqual({row['quantity'] for row in data['updates']}, {2})
+        self.assertEqual(self.quantities(), [2, 2, 2])
+
+        response = self.post([(first, 1), (0, 1)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['stock_ids'], [0])
+        self.assertEqual(self.quantities(), [2, 2, 2])
+
+    def test_oversized_deltas_are_refused(self):
+        first, second, third = self.stock_ids
+        self.assertEqual(self.post([(first, 2 ** 40)]).status_code, 400)
+        # Each within the bound, but not their sum
+        response = self.post([(first, MAX_STOCK_DELTA), (first, 1), (second, 1)])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['stock_ids'], [first])
+        self.assertEqual(self.quantities(), [2, 2, 2])
+
+    def test_malformed_body(self):
+        response = self.client.post(reverse('myapp:adjust_stock_batch'), '{"adjustments": [{"stock_id": "x"}]}',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CATALOG_PAGE_CACHE=True, RELATED_PARTS_ASYNC=False)
+class PageCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.stock = PartStock.objects.filter(part__vehicle_model=cls.vehicle).select_related('part').first()
+        PartStock.objects.filter(pk=cls.stock.pk).update(quantity=2)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_stock_change_invalidates_the_page(self):
+        url = self.vehicle.get_absolute_url()
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stock_adjustments([(self.stock.pk, -2)])
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertNotContains(response, self.stock.part.name)
+
+    def test_fragment_and_page_are_cached_apart(self):
+        url = f'{self.vehicle.get_absolute_url()}?category=e'
+        fragment = self.client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(fragment['Content-Type'], 'application/json')
+
+        page = self.client.get(url)
+        self.assertEqual(page['X-Page-Cache'], 'miss')
+        self.assertTrue(page['Content-Type'].startswith('text/html'))
+        self.assertNotEqual(page['ETag'], fragment['ETag'])
+
+        hit = self.client.get(url, headers={'X-Requested-With': 'XMLHttpRequest'})
+        self.assertEqual(hit['X-Page-Cache'], 'hit')
+        self.assertEqual(hit['Content-Type'], 'application/json')
+        # Headers the view set are replayed
+        self.assertIn('X-Requested-With', hit['Vary'])
+
+    def test_renamed_slug_is_forgotten(self):
+        self.client.get(self.vehicle.get_absolute_url())
+        self.assertEqual(get_cache().get(VEHICLE_SLUG_KEY.format('honda-city')), self.vehicle.pk)
+
+        vehicle = VehicleModel.objects.get(pk=self.vehicle.pk)
+        vehicle.slug = 'honda-city-2014'
+        vehicle.save()
+        self.assertIsNone(get_cache().get(VEHICLE_SLUG_KEY.format('honda-city')))
+
+    @override_settings(CATALOG_PAGE_CACHE=False)
+    def test_off_without_a_shared_cache(self):
+        url = self.vehicle.get_absolute_url()
+        self.client.get(url)
+        self.assertNotIn('X-Page-Cache', self.client.get(url))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'], REPLICA_PIN_SECONDS=7)
+class ReplicaRouterTests(TestCase):
+
+    def test_only_catalog_reads_in_public_views_use_replicas(self):
+        @replica_reads
+        def view(request):
+            return router.db_for_read(Part), router.db_for_read(User), router.db_for_write(Part)
+
+        self.assertEqual(view(RequestFactory().get('/')), ('replica1', 'default', 'default'))
+        self.assertEqual(router.db_for_read(Part), 'default')
+
+        pinned = RequestFactory().get('/')
+        pinned.COOKIES[PIN_COOKIE] = '1'
+        self.assertEqual(view(pinned)[0], 'default')
+
+    def test_stock_change_pins_to_primary(self):
+        vehicle = create_vehicle()
+        stock = PartStock.objects.filter(part__vehicle_model=vehicle).first()
+        self.client.force_login(User.objects.create_user('staff', is_staff=True))
+        response = self.client.post(
+            '/admin-api/stock/adjust/',
+            json.dumps({'adjustments': [{'stock_id': stock.pk, 'delta': 1}]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 7)
+
+
+@override_settings(CATALOG_PAGE_CACHE=True, RELATED_PARTS_ASYNC=False)
+class FacetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = create_vehicle()
+        create_vehicle('Shine', vehicle_type='bike')
+        create_vehicle('Swift', manufacturer='Maruti Suzuki', slug='maruti-swift')
+        cls.stocks = list(PartStock.objects.filter(part__vehicle_model=cls.city).select_related('part')[:3])
+        PartStock.objects.filter(pk__in=[stock.pk for stock in cls.stocks]).update(quantity=2)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def test_category_counts_follow_stock_changes(self):
+        expected = {}
+        for stock in self.stocks:
+            expected[stock.part.category] = expected.get(stock.part.category, 0) + 1
+        self.assertEqual(dict(category_facets(self.city.pk)), expected)
+
+        with self.assertNumQueries(0):
+            category_facets(self.city.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stock_adjustments([(self.stocks[0].pk, -2)])
+        expected[self.stocks[0].part.category] -= 1
+        self.assertEqual(dict(category_facets(self.city.pk)), {k: v for k, v in expected.items() if v})
+
+    def test_vehicle_filter_counts(self):
+        counts = vehicle_filter_counts(vehicle_facets(), vehicle_type='car')
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(counts['types'], {'car': 2, 'bike': 1})
+        self.assertEqual(counts['manufacturers'], [('Honda', 1), ('Maruti Suzuki', 1)])
+
+        counts = vehicle_filter_counts(vehicle_facets(), manufacturer='honda')
+        self.assertEqual(counts['total'], 2)
+        self.assertEqual(counts['types'], {'car': 1, 'bike': 1})
+
+    def test_parts_list_shows_counts(self):
+        stock = self.stocks[0]
+        response = self.client.get(self.city.get_absolute_url())
+        self.assertContains(response, f'All Categories ({len(self.stocks)})')
+        count = dict(category_facets(self.city.pk))[stock.part.category]
+        self.assertContains(response, f'{stock.part.category} ({count})')
+
+
+# Re-rank inline: a worker thread's connection cannot see the test's data
+@override_settings(RELATED_PARTS_ASYNC=False)
+class RelatedPartsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.city = create_vehicle()
+        cls.amaze = create_vehicle('Amaze')
+        parts = {part.name: part for part in Part.objects.filter(vehicle_model=cls.city)}
+        cls.front_bumper = parts['Front Bumper']
+        cls.rear_bumper = parts['Rear Bumper']
+        cls.bonnet = parts['Bonnet']
+        cls.boot_lid = parts['Boot Lid']
+        cls.sister_bumper = Part.objects.get(vehicle_model=cls.amaze, name='Front Bumper')
+        PartStock.objects.filter(part__in=[
+            cls.front_bumper, cls.rear_bumper, cls.bonnet, cls.sister_bumper,
+        ]).update(quantity=1)
+        Part.objects.filter(pk=cls.bonnet.pk).update(popularity=10)
+        Part.objects.filter(pk=cls.boot_lid.pk).update(popularity=100)
+        rebuild_all()
+
+    def setUp(self):
+        get_cache().clear()
+
+    def _related(self, part):
+        return related_parts(Part.objects.get(pk=part.pk))
+
+    def test_ranks_in_stock_then_popular_then_same_vehicle(self):
+        self.assertEqual(self._related(self.front_bumper), [self.bonnet, self.rear_bumper, self.sister_bumper])
+
+        response = self.client.get(self.front_bumper.get_absolute_url())
+        self.assertEqual(response.context['related_parts'], [self.bonnet, self.rear_bumper, self.sister_bumper])
+
+    def test_stock_change_reranks_siblings(self):
+        stock = PartStock.objects.get(part=self.boot_lid)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stock_adjustments([(stock.pk, 1)])
+
+        self.assertEqual(self._related(self.front_bumper)[0], self.boot_lid)
+        self.assertIs(Part.objects.get(pk=self.boot_lid.pk).ranked_in_stock, True)
+
+    def test_sister_model_change_moves_the_etag(self):
+        url = self.front_bumper.get_absolute_url()
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        # Only the Amaze changes, but the City page lists its bumper
+        stock = PartStock.objects.get(part=self.sister_bumper)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_stock_adjustments([(stock.pk, -1)])
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(self.sister_bumper, response.context['related_parts'])
+
+    @override_settings(ACTIVITY_FLUSH_INTERVAL=0)
+    def test_beacon_activity_feeds_popularity(self):
+        url = reverse('myapp:part_activity', args=[self.rear_bumper.pk])
+        self.assertEqual(self.client.post(url, {'kind': 'view'}).status_code, 204)
+        self.assertEqual(self.client.post(url, {'kind': 'inquiry'}).status_code, 204)
+        self.assertEqual(self.client.post(url, {'kind': 'like'}).status_code, 400)
+
+        refresh_popularity()
+        self.assertEqual(Part.objects.get(pk=self.rear_bumper.pk).popularity, 1 + INQUIRY_WEIGHT)
+
+    def test_flush_skips_unknown_parts_in_one_update(self):
+        url = reverse('myapp:part_activity', args=[self.rear_bumper.pk])
+        with override_settings(ACTIVITY_FLUSH_INTERVAL=3600):
+            self.client.post(url, {'kind': 'view'})
+            self.client.post(url, {'kind': 'view'})
+            self.client.post(reverse('myapp:part_activity', args=[self.bonnet.pk]), {'kind': 'inquiry'})
+            self.client.post(reverse('myapp:part_activity', args=[10 ** 9]), {'kind': 'view'})
+        # Savepoint, part lookup, insert of the day's rows, one UPDATE for every part, release
+        with self.assertNumQueries(5):
+            flush_activity()
+        self.assertEqual(
+            set(PartActivity.objects.values_list('part_id', 'views', 'inquiries')),
+            {(self.rear_bumper.pk, 2, 0), (self.bonnet.pk, 0, 1)},
+        )
+
+    @override_settings(ACTIVITY_FLUSH_INTERVAL=3600)
+    def test_buffer_is_capped(self):
+        with mock.patch.object(activity, 'ACTIVITY_MAX_PENDING', 2):
+            for part_id in range(1, 6):
+                record_activity(part_id, 'views')
+            record_activity(1, 'views')
+            self.assertEqual(dict(activity._pending), {(1, 'views'): 2, (2, 'views'): 1})
+        activity._pending.clear()
+
+
+class ExportInventoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.stock = PartStock.objects.filter(part__vehicle_model=cls.vehicle).select_related('part').first()
+        PartStock.objects.filter(pk=cls.stock.pk).update(quantity=3)
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'password')
+
+    def test_streams_csv_and_ndjson_to_staff(self):
+        url = reverse('myapp:export_inventory')
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.client.force_login(self.staff)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(len(rows), Part.objects.count())
+        row = next(row for row in rows if row['part_id'] == str(self.stock.part_id))
+        self.assertEqual(row['vehicle_slug'], 'honda-city')
+        self.assertEqual(row['part_slug'], self.stock.part.slug)
+        self.assertEqual(row['quantity'], '3')
+
+        response = self.client.get(url, {'format': 'ndjson'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), Part.objects.count())
+        self.assertEqual(json.loads(lines[0])['vehicle'], 'City')
+        self.assertEqual(self.client.get(url, {'format': 'xml'}).status_code, 400)
+
+    def test_command_matches_endpoint(self):
+        out = StringIO()
+        call_command('export_inventory', '--format=ndjson', '--chunk-size=7', stdout=out)
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([record['part_id'] for record in records], sorted(Part.objects.values_list('pk', flat=True)))
+
+
+@override_settings(RELATED_PARTS_ASYNC=False)
+class ImportInventoryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        cls.bumper = Part.objects.get(vehicle_model=cls.vehicle, name='Front Bumper')
+        cls.bonnet = Part.objects.get(vehicle_model=cls.vehicle, name='Bonnet')
+        Part.objects.filter(pk=cls.bonnet.pk).update(part_number='BN-1')
+        cls.staff = User.objects.create_superuser('staff', 'staff@example.com', 'password')
+
+    def _write_csv(self, text):
+        f = tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False)
+        f.write(text)
+        f.close()
+        self.addCleanup(os.unlink, f.name)
+        return f.name
+
+    def _quantity(self, part):
+        return PartStock.objects.get(part=part).quantity
+
+    def test_dry_run_then_apply(self):
+        path = self._write_csv(
+            'vehicle_slug,part_slug,part_number,quantity\n'
+            f'honda-city,{self.bumper.slug},,4\n'
+            'honda-city,,BN-1,2\n'
+        )
+        out = StringIO()
+        call_command('import_inventory', path, '--dry-run', stdout=out)
+        self.assertIn('quantity 0 -> 4', out.getvalue())
+        self.assertEqual(self._quantity(self.bumper), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_inventory', path, stdout=StringIO())
+        self.assertEqual(self._quantity(self.bumper), 4)
+        self.assertEqual(self._quantity(self.bonnet), 2)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.available_parts_count, 2)
+
+    def test_invalid_rows_block_the_import(self):
+        path = self._write_csv(
+            'vehicle_slug,part_slug,quantity\n'
+            f'honda-city,{self.bumper.slug},3\n'
+            'honda-city,no-such-part,1\n'
+            f'honda-city,{self.bonnet.slug},-1\n'
+        )
+        err = StringIO()
+        with self.assertRaises(CommandError):
+            call_command('import_inventory', path, stdout=StringIO(), stderr=err)
+        self.assertIn('line 3', err.getvalue())
+        self.assertIn('line 4', err.getvalue())
+        self.assertEqual(self._quantity(self.bumper), 0)
+
+        call_command('import_inventory', path, '--skip-invalid', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(self._quantity(self.bumper), 3)
+
+    def test_stock_changed_after_reading_is_not_overwritten(self):
+        PartStock.objects.filter(part=self.bonnet).delete()
+        report = read_inventory([
+            'vehicle_slug,part_slug,quantity',
+            f'honda-city,{self.bumper.slug},4',
+            f'honda-city,{self.bonnet.slug},2',
+        ])
+        self.assertEqual((len(report.updated), len(report.created)), (1, 1))
+
+        # Someone else restocks both parts before the import writes
+        PartStock.objects.filter(part=self.bumper).update(quantity=7)
+        PartStock.objects.create(part=self.bonnet, quantity=1)
+        conflicts = apply_changes(report.changes)
+        self.assertEqual(sorted(change.line for change in conflicts), [2, 3])
+        self.assertEqual((self._quantity(self.bumper), self._quantity(self.bonnet)), (7, 1))
+
+    def test_conflicts_are_reported(self):
+        path = self._write_csv(f'vehicle_slug,part_slug,quantity\nhonda-city,{self.bumper.slug},4\n')
+        real_apply = apply_changes
+
+        def apply_after_someone_else(changes, batch_size):
+            PartStock.objects.filter(part=self.bumper).update(quantity=9)
+            return real_apply(changes, batch_size)
+
+        out, err = StringIO(), StringIO()
+        with mock.patch('myapp.inventory_import.apply_changes', apply_after_someone_else):
+            call_command('import_inventory', path, stdout=out, stderr=err)
+        self.assertIn('stock changed since the file was read', err.getvalue())
+        self.assertIn('applied 0 update(s)', out.getvalue())
+        self.assertIn('1 changed by someone else meanwhile', out.getvalue())
+        self.assertEqual(self._quantity(self.bumper), 9)
+
+    def test_admin_upload(self):
+        self.client.force_login(self.staff)
+        url = reverse('admin:myapp_part_import_inventory')
+        upload = lambda: SimpleUploadedFile(
+            'intake.csv', f'vehicle_slug,part_slug,quantity\nhonda-city,{self.bumper.slug},5\n'.encode()
+        )
+
+        response = self.client.post(url, {'file': upload(), 'dry_run': 'on'})
+        self.assertContains(response, 'quantity 0 -&gt; 5')
+        self.assertEqual(self._quantity(self.bumper), 0)
+
+        response = self.client.post(url, {'file': upload()})
+        self.assertContains(response, 'Inventory imported')
+        self.assertEqual(self._quantity(self.bumper), 5)
+
+
+class FixStockTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.vehicle = create_vehicle()
+        parts = Part.objects.filter(vehicle_model=cls.vehicle)
+        cls.no_stock = parts.get(name='Bonnet')
+        PartStock.objects.filter(part=cls.no_stock).delete()
+        parts.filter(name='Engine').delete()
+        cls.inactive = parts.get(name='Radiator')
+        Part.objects.filter(pk=cls.inactive.pk).update(is_active=False)
+        PartStock.objects.filter(part=cls.inactive).update(quantity=2)
+        VehicleModel.objects.filter(pk=cls.vehicle.pk).update(total_parts_count=0)
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command('fix_stock', '--format=json', '--chunk-size=2', *args, stdout=out)
+        return json.loads(out.getvalue())['checks']
+
+    def test_dry_run_reports_without_changing(self):
+        checks = self._run('--dry-run')
+        self.assertEqual(checks['parts_without_stock']['sample'], [self.no_stock.pk])
+        self.assertEqual(checks['stock_on_inactive_parts']['found'], 1)
+        self.assertEqual(checks['vehicles_missing_default_parts']['sample'], [self.vehicle.pk])
+        self.assertEqual(checks['stale_vehicle_counters']['found'], 1)
+        self.assertEqual(checks['orphaned_stock']['found'], 0)
+        self.assertFalse(PartStock.objects.filter(part=self.no_stock).exists())
+
+    def test_repairs_in_chunks(self):
+        checks = self._run()
+        self.assertEqual(checks['parts_without_stock']['fixed'], 1)
+        self.assertEqual(checks['vehicles_missing_default_parts']['fixed'], 1)
+        # Not repaired automatically
+        self.assertEqual(checks['stock_on_inactive_parts']['fixed'], 0)
+
+        self.assertTrue(PartStock.objects.filter(part=self.no_stock, quantity=0).exists())
+        self.assertEqual(Part.objects.filter(vehicle_model=self.vehicle, name='Engine').count(), 1)
+        self.vehicle.refresh_from_db()
+        self.assertEqual(self.vehicle.total_parts_count, Part.objects.filter(vehicle_model=self.vehicle).count())
+        self.assertEqual(
+            {name: result['found'] for name, result in self._run('--dry-run').items() if result['found']},
+            {'stock_on_inactive_parts': 1},
+        )
 
-# Create your tests here.
@@ -1,17 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'myapp'
 
+# ASGI deployments serve the catalog pages from the async views
+catalog = async_views if settings.ASYNC_CATALOG_VIEWS else views
+
 urlpatterns = [
     # Frontend URLs
-    path('', views.home, name='home'),
-    path('vehicles/', views.vehicle_list, name='vehicle_list'),
-    path('vehicles/<slug:vehicle_slug>/', views.parts_list, name='parts_list'),
-    path('vehicles/<slug:vehicle_slug>/<slug:part_slug>/', views.part_detail, name='part_detail'),
-    path('search/', views.search, name='search'),
+    path('', catalog.home, name='home'),
+    path('vehicles/', catalog.vehicle_list, name='vehicle_list'),
+    path('vehicles/<slug:vehicle_slug>/', catalog.parts_list, name='parts_list'),
+    path('vehicles/<slug:vehicle_slug>/<slug:part_slug>/', catalog.part_detail, name='part_detail'),
+    path('search/', catalog.search, name='search'),
+    path('search/autocomplete/', views.autocomplete, name='autocomplete'),
+    path('parts/<int:part_id>/activity/', views.part_activity, name='part_activity'),
     
     # Admin AJAX endpoints for stock management
+    path('admin-api/stock/adjust/', views.adjust_stock_batch, name='adjust_stock_batch'),
     path('admin-api/stock/<int:stock_id>/increase/', views.increase_stock, name='increase_stock'),
     path('admin-api/stock/<int:stock_id>/decrease/', views.decrease_stock, name='decrease_stock'),
+    path('admin-api/export/', views.export_inventory, name='export_inventory'),
+    
+    # Monitoring (staff only)
+    path('metrics', views.metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -1,15 +1,107 @@
+import hashlib
+import json
+import logging
+
 from django.shortcuts import render, get_object_or_404
-from django.db.models import Count, Q, Prefetch, Exists, OuterRef
-from django.http import JsonResponse
+from django.db.models import Count, Q, Prefetch, Exists, OuterRef, Sum, Max
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.http import quote_etag
+from django.conf import settings
 from django.contrib.admin.views.decorators import staff_member_required
-from django.views.decorators.http import require_POST
+from django.core.exceptions import PermissionDenied
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition, require_GET, require_POST
+from .activity import record_activity
+from .inventory import MAX_STOCK_DELTA, StockAdjustmentError, apply_stock_adjustments, stock_snapshot
+from .metrics import render_metrics
+from .db_router import pin_to_primary, replica_reads
+from .facets import category_facets, category_total, vehicle_facets, vehicle_filter_counts
 from .models import VehicleModel, Part, PartStock
+from .page_cache import cache_catalog_page
+from .pagination import PAGE_SIZE, decode_cursor, encode_cursor, paginate_queryset, wants_fragment
+from .search import MIN_QUERY_LENGTH, SEARCH_CURSOR, count_matches, load_parts, search_part_ids
+from . import autocomplete as autocomplete_index
+from . import export
+from . import related
+
+logger = logging.getLogger(__name__)
+
+
+# Keyset order for parts listings; id makes the key unique
+PART_ORDERING = ('category', 'name', 'id')
+
+
+def _next_page_url(request, next_cursor):
+    """Current query string with the cursor swapped for the next page"""
+    if not next_cursor:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = next_cursor
+    params.pop('format', None)
+    return f"?{params.urlencode()}"
+
+
+def _fragment_response(request, template_name, context, next_cursor):
+    """JSON "load more" payload: rendered cards plus the next page URL"""
+    return JsonResponse({
+        'html': render_to_string(template_name, context, request=request),
+        'next_cursor': next_cursor,
+        'next_url': _next_page_url(request, next_cursor),
+    })
 
 
+def _vehicle_catalog_state(request, vehicle_slug):
+    """
+    (last_modified, part_count) for everything a vehicle's pages show:
+    the vehicle, its parts and their stock. One aggregate query,
+    memoized on the request because condition() asks twice.
+    """
+    cache_attr = f'_catalog_state_{vehicle_slug}'
+    if not hasattr(request, cache_attr):
+        state = VehicleModel.objects.filter(slug=vehicle_slug, is_active=True).aggregate(
+            vehicle_updated=Max('updated_at'),
+            part_updated=Max('parts__updated_at'),
+            stock_updated=Max('parts__stock__updated_at'),
+            part_count=Count('parts'),
+        )
+        timestamps = [
+            state[field] for field in ('vehicle_updated', 'part_updated', 'stock_updated')
+            if state[field] is not None
+        ]
+        result = (max(timestamps), state['part_count']) if timestamps else (None, 0)
+        setattr(request, cache_attr, result)
+    return getattr(request, cache_attr)
+
+
+def catalog_last_modified(request, vehicle_slug, **kwargs):
+    return _vehicle_catalog_state(request, vehicle_slug)[0]
+
+
+def catalog_etag(request, vehicle_slug, **kwargs):
+    last_modified, part_count = _vehicle_catalog_state(request, vehicle_slug)
+    if last_modified is None:
+        return None
+    # Part count catches deletions, which do not move any timestamp;
+    # the "load more" JSON shares the page URL
+    raw = f"{request.get_full_path()}|{wants_fragment(request)}|{last_modified.isoformat()}|{part_count}"
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+@replica_reads
+@cache_catalog_page
 def home(request):
     """Home page with quick stats"""
-    total_vehicles = VehicleModel.objects.filter(is_active=True).count()
-    total_parts_in_stock = PartStock.objects.filter(quantity__gt=0).count()
+    # Plain column reads: available_parts_count is maintained by signals
+    stats = VehicleModel.objects.filter(is_active=True).aggregate(
+        total_vehicles=Count('id'),
+        total_parts_in_stock=Sum('available_parts_count'),
+    )
+    total_vehicles = stats['total_vehicles']
+    total_parts_in_stock = stats['total_parts_in_stock'] or 0
     
     context = {
         'total_vehicles': total_vehicles,
@@ -18,17 +110,15 @@ def home(request):
     return render(request, 'myapp/home.html', context)
 
 
+@replica_reads
+@cache_catalog_page
 def vehicle_list(request):
     """Display all active vehicle models with available parts count"""
     vehicle_type = request.GET.get('type', '')
     manufacturer = request.GET.get('manufacturer', '')
     
-    vehicles = VehicleModel.objects.filter(is_active=True).annotate(
-        available_parts_count=Count(
-            'parts',
-            filter=Q(parts__is_active=True, parts__stock__quantity__gt=0)
-        )
-    )
+    # available_parts_count is a denormalized column (see myapp/inventory.py)
+    vehicles = VehicleModel.objects.filter(is_active=True)
     
     # Apply filters
     if vehicle_type:
@@ -36,25 +126,29 @@ def vehicle_list(request):
     if manufacturer:
         vehicles = vehicles.filter(manufacturer__icontains=manufacturer)
     
-    # Get unique manufacturers for filter
-    manufacturers = VehicleModel.objects.filter(is_active=True).values_list(
-        'manufacturer', flat=True
-    ).distinct().order_by('manufacturer')
+    # Filter option counts: one cached GROUP BY (see myapp/facets.py)
+    counts = vehicle_filter_counts(vehicle_facets(), vehicle_type, manufacturer)
     
     context = {
         'vehicles': vehicles,
-        'manufacturers': manufacturers,
+        'vehicle_count': counts['total'],
+        'type_counts': counts['types'],
+        'manufacturers': counts['manufacturers'],
         'selected_type': vehicle_type,
         'selected_manufacturer': manufacturer,
     }
     return render(request, 'myapp/vehicles.html', context)
 
 
+@replica_reads
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+@cache_catalog_page
 def parts_list(request, vehicle_slug):
     """Display all available parts for a specific vehicle model"""
     vehicle = get_object_or_404(VehicleModel, slug=vehicle_slug, is_active=True)
     
     category = request.GET.get('category', '')
+    cursor = request.GET.get('cursor')
     
     # Only show parts that are active and have stock > 0
     # CRITICAL: Use select_related to avoid N+1 queries
@@ -62,27 +156,38 @@ def parts_list(request, vehicle_slug):
         vehicle_model=vehicle,
         is_active=True,
         stock__quantity__gt=0
-    ).select_related('stock', 'vehicle_model').order_by('category', 'name')
+    ).select_related('stock', 'vehicle_model')
     
     if category:
         parts = parts.filter(category__icontains=category)
     
-    # Get unique categories for this vehicle (only for parts with stock)
-    categories = Part.objects.filter(
-        vehicle_model=vehicle,
-        is_active=True,
-        stock__quantity__gt=0
-    ).values_list('category', flat=True).distinct().order_by('category')
+    page, next_cursor = paginate_queryset(parts, PART_ORDERING, cursor)
+    
+    if wants_fragment(request):
+        return _fragment_response(request, 'myapp/_part_cards.html', {
+            'vehicle': vehicle,
+            'parts': page,
+        }, next_cursor)
+    
+    # Per-category counts from one cached GROUP BY (see myapp/facets.py)
+    categories = category_facets(vehicle.pk)
+    total_count = category_total(categories, category)
     
     context = {
         'vehicle': vehicle,
-        'parts': parts,
+        'parts': page,
+        'total_count': total_count,
+        'all_count': category_total(categories),
         'categories': categories,
         'selected_category': category,
+        'next_url': _next_page_url(request, next_cursor),
     }
     return render(request, 'myapp/parts.html', context)
 
 
+@replica_reads
+@condition(etag_func=catalog_etag, last_modified_func=catalog_last_modified)
+@cache_catalog_page
 def part_detail(request, vehicle_slug, part_slug):
     """Display detailed information about a specific part"""
     vehicle = get_object_or_404(VehicleModel, slug=vehicle_slug, is_active=True)
@@ -99,8 +204,9 @@ def part_detail(request, vehicle_slug, part_slug):
     stock_available = part.is_in_stock()
     stock_quantity = part.get_stock_quantity()
     
-    # Debug logging (remove in production)
-    print(f"DEBUG: Part={part.name}, Stock Available={stock_available}, Quantity={stock_quantity}")
+    logger.debug(
+        "part_detail stock", extra={'part_id': part.pk, 'available': stock_available, 'quantity': stock_quantity}
+    )
     
     # If no stock, show out of stock page
     if not stock_available:
@@ -111,13 +217,8 @@ def part_detail(request, vehicle_slug, part_slug):
         }
         return render(request, 'myapp/part_not_available.html', context)
     
-    # Get related parts from the same category (with stock)
-    related_parts = Part.objects.filter(
-        vehicle_model=vehicle,
-        category=part.category,
-        is_active=True,
-        stock__quantity__gt=0
-    ).exclude(id=part.id).select_related('stock', 'vehicle_model')[:4]
+    # Precomputed, popularity-ranked recommendations (one indexed lookup)
+    related_parts = related.related_parts(part)
     
     context = {
         'vehicle': vehicle,
@@ -128,73 +229,182 @@ def part_detail(request, vehicle_slug, part_slug):
     return render(request, 'myapp/part_detail.html', context)
 
 
+@replica_reads
 def search(request):
     """Search for parts across all vehicles"""
     query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
     results = []
+    result_count = 0
+    next_cursor = None
     
-    if query and len(query) >= 3:
-        # Search in part names, categories, and vehicle models
-        # CRITICAL: Use select_related to avoid N+1 queries
-        results = Part.objects.filter(
-            Q(name__icontains=query) |
-            Q(category__icontains=query) |
-            Q(part_number__icontains=query) |
-            Q(vehicle_model__name__icontains=query) |
-            Q(vehicle_model__manufacturer__icontains=query),
-            is_active=True,
-            stock__quantity__gt=0
-        ).select_related('vehicle_model', 'stock').distinct()[:50]
+    if query and len(query) >= MIN_QUERY_LENGTH:
+        # Ranked lookup against the full-text index (see myapp/search.py).
+        # Cursor = (score, id, corrected) of the last hit shown.
+        after = decode_cursor(cursor, SEARCH_CURSOR)
+        if after:
+            hits = search_part_ids(query, PAGE_SIZE + 1, after=after[:2], corrected=bool(after[2]))
+        else:
+            hits = search_part_ids(query, PAGE_SIZE + 1)
+        
+        rows = hits.rows[:PAGE_SIZE]
+        if len(hits.rows) > PAGE_SIZE:
+            last_id, last_score = rows[-1]
+            next_cursor = encode_cursor([last_score, last_id, hits.corrected])
+        results = load_parts([part_id for part_id, _ in rows])
+        
+        if wants_fragment(request):
+            return _fragment_response(request, 'myapp/_search_result_cards.html', {
+                'results': results,
+            }, next_cursor)
+        
+        if after or next_cursor:
+            result_count = count_matches(query, hits.corrected)
+        else:
+            result_count = len(results)
     
     context = {
         'query': query,
         'results': results,
+        'result_count': result_count,
+        'next_url': _next_page_url(request, next_cursor),
     }
     return render(request, 'myapp/search.html', context)
 
 
+@require_GET
+def autocomplete(request):
+    """JSON suggestions for the search box (served from memory, no DB hit)"""
+    query = request.GET.get('q', '').strip()
+    suggestions = autocomplete_index.suggest(query) if query else []
+    response = JsonResponse({'query': query, 'suggestions': suggestions})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+
+# Beacon "kind" -> PartActivity counter
+ACTIVITY_KINDS = {'view': 'views', 'inquiry': 'inquiries'}
+
+
+@csrf_exempt
+@require_POST
+def part_activity(request, part_id):
+    """
+    navigator.sendBeacon target of the part page: counts a view or a
+    WhatsApp inquiry for the popularity ranking. Sent by the browser, so
+    it also counts pages served from the page cache. No session, no
+    cookies to check: a forged count only nudges a recommendation.
+    """
+    kind = ACTIVITY_KINDS.get(request.POST.get('kind'))
+    if kind is None:
+        return JsonResponse({'success': False, 'error': 'kind must be "view" or "inquiry"'}, status=400)
+    record_activity(part_id, kind)
+    return HttpResponse(status=204)
+
+
 # AJAX endpoints for stock management
 @staff_member_required
 @require_POST
-def increase_stock(request, stock_id):
-    """AJAX view to increase stock by 1"""
+def adjust_stock_batch(request):
+    """
+    Apply several stock changes in one transaction.
+    Body: {"adjustments": [{"stock_id": 1, "delta": 2}, ...]}
+    """
     try:
-        stock = get_object_or_404(PartStock, pk=stock_id)
-        stock.quantity += 1
-        stock.save()
+        payload = json.loads(request.body or b'{}')
+        adjustments = [
+            (int(item['stock_id']), int(item['delta']))
+            for item in payload['adjustments']
+        ]
+        if any(abs(delta) > MAX_STOCK_DELTA for _, delta in adjustments):
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
         return JsonResponse({
-            'success': True,
-            'new_quantity': stock.quantity,
-            'message': f'Increased stock for {stock.part.name}'
-        })
-    except Exception as e:
+            'success': False,
+            'error': 'Expected {"adjustments": [{"stock_id": int, "delta": int}, ...]} '
+                     f'with each delta within ±{MAX_STOCK_DELTA}'
+        }, status=400)
+    
+    try:
+        updates = apply_stock_adjustments(adjustments)
+    except StockAdjustmentError as e:
+        # Send back current values so the client can resync its display
+        return JsonResponse({
+            'success': False,
+            'error': str(e),
+            'stock_ids': e.stock_ids,
+            'updates': stock_snapshot([stock_id for stock_id, _ in adjustments]),
+        }, status=409)
+    
+    return pin_to_primary(JsonResponse({
+        'success': True,
+        'updates': updates,
+    }))
+
+
+def _adjust_single_stock(stock_id, delta, verb):
+    """Shared body of the one-click increase/decrease endpoints"""
+    stock = get_object_or_404(PartStock.objects.select_related('part'), pk=stock_id)
+    try:
+        updates = apply_stock_adjustments([(stock.pk, delta)])
+    except StockAdjustmentError:
         return JsonResponse({
             'success': False,
-            'error': str(e)
+            'error': 'Stock is already 0'
         }, status=400)
+    return pin_to_primary(JsonResponse({
+        'success': True,
+        'new_quantity': updates[0]['quantity'],
+        'message': f'{verb} stock for {stock.part.name}'
+    }))
+
+
+@staff_member_required
+@require_POST
+def increase_stock(request, stock_id):
+    """AJAX view to increase stock by 1"""
+    return _adjust_single_stock(stock_id, 1, 'Increased')
 
 
 @staff_member_required
 @require_POST
 def decrease_stock(request, stock_id):
     """AJAX view to decrease stock by 1"""
-    try:
-        stock = get_object_or_404(PartStock, pk=stock_id)
-        if stock.quantity > 0:
-            stock.quantity -= 1
-            stock.save()
-            return JsonResponse({
-                'success': True,
-                'new_quantity': stock.quantity,
-                'message': f'Decreased stock for {stock.part.name}'
-            })
-        else:
-            return JsonResponse({
-                'success': False,
-                'error': 'Stock is already 0'
-            }, status=400)
-    except Exception as e:
+    return _adjust_single_stock(stock_id, -1, 'Decreased')
+
+
+@staff_member_required
+@require_GET
+def export_inventory(request):
+    """
+    Every part with its vehicle and stock quantity, streamed as CSV
+    (default) or NDJSON (?format=ndjson).
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in export.FORMATS:
         return JsonResponse({
             'success': False,
-            'error': str(e)
-        }, status=400)
\ No newline at end of file
+            'error': f"format must be one of: {', '.join(export.FORMATS)}"
+        }, status=400)
+    chunks = export.export_inventory(fmt)
+    if isinstance(request, ASGIRequest):
+        chunks = export.stream_async(chunks)
+    response = StreamingHttpResponse(chunks, content_type=export.CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="inventory-{timezone.localdate()}.{fmt}"'
+    return response
+
+
+# -----------------------------
+# Monitoring
+# -----------------------------
+@require_GET
+def metrics(request):
+    """
+    Prometheus metrics summed over all worker processes.
+    Staff only; a scraper can send "Authorization: Bearer <METRICS_TOKEN>".
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scraper = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not (scraper or (request.user.is_active and request.user.is_staff)):
+        raise PermissionDenied
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
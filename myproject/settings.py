@@ -6,6 +6,7 @@ Production configuration for Render with PostgreSQL and WhiteNoise.
 from pathlib import Path
 import os
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 # --------------------------------------------------
 # BASE DIRECTORY
@@ -48,7 +49,10 @@ INSTALLED_APPS = [
 # --------------------------------------------------
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # WhiteNoise with an async path, so ASGI requests stay on the event loop
+    'myapp.middleware.WhiteNoiseMiddleware',
+    # After WhiteNoise: static files are not worth a metrics series
+    'myapp.metrics.MetricsMiddleware',
 
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -71,7 +75,8 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # --------------------------------------------------
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for /metrics
+        'BACKEND': 'myapp.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,14 +96,125 @@ TEMPLATES = [
 # --------------------------------------------------
 # DATABASE (POSTGRESQL - RENDER)
 # --------------------------------------------------
+def _requires_ssl(url):
+    # SSL is for network databases; sqlite:// files are for local runs
+    return not (url or "").startswith("sqlite")
+
+
 DATABASES = {
     'default': dj_database_url.config(
         default=os.environ.get("DATABASE_URL"),
         conn_max_age=600,
-        ssl_require=True
+        ssl_require=_requires_ssl(os.environ.get("DATABASE_URL"))
     )
 }
 
+# Read replicas for the public catalog pages (myapp/db_router.py):
+#   DATABASE_REPLICA_URLS=postgres://replica-1/...,postgres://replica-2/...
+# become the aliases replica1, replica2, ... Try it locally with two
+# SQLite files (copy primary.db to replica.db after migrating):
+#   DATABASE_URL=sqlite:///primary.db DATABASE_REPLICA_URLS=sqlite:///replica.db
+DATABASE_REPLICAS = []
+for _index, _url in enumerate(filter(None, os.environ.get("DATABASE_REPLICA_URLS", "").split(",")), 1):
+    _url = _url.strip()
+    DATABASES[f'replica{_index}'] = dict(
+        dj_database_url.parse(_url, conn_max_age=600, ssl_require=_requires_ssl(_url)),
+        # Tests read the test database through the replica aliases
+        TEST={'MIRROR': 'default'},
+    )
+    DATABASE_REPLICAS.append(f'replica{_index}')
+
+DATABASE_ROUTERS = ['myapp.db_router.ReplicaRouter']
+
+# Seconds to read from the primary after a stock change; keep it above
+# the replicas' usual lag
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", 5))
+
+
+# --------------------------------------------------
+# ASGI
+# --------------------------------------------------
+# When serving myproject.asgi:application, e.g.
+#   gunicorn myproject.asgi:application -k uvicorn.workers.UvicornWorker
+# set ASYNC_CATALOG_VIEWS=True: urls.py then routes the catalog pages to
+# myapp/async_views.py. Compare with "manage.py load_test".
+ASYNC_CATALOG_VIEWS = os.environ.get("ASYNC_CATALOG_VIEWS", "False") == "True"
+# Let the async views run independent queries on separate connections.
+# Off by default: with CONN_MAX_AGE=0 below, each parallel query opens
+# and closes a connection of its own, which costs more than the short
+# catalog queries it overlaps unless connections are pooled (pgbouncer).
+# "manage.py load_test", 4 workers on 1 CPU, seeded catalog on SQLite, 32 clients:
+# sync 7.6 req/s, async 7.2 req/s, async + parallel queries 6.8 req/s
+CATALOG_ASYNC_PARALLEL_QUERIES = os.environ.get("CATALOG_ASYNC_PARALLEL_QUERIES", "False") == "True"
+
+if ASYNC_CATALOG_VIEWS:
+    # Under ASGI every request gets a fresh thread, so persistent
+    # connections would leak; pool with pgbouncer instead
+    for _database in DATABASES.values():
+        _database['CONN_MAX_AGE'] = 0
+
+
+# --------------------------------------------------
+# CACHE
+# --------------------------------------------------
+# Local memory per process by default (dev). For several gunicorn
+# workers set CACHE_URL so they share one cache:
+#   CACHE_URL=redis://host:6379/1        (needs the redis package)
+#   CACHE_URL=file:///var/tmp/partsyaard-cache
+CACHE_URL = os.environ.get("CACHE_URL", "")
+
+if CACHE_URL.startswith(("redis://", "rediss://")):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL.startswith("file://"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_URL[len("file://"):],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'partsyaard',
+        }
+    }
+
+# Cache rendered catalog pages and facet counts (myapp/page_cache.py).
+# Their version counters must be seen by every worker, so this needs
+# CACHE_URL: with the per-process default a stock change would only
+# invalidate the copies of the worker that made it.
+CATALOG_PAGE_CACHE = os.environ.get("CATALOG_PAGE_CACHE", str(bool(CACHE_URL))) == "True"
+if CATALOG_PAGE_CACHE and not CACHE_URL:
+    raise ImproperlyConfigured("CATALOG_PAGE_CACHE needs a shared cache: set CACHE_URL")
+
+# Seconds a rendered catalog page may stay cached; stock changes
+# invalidate earlier through version counters (myapp/page_cache.py)
+CATALOG_PAGE_CACHE_TIMEOUT = int(os.environ.get("CATALOG_PAGE_CACHE_TIMEOUT", 60 * 60))
+
+# Part views / inquiries are buffered per process and written at most
+# this often (myapp/activity.py, feeds the related-parts ranking)
+ACTIVITY_FLUSH_INTERVAL = int(os.environ.get("ACTIVITY_FLUSH_INTERVAL", 30))
+
+# Re-rank related parts after a change on a background thread
+# (myapp/related.py); set RELATED_PARTS_ASYNC=False to do it inline
+RELATED_PARTS_ASYNC = os.environ.get("RELATED_PARTS_ASYNC", "True") == "True"
+
+
+# --------------------------------------------------
+# METRICS (/metrics, see myapp/metrics.py)
+# --------------------------------------------------
+# Worker processes write their snapshots here (default: <tmp>/myapp-metrics)
+METRICS_DIR = os.environ.get("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = int(os.environ.get("METRICS_FLUSH_INTERVAL", 10))
+# Lets a Prometheus scraper read /metrics without a staff login
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
 
 # --------------------------------------------------
 # PASSWORD VALIDATION
@@ -140,6 +256,11 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resized copies of uploads are built on a thread pool after commit
+# (myapp/images.py); set IMAGE_RENDITIONS_ASYNC=False to build inline
+IMAGE_RENDITIONS_ASYNC = os.environ.get("IMAGE_RENDITIONS_ASYNC", "True") == "True"
+IMAGE_RENDITION_WORKERS = int(os.environ.get("IMAGE_RENDITION_WORKERS", 2))
+
 
 # --------------------------------------------------
 # DEFAULT PRIMARY KEY
@@ -147,6 +268,41 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# --------------------------------------------------
+# LOGGING (see myapp/logs.py)
+# --------------------------------------------------
+# myapp logs JSON lines through a background queue. Signal handler
+# timing spans are DEBUG, so they are off unless LOG_LEVEL=DEBUG, and even
+# then only LOG_SPAN_SAMPLE_RATE of the handler calls are timed at all
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", 1.0))
+LOG_SPAN_SAMPLE_RATE = float(os.environ.get("LOG_SPAN_SAMPLE_RATE", 0.01))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'myapp.logs.SamplingFilter',
+            'rate': LOG_SAMPLE_RATE,
+        },
+    },
+    'handlers': {
+        'queue': {
+            '()': 'myapp.logs.QueueingHandler',
+            'filters': ['sampling'],
+        },
+    },
+    'loggers': {
+        'myapp': {
+            'handlers': ['queue'],
+            'level': LOG_LEVEL,
+            'propagate': False,
+        },
+    },
+}
+
+
 # --------------------------------------------------
 # CUSTOM SETTINGS
 # --------------------------------------------------